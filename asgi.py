@@ -0,0 +1,9 @@
+"""
+Asynchronous Server Gateway Interface (ASGI) entry point
+
+Serves the read endpoints of the promotions API; see service/async_api.py.
+"""
+
+from service.async_api import create_asgi_app
+
+app = create_asgi_app()
@@ -0,0 +1,85 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Name Search Benchmark
+
+Builds the in-process name index over synthetic promotion names and times
+autocomplete queries against it: prefixes, substrings and misspellings.
+Prints the build time and the median and p99 latency of each kind of
+query. Names are generated in memory; nothing is read from the database.
+
+Usage:
+    python -m benchmarks.bench_search --rows 1000000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from service.common.name_index import NameIndex
+
+WORDS = (
+    "summer winter spring autumn flash sale deal clearance bogo mega super holiday weekend "
+    "black friday cyber monday back school bundle discount"
+).split()
+
+QUERIES = {
+    "prefix": ["s", "su", "summ", "summer sa", "black fri", "cyber monday 12"],
+    "substring": ["umme", "riday", "learan", "onday 4"],
+    "misspelled": ["sumer sale", "clearence", "blak friday", "wintre deal"],
+}
+
+
+def make_rows(rows, seed=1):
+    """Returns `rows` synthetic (id, name) pairs"""
+    rnd = random.Random(seed)
+    return [
+        (n, " ".join(rnd.choice(WORDS).title() for _ in range(rnd.randint(1, 3))) + f" {rnd.randint(0, 99999)}")
+        for n in range(1, rows + 1)
+    ]
+
+
+def main():
+    """Runs the benchmark and prints query latencies"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    index = NameIndex()
+    rows = make_rows(args.rows)
+    start = time.perf_counter()
+    index.rebuild(rows)
+    print(f"built the index over {args.rows} names in {time.perf_counter() - start:.1f}s")
+
+    print(f"{'query':<12}{'median':>10}{'p99':>10}")
+    for kind, queries in QUERIES.items():
+        samples = []
+        for _ in range(args.repeat):
+            for query in queries:
+                started = time.perf_counter()
+                index.search(query, args.limit)
+                samples.append(time.perf_counter() - started)
+        samples.sort()
+        print(
+            f"{kind:<12}{statistics.median(samples) * 1000:>8.2f}ms"
+            f"{samples[int(len(samples) * 0.99)] * 1000:>8.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
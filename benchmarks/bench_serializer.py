@@ -0,0 +1,103 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Serializer Benchmark
+
+Times the per-row cost of turning Promotions into a JSON array: the old
+serialize() + marshal() + stdlib json path against the column tuple
+encoder, with and without orjson. Rows are built in memory; nothing is
+read from the database.
+
+Usage:
+    python -m benchmarks.bench_serializer --rows 100000
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import date, timedelta
+
+from flask_restx import marshal
+
+from wsgi import app
+from service.models import Promotion, PromoType
+from service.common.serializer import FIELDS, RowEncoder
+
+PROMO_TYPES = [promo_type.name for promo_type in PromoType]
+BASE_DATE = date(2025, 1, 1)
+
+
+def make_rows(rows):
+    """Returns `rows` synthetic Promotions as serial_columns() tuples"""
+    result = []
+    for n in range(1, rows + 1):
+        start = BASE_DATE + timedelta(days=n % 365)
+        result.append(
+            (n, f"promo-{n}", PROMO_TYPES[n % 3], 1 + n % 50_000, float(1 + n % 50),
+             start, start + timedelta(days=1 + n % 30), n % 4 != 0, 1)
+        )
+    return result
+
+
+def paths(rows):
+    """Returns the named serialization paths to time"""
+    # pylint: disable=import-outside-toplevel
+    from service.routes import promotion_model
+
+    promotions = [Promotion(**dict(zip(FIELDS + ("version",), row))) for row in rows]
+    stdlib = RowEncoder(use_orjson=False)
+    fast = RowEncoder()
+
+    def marshalled():
+        return json.dumps(marshal([p.serialize() for p in promotions], promotion_model)).encode("utf8")
+
+    named = {
+        "serialize+marshal+json": marshalled,
+        "row encoder (stdlib)": lambda: stdlib.encode_rows(rows),
+    }
+    if fast.use_orjson:
+        named["row encoder (orjson)"] = lambda: fast.encode_rows(rows)
+    return named
+
+
+def measure(func, repeat):
+    """Returns the median wall time of func() in seconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    """Runs the benchmark and prints the per-row cost of each path"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    with app.app_context():
+        named = paths(rows)
+        print(f"{'path':<26}{'total':>12}{'per row':>12}")
+        for name, func in named.items():
+            seconds = measure(func, args.repeat)
+            print(f"{name:<26}{seconds * 1000:>10.1f}ms{seconds / args.rows * 1e9:>10.0f}ns")
+
+
+if __name__ == "__main__":
+    main()
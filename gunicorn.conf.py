@@ -0,0 +1,145 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+"""
+Gunicorn configuration
+
+gunicorn reads this file from the working directory on startup, so
+`gunicorn wsgi:app` is all the Procfile, Dockerfile and k8s deployment
+need. Every setting can be overridden from the environment:
+
+    GUNICORN_WORKER_CLASS  sync (default), gthread or gevent
+    GUNICORN_WORKERS       worker processes, default 2 * CPUs + 1
+                           (CPUs + 1 for gevent, which multiplexes in-process)
+    GUNICORN_THREADS       threads per gthread worker, default 4
+    GUNICORN_CONNECTIONS   open connections per gthread worker, default 1000
+                           (100 for gevent, where each one is a concurrent request)
+    GUNICORN_PRELOAD       import the app once in the master, default true
+    GUNICORN_MAX_REQUESTS  recycle a worker after this many requests, default 1000
+    GUNICORN_KEEPALIVE     seconds to hold an idle keep-alive connection, default 5
+    GUNICORN_TIMEOUT       seconds before a silent worker is restarted, default 30
+
+CPUs are counted from the process's CPU affinity and its cgroup quota, so
+a pod limited to 2 CPUs on a 64-core node gets workers for 2, not 64.
+sync workers are the default because benchmarks/bench_workers.py measured
+them ahead of gthread on throughput and tail latency; the requests are
+short and CPU-bound, so threads only add GIL contention.
+
+Each worker keeps its Prometheus metrics in files under
+PROMETHEUS_MULTIPROC_DIR so that /metrics, served by any one worker, sums
+the values of all of them. The directory has to be set before the app (and
+prometheus_client) is imported, and emptied when gunicorn starts so stale
+values from an earlier run are not counted.
+"""
+import gc
+import math
+import os
+import shutil
+import tempfile
+
+
+def cpu_count():
+    """Returns the CPUs this process may use, honoring a cgroup v2 CPU quota"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max", encoding="utf8") as cpu_max:
+            quota, period = cpu_max.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def env_flag(name, default):
+    """Reads a true/false environment variable"""
+    return os.getenv(name, default).lower() == "true"
+
+
+######################################################################
+# Workers
+######################################################################
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+if worker_class == "gevent":
+    # patch the standard library before the app (and its database driver) is imported
+    from gevent import monkey  # pylint: disable=import-outside-toplevel
+
+    monkey.patch_all()
+
+default_workers = cpu_count() + 1 if worker_class == "gevent" else 2 * cpu_count() + 1
+workers = int(os.getenv("GUNICORN_WORKERS", str(default_workers)))
+threads = int(os.getenv("GUNICORN_THREADS", "4")) if worker_class == "gthread" else 1
+# open connections per worker; a gevent worker runs a request on each of them at once
+worker_connections = int(os.getenv("GUNICORN_CONNECTIONS", "100" if worker_class == "gevent" else "1000"))
+
+# import the app once in the master so workers share its memory copy-on-write
+preload_app = env_flag("GUNICORN_PRELOAD", "true")
+
+# recycle workers now and then, staggered so they do not all restart at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = max_requests // 10
+
+######################################################################
+# Connections
+######################################################################
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8080')}")
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = timeout
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+# worker heartbeats go to tmpfs rather than a possibly slow container disk
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None  # pylint: disable=invalid-name
+
+prometheus_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "promotions-metrics")
+)
+
+
+######################################################################
+# Server hooks
+######################################################################
+def on_starting(server):  # pylint: disable=unused-argument
+    """Empties the metrics directory before any worker starts"""
+    shutil.rmtree(prometheus_dir, ignore_errors=True)
+    os.makedirs(prometheus_dir, exist_ok=True)
+
+
+def pre_fork(server, worker):  # pylint: disable=unused-argument
+    """Moves the preloaded app out of the collector's reach so forked pages stay shared"""
+    gc.freeze()
+
+
+def post_fork(server, worker):  # pylint: disable=unused-argument
+    """Drops database connections inherited from the master"""
+    if server.cfg.preload_app:
+        # pylint: disable=import-outside-toplevel
+        from service.models import db
+
+        with server.app.wsgi().app_context():
+            db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):  # pylint: disable=unused-argument
+    """Starts the promotion status scheduler once the worker has its app"""
+    from service.common.status_scheduler import status_scheduler  # pylint: disable=import-outside-toplevel
+
+    status_scheduler.start()
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live gauges of a worker that has exited"""
+    from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+
+    multiprocess.mark_process_dead(worker.pid)
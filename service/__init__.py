@@ -18,11 +18,20 @@ Package for the application models and service routes
 This module creates and configures the Flask app and sets up the logging
 and SQL database
 """
-import sys
-from flask import Flask
-from flask_restx import Api
-from service import config
-from service.common import log_handlers
+import time
+
+_IMPORT_START = time.perf_counter()
+
+# pylint: disable=wrong-import-position
+import sys  # noqa: E402
+from flask import Flask  # noqa: E402
+from flask_restx import Api  # noqa: E402
+from service import config  # noqa: E402
+from service.common import db_pool, log_handlers, metrics, read_replica  # noqa: E402
+from service.common.startup_profile import StartupProfile  # noqa: E402
+
+# time spent importing Flask, flask-restx and the service's own modules
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
 
 
 ############################################################
@@ -30,44 +39,54 @@ from service.common import log_handlers
 ############################################################
 def create_app():
     """Initialize the core application."""
+    profile = StartupProfile()
+    profile.add("imports", _IMPORT_SECONDS)
+
     # Create Flask application
     app = Flask(__name__)
     app.config.from_object(config)
-
-    # Initialize Plugins
-    # pylint: disable=import-outside-toplevel
-    from service.models import db
-
-    db.init_app(app)
+    app.extensions["startup_profile"] = profile
+    metrics.init_app(app)
+    _init_components(app, profile)
 
     # Initialize Flask-RESTX after database initialization
-    api = Api(
-        app,
-        version="1.0",
-        title="Promotions REST API",
-        description="A REST API for managing promotional offers",
-        prefix="/api",
-        doc="/api/",
-    )
+    with profile.phase("api"):
+        api = Api(
+            app,
+            version="1.0",
+            title="Promotions REST API",
+            description="A REST API for managing promotional offers",
+            prefix="/api",
+            doc="/api/",
+        )
 
     # Store API in app extensions for later access
     app.extensions["promotions_api"] = api
 
     with app.app_context():
         # Dependencies require we import the routes AFTER the Flask app is created
-        # pylint: disable=wrong-import-position, wrong-import-order, unused-import
-        from service import models  # noqa: F401 E402
-        from service.common import error_handlers, cli_commands  # noqa: F401, E402
+        # pylint: disable=wrong-import-position, wrong-import-order, unused-import, import-outside-toplevel
+        with profile.phase("routes"):
+            from service.common import error_handlers, cli_commands  # noqa: F401, E402
 
-        # Import routes after API initialization to avoid circular imports
-        from service import routes  # noqa: F401, E402
+            # Import routes after API initialization to avoid circular imports
+            from service import routes  # noqa: F401, E402
 
-        try:
-            db.create_all()
-        except Exception as error:  # pylint: disable=broad-except
-            app.logger.critical("%s: Cannot continue", error)
-            # gunicorn requires exit code 4 to stop spawning workers when they die
-            sys.exit(4)
+        # The schema is created by `flask db-init`, not on every boot
+        if app.config["DB_SCHEMA_CHECK"]:
+            from service.models import db, Promotion  # pylint: disable=import-outside-toplevel
+
+            with profile.phase("database"):
+                try:
+                    schema_ready = Promotion.schema_ready()
+                except Exception as error:  # pylint: disable=broad-except
+                    app.logger.critical("%s: Cannot continue", error)
+                    # gunicorn requires exit code 4 to stop spawning workers when they die
+                    sys.exit(4)
+                finally:
+                    db.session.remove()
+            if not schema_ready:
+                app.logger.error("The promotion table is missing or out of date: run 'flask db-init'")
 
         # Set up logging for production
         log_handlers.init_logging(app, "gunicorn.error")
@@ -76,6 +95,28 @@ def create_app():
         app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
         app.logger.info(70 * "*")
 
+        if app.config["STARTUP_PROFILE"]:
+            app.logger.info(profile.report())
+
         app.logger.info("Service initialized!")
 
         return app
+
+
+def _init_components(app, profile):
+    """Initializes the database, its caches and indexes, and the other plugins"""
+    # pylint: disable=import-outside-toplevel
+    with profile.phase("imports"):
+        from service.models import db, active_index, name_index, promotion_cache, stats_cache
+        from service.common.serializer import encoder
+        from service.common.status_scheduler import status_scheduler
+
+    db_pool.init_app(app)
+    db.init_app(app)
+    read_replica.init_app(app, db)
+    active_index.init_app(app)
+    name_index.init_app(app)
+    promotion_cache.init_app(app)
+    stats_cache.init_app(app)
+    encoder.init_app(app)
+    status_scheduler.init_app(app)
@@ -0,0 +1,267 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Async Read API
+
+An ASGI application serving the read endpoints of the promotions API:
+
+    GET /api/promotions             filtered, sorted pages, ?id= and NDJSON streaming
+    GET /api/promotions/<id>        one promotion
+    GET /api/promotions/health      health check
+
+Queries run on async SQLAlchemy sessions over psycopg's asyncio driver, so
+a worker keeps many requests waiting on PostgreSQL at once instead of one
+per thread. They are built from the same Promotion columns and statements
+as the Flask routes and encoded by the same serializer, so bodies, ETags
+and page cursors match; a client can page through either one.
+
+With DATABASE_REPLICA_URI set, reads go to the replica, except for
+clients holding the sticky cookie the Flask app sets after a write.
+
+Writes stay on the Flask app in wsgi.py. This app does not use the
+in-process promotion cache: its workers never see those writes, so every
+read goes to the database, and a client holding the current ETag is
+answered from the ids and versions alone.
+"""
+import logging
+from contextlib import asynccontextmanager
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags, unquote_etag
+from service import config
+from service.common import cursors, status
+from service.common.list_query import parse_list_query
+from service.common.read_replica import is_sticky
+from service.common.serializer import encoder
+from service.models import DataValidationError, Promotion, db, make_etag, make_page_etag
+
+logger = logging.getLogger("promotions.async")
+
+NDJSON = "application/x-ndjson"
+
+
+def async_database_uri(uri):
+    """Returns a database URI that names an asyncio driver"""
+    url = make_url(uri)
+    if url.get_backend_name() == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    elif url.get_backend_name() == "postgresql":
+        url = url.set(drivername="postgresql+psycopg")
+    return url
+
+
+######################################################################
+# HELPER FUNCTIONS
+######################################################################
+def json_response(body, code=status.HTTP_200_OK, headers=None):
+    """Returns already-encoded JSON bytes as a response"""
+    return Response(body, code, headers=headers, media_type="application/json")
+
+
+def not_modified(request, etag):
+    """Returns a 304 response when the client's If-None-Match matches etag, else None"""
+    if_none_match = parse_etags(request.headers.get("if-none-match"))
+    if etag is not None and if_none_match.contains_weak(unquote_etag(etag)[0]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return None
+
+
+def wants_ndjson(request):
+    """Returns True when the client prefers newline-delimited JSON"""
+    accept = parse_accept_header(request.headers.get("accept"), MIMEAccept)
+    return accept.best_match(["application/json", NDJSON]) == NDJSON
+
+
+def get_page_size(request):
+    """Returns the requested page size, capped at PAGE_SIZE_MAX"""
+    try:
+        limit = int(request.query_params.get("limit", config.PAGE_SIZE_DEFAULT))
+    except ValueError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "limit must be an integer.") from error
+    if limit < 1:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "limit must be at least 1.")
+    return min(limit, config.PAGE_SIZE_MAX)
+
+
+def get_list_query(request):
+    """Returns the filters and sort key of the request"""
+    try:
+        return parse_list_query(request.query_params)
+    except ValueError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(error)) from error
+
+
+def get_cursor(request, sort):
+    """Returns the sort position of the previous page's last row from the cursor parameter"""
+    try:
+        after = cursors.decode_cursor(request.query_params.get("cursor"), sort)
+        return None if after is None else Promotion.parse_position(after, sort)
+    except (ValueError, DataValidationError) as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(error)) from error
+
+
+def next_page_headers(request, last_row, sort, limit):
+    """Builds the Link headers that point a client at the next page"""
+    cursor = cursors.encode_cursor(Promotion.sort_position(last_row, sort), sort)
+    next_url = request.url.include_query_params(cursor=cursor, limit=limit)
+    return {"Link": f'<{next_url}>; rel="next"', "X-Next-Cursor": cursor}
+
+
+def read_sessions(request):
+    """Returns the session factory to read with: the replica's, unless the client recently wrote"""
+    state = request.app.state
+    return state.sessions if is_sticky(request.cookies) else state.replica_sessions
+
+
+async def find_json(session, promotion_id):
+    """Returns the JSON body and ETag of a Promotion, or None if it was not found"""
+    stmt = db.select(*Promotion.serial_columns()).where(Promotion.id == promotion_id)
+    row = (await session.execute(stmt)).first()
+    if row is None:
+        return None
+    return encoder.encode_row(row), make_etag(row.id, row.version)
+
+
+async def stream_promotions(sessions, sort, filters):
+    """Yields every matching Promotion as NDJSON, STREAM_CHUNK_SIZE rows at a time"""
+    stmt = Promotion.page_statement(Promotion.serial_columns(), None, None, sort, **filters)
+    async with sessions() as session:
+        result = await session.stream(stmt.execution_options(yield_per=config.STREAM_CHUNK_SIZE))
+        async for chunk in result.partitions():
+            yield encoder.encode_lines(chunk)
+
+
+async def list_by_id(sessions, promotion_id):
+    """Answers ?id= with a list holding the one Promotion"""
+    try:
+        promotion_id = int(promotion_id)
+    except ValueError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "ID must be an integer.") from error
+    async with sessions() as session:
+        found = await find_json(session, promotion_id)
+    if found is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"Promotion with id '{promotion_id}' was not found.")
+    body, etag = found
+    return json_response(b"[" + body + b"]", headers={"ETag": etag})
+
+
+######################################################################
+# READ ENDPOINTS
+######################################################################
+async def list_promotions(request):
+    """Fetch a page of Promotions
+
+    The same filters, keyset pages, ETags and Link headers as the Flask
+    PromotionCollection.get(), including ?id= and NDJSON streaming.
+    """
+    sessions = read_sessions(request)
+    if request.query_params.get("id"):
+        return await list_by_id(sessions, request.query_params["id"])
+
+    filters, sort = get_list_query(request)
+    if wants_ndjson(request):
+        return StreamingResponse(stream_promotions(sessions, sort, filters), media_type=NDJSON)
+
+    limit = get_page_size(request)
+    after = get_cursor(request, sort)
+    async with sessions() as session:
+        # a client polling an unchanged page is answered from ids and versions alone
+        if "if-none-match" in request.headers:
+            stmt = Promotion.page_statement([Promotion.id, Promotion.version], limit + 1, after, sort, **filters)
+            response = not_modified(request, make_page_etag(await session.execute(stmt)))
+            if response:
+                return response
+        # fetch one extra row to learn whether there is a next page
+        stmt = Promotion.page_statement(Promotion.serial_columns(), limit + 1, after, sort, **filters)
+        rows = (await session.execute(stmt)).all()
+
+    headers = {"ETag": make_page_etag((row.id, row.version) for row in rows)}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers.update(next_page_headers(request, rows[-1], sort, limit))
+    return json_response(encoder.encode_rows(rows), headers=headers)
+
+
+async def get_promotion(request):
+    """Fetch a Promotion"""
+    promotion_id = request.path_params["promotion_id"]
+    async with read_sessions(request)() as session:
+        if "if-none-match" in request.headers:
+            stmt = db.select(Promotion.version).where(Promotion.id == promotion_id)
+            version = await session.scalar(stmt)
+            response = not_modified(request, make_etag(promotion_id, version) if version is not None else None)
+            if response:
+                return response
+        found = await find_json(session, promotion_id)
+    if found is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"Promotion with id '{promotion_id}' was not found.")
+    body, etag = found
+    return json_response(body, headers={"ETag": etag})
+
+
+async def health(request):  # pylint: disable=unused-argument
+    """Health check endpoint"""
+    return JSONResponse({"status": "OK"})
+
+
+async def http_error(request, error):  # pylint: disable=unused-argument
+    """Returns errors in the same {"message": ...} shape as flask-restx"""
+    return JSONResponse({"message": error.detail}, error.status_code)
+
+
+######################################################################
+# Initialize the ASGI application
+######################################################################
+def create_asgi_app(database_uri=None, replica_uri=None):
+    """Creates the async read API
+
+    Args:
+        database_uri (str): the database to read, defaults to DATABASE_URI
+        replica_uri (str): its read replica, defaults to DATABASE_REPLICA_URI
+    """
+    database_uri = database_uri or config.SQLALCHEMY_DATABASE_URI
+    replica_uri = replica_uri or config.DATABASE_REPLICA_URI
+
+    @asynccontextmanager
+    async def lifespan(app):
+        engines = [create_async_engine(async_database_uri(database_uri), **config.engine_options(database_uri))]
+        if replica_uri:
+            engines.append(create_async_engine(async_database_uri(replica_uri), **config.engine_options(replica_uri)))
+        app.state.sessions = async_sessionmaker(engines[0], expire_on_commit=False)
+        app.state.replica_sessions = async_sessionmaker(engines[-1], expire_on_commit=False)
+        for engine in engines:
+            logger.info("Async read API connected to %s", engine.url.render_as_string(hide_password=True))
+        try:
+            yield
+        finally:
+            for engine in engines:
+                await engine.dispose()
+
+    return Starlette(
+        routes=[
+            Route("/api/promotions", list_promotions, methods=["GET"]),
+            Route("/api/promotions/health", health, methods=["GET"]),
+            Route("/api/promotions/{promotion_id:int}", get_promotion, methods=["GET"]),
+        ],
+        exception_handlers={HTTPException: http_error},
+        lifespan=lifespan,
+    )
@@ -0,0 +1,292 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Active Promotion Index
+
+An in-process index that answers "which active promotions apply to
+product P on date D" without a database round trip.
+
+Active promotions are grouped by product_id. Each product holds its
+promotions in a list sorted by (start_date, end_date, id), so a lookup
+bisects to the last promotion that has started by D and keeps those that
+have not yet ended.
+
+For bulk lookups (cart pricing) each reload also lays the index out as
+NumPy columns sorted by product_id, so candidates for thousands of
+products are found with searchsorted and a date mask instead of a Python
+loop. Products written to since the reload are marked dirty and read from
+the per-product lists instead.
+
+The index is loaded lazily from the database and kept up to date by the
+Promotion model as it writes. Every worker process has its own copy and
+only sees its own writes, so the whole index is reloaded once it is older
+than ACTIVE_INDEX_MAX_AGE seconds to pick up changes made elsewhere. Like
+the name index, that reload runs on a thread while lookups go on using
+the current index, and writes made while it reads are applied again to
+the new index before it takes over.
+"""
+import threading
+import time
+from bisect import bisect_right, insort
+from collections import namedtuple
+from operator import attrgetter
+import numpy as np
+
+Entry = namedtuple("Entry", "start_date end_date id name promo_type amount")
+
+_start_date = attrgetter("start_date")
+
+
+class ActiveIndex:  # pylint: disable=too-many-instance-attributes
+    """Indexes active promotions by product_id and date range"""
+
+    def __init__(self, loader=None, max_age=60.0):
+        """
+        Args:
+            loader (callable): returns the active promotions as
+                (id, name, promo_type, product_id, amount, start_date, end_date) rows
+            max_age (float): seconds before the index is reloaded from the loader
+        """
+        self.loader = loader
+        self.max_age = max_age
+        self.enabled = True
+        self._app = None
+        self._lock = threading.RLock()
+        self._reloader = None
+        # loads in progress, and the changes made since the oldest started as (when, id, upsert values or None)
+        self._reading = 0
+        self._pending = []
+        self._products = {}
+        self._product_of = {}
+        self._columns = None
+        self._dirty = set()
+        self._loaded_at = None
+
+    def init_app(self, app):
+        """Reads the index settings from the Flask app config"""
+        self._app = app
+        self.enabled = app.config.get("ACTIVE_INDEX_ENABLED", True)
+        self.max_age = app.config.get("ACTIVE_INDEX_MAX_AGE", self.max_age)
+
+    def __len__(self):
+        return len(self._product_of)
+
+    ##################################################
+    # Loading
+    ##################################################
+
+    def invalidate(self):
+        """Drops the index so the next lookup reloads it"""
+        with self._lock:
+            self._loaded_at = None
+
+    def rebuild(self, rows=None):
+        """Replaces the index with rows, or with the loader's rows
+
+        Changes made while the rows are read may be missing from them, so
+        they are applied again to the new index before it is swapped in.
+        """
+        started = time.monotonic()
+        with self._lock:
+            self._reading += 1
+        loaded = None
+        try:
+            loaded = self._load(self.loader() if rows is None else rows)
+        finally:
+            with self._lock:
+                self._reading -= 1
+                if loaded is not None:
+                    self._products, self._product_of, self._columns = loaded
+                    self._dirty = set()
+                    for at, pid, values in self._pending:
+                        if at >= started:
+                            self._apply(pid, values)
+                    self._loaded_at = time.monotonic()
+                if not self._reading:
+                    self._pending = []
+
+    def _load(self, rows):
+        """Returns the per-product lists, the product of each id and the columns of rows"""
+        products = {}
+        product_of = {}
+        # dates and types repeat across rows, so share one object for each value
+        shared = {}
+        for pid, name, promo_type, product_id, amount, start_date, end_date in rows:
+            products.setdefault(product_id, []).append(
+                Entry(
+                    shared.setdefault(start_date, start_date),
+                    shared.setdefault(end_date, end_date),
+                    pid,
+                    name,
+                    shared.setdefault(promo_type, promo_type),
+                    amount,
+                )
+            )
+            product_of[pid] = product_id
+        for entries in products.values():
+            entries.sort()
+        return products, product_of, self._to_columns(products)
+
+    @staticmethod
+    def _to_columns(products):
+        """Lays the entries out as arrays sorted by product_id"""
+        product_ids = []
+        entries = []
+        for product_id in sorted(products):
+            product_entries = products[product_id]
+            product_ids.extend([product_id] * len(product_entries))
+            entries.extend(product_entries)
+        return (
+            np.array(product_ids, dtype=np.int64),
+            np.array([entry.start_date.toordinal() for entry in entries], dtype=np.int64),
+            np.array([entry.end_date.toordinal() for entry in entries], dtype=np.int64),
+            np.array([entry.promo_type for entry in entries], dtype=object),
+            np.array([entry.amount for entry in entries], dtype=np.float64),
+            np.array([entry.id for entry in entries], dtype=np.int64),
+        )
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            self.rebuild()
+        elif time.monotonic() - loaded_at > self.max_age:
+            self._reload_in_background()
+
+    def _reload_in_background(self):
+        """Reloads the index on a thread while lookups go on using the current one"""
+        if self._app is None:
+            self.rebuild()
+            return
+        with self._lock:
+            if self._reloader is not None and self._reloader.is_alive():
+                return
+            self._reloader = threading.Thread(target=self._reload, daemon=True)
+            self._reloader.start()
+
+    def _reload(self):
+        with self._app.app_context():
+            self.rebuild()
+
+    def wait(self):
+        """Waits for a background reload to finish"""
+        reloader = self._reloader
+        if reloader is not None:
+            reloader.join()
+
+    ##################################################
+    # Incremental updates
+    ##################################################
+
+    def upsert(self, pid, name, promo_type, product_id, amount, start_date, end_date, active):
+        """Adds or replaces one promotion, dropping it if it is not active"""
+        self._change(pid, (name, promo_type, product_id, amount, start_date, end_date, active))
+
+    def remove(self, pid):
+        """Removes one promotion from the index"""
+        self._change(pid, None)
+
+    def _change(self, pid, values):
+        """Applies an upsert's values, or a removal when values is None, and records it while a load runs"""
+        with self._lock:
+            if self._reading:
+                self._pending.append((time.monotonic(), pid, values))
+            if self._loaded_at is not None:
+                self._apply(pid, values)
+
+    def _apply(self, pid, values):
+        self._remove(pid)
+        if values is None:
+            return
+        name, promo_type, product_id, amount, start_date, end_date, active = values
+        if active:
+            insort(
+                self._products.setdefault(product_id, []),
+                Entry(start_date, end_date, pid, name, promo_type, amount),
+            )
+            self._product_of[pid] = product_id
+            self._dirty.add(product_id)
+
+    def _remove(self, pid):
+        product_id = self._product_of.pop(pid, None)
+        if product_id is None:
+            return
+        self._dirty.add(product_id)
+        entries = self._products[product_id]
+        entries[:] = [entry for entry in entries if entry.id != pid]
+        if not entries:
+            del self._products[product_id]
+
+    ##################################################
+    # Lookups
+    ##################################################
+
+    def lookup(self, product_id, on):
+        """Returns the Entries for product_id that are running on the date on"""
+        return [entry for _, entry in self.lookup_many([product_id], on)]
+
+    def lookup_many(self, product_ids, on):
+        """Returns (product_id, Entry) pairs for every product running on the date on"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._lookup_many(product_ids, on)
+
+    def _lookup_many(self, product_ids, on):
+        found = []
+        products = self._products
+        for product_id in product_ids:
+            entries = products.get(product_id)
+            if not entries:
+                continue
+            started = bisect_right(entries, on, key=_start_date)
+            found.extend((product_id, entry) for entry in entries[:started] if entry.end_date >= on)
+        return found
+
+    def lookup_columns(self, product_ids, on):
+        """Finds the promotions running on a date for many products at once
+
+        Args:
+            product_ids (ndarray): sorted, unique product ids
+            on (date): the date the promotions must be running on
+
+        Returns:
+            tuple: product_id, promo_type, amount and id arrays sorted by product_id
+        """
+        self._ensure_loaded()
+        with self._lock:
+            columns = self._columns
+            dirty = np.array(sorted(self._dirty.intersection(product_ids.tolist())), dtype=np.int64)
+            fresh = self._lookup_many(dirty.tolist(), on)
+        products, starts, ends, promo_types, amounts, ids = columns
+
+        # every snapshot row for the requested, clean products ...
+        first = np.searchsorted(products, product_ids, side="left")
+        counts = np.searchsorted(products, product_ids, side="right") - first
+        counts[np.isin(product_ids, dirty)] = 0
+        rows = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        # ... that are running on the date
+        day = on.toordinal()
+        rows = rows[(starts[rows] <= day) & (ends[rows] >= day)]
+
+        # dirty products come from the up-to-date per-product lists
+        found = (
+            np.concatenate([products[rows], np.array([pair[0] for pair in fresh], dtype=np.int64)]),
+            np.concatenate([promo_types[rows], np.array([pair[1].promo_type for pair in fresh], dtype=object)]),
+            np.concatenate([amounts[rows], np.array([pair[1].amount for pair in fresh], dtype=np.float64)]),
+            np.concatenate([ids[rows], np.array([pair[1].id for pair in fresh], dtype=np.int64)]),
+        )
+        order = np.argsort(found[0], kind="stable")
+        return tuple(column[order] for column in found)
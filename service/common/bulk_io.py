@@ -0,0 +1,236 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Bulk Import and Export
+
+Reads and writes Promotions as CSV or NDJSON for the
+`flask promotions-import` and `flask promotions-export` commands.
+
+Imported records are checked by Promotion.clean(), the rules
+deserialize() applies to the API, one chunk at a time, and handed to
+import_chunks() which COPYs them in on PostgreSQL. Ids in the
+file are ignored: every record becomes a new Promotion. Exports have the
+serialize() fields, one Promotion per CSV row or NDJSON line.
+"""
+import csv
+import io
+import json
+import logging
+import time
+from service.common.list_query import parse_status
+from service.common.serializer import FIELDS, encoder
+from service.models import (
+    DataValidationError, Promotion, active_index, db, name_index, next_change_seq, stats_cache,
+)
+
+logger = logging.getLogger("flask.app")
+
+FORMATS = ("csv", "ndjson")
+
+# PostgreSQL types of the FIELDS columns, to read them back from COPY ... TO STDOUT
+COPY_TYPES = ("int4", "text", "text", "int4", "float8", "date", "date", "bool")
+
+
+def guess_format(path):
+    """Returns csv for a .csv file and ndjson for anything else"""
+    return "csv" if str(path).lower().endswith(".csv") else "ndjson"
+
+
+def read_records(file, file_format):
+    """Yields the (line number, dictionary) of every record in a text file
+
+    CSV files need a header row naming the fields. A CSV status is true
+    or false; an empty one means the default, true.
+    """
+    return _csv_records(file) if file_format == "csv" else _ndjson_records(file)
+
+
+def _csv_records(file):
+    reader = csv.DictReader(file)
+    for record in reader:
+        status = record.pop("status", None)
+        if status:
+            try:
+                record["status"] = parse_status(status)
+            except ValueError as error:
+                raise DataValidationError(f"line {reader.line_num}: status must be true or false") from error
+        yield reader.line_num, record
+
+
+def _ndjson_records(file):
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            raise DataValidationError(f"line {number}: not a JSON object") from error
+        if not isinstance(record, dict):
+            raise DataValidationError(f"line {number}: not a JSON object")
+        yield number, record
+
+
+def validated_chunks(records, chunk_size):
+    """Yields the column values of records, checked by Promotion.clean(), chunk_size at a time
+
+    Raises:
+        DataValidationError: naming the line of the first invalid record
+    """
+    chunk = []
+    for number, record in records:
+        try:
+            chunk.append(Promotion.clean(record))
+        except DataValidationError as error:
+            raise DataValidationError(f"line {number}: {error}") from error
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_promotions(file, file_format, chunk_size, progress=None):
+    """Creates a Promotion for every record in a text file, all or none
+
+    Returns:
+        int: the number of Promotions created
+    """
+    return import_chunks(validated_chunks(read_records(file, file_format), chunk_size), progress)
+
+
+def export_promotions(file, file_format, chunk_size, progress=None):
+    """Writes every Promotion to a binary file
+
+    Returns:
+        int: the number of Promotions written
+    """
+    total = 0
+    if file_format == "csv":
+        file.write((",".join(FIELDS) + "\n").encode("utf8"))
+    for chunk in export_chunks(chunk_size):
+        if file_format == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerows(
+                (*row[:7], "true" if row[7] else "false") for row in chunk
+            )
+            file.write(buffer.getvalue().encode("utf8"))
+        else:
+            file.write(encoder.encode_lines(chunk))
+        total += len(chunk)
+        if progress:
+            progress(total)
+    return total
+
+
+def copy_connection():
+    """Returns the psycopg connection under the session's with no statement timeout, or None without COPY"""
+    connection = db.session.connection()
+    if connection.dialect.name != "postgresql" or connection.dialect.driver != "psycopg":
+        return None
+    # a COPY of the whole table outlasts DB_STATEMENT_TIMEOUT; this lasts until the transaction ends
+    connection.exec_driver_sql("SET LOCAL statement_timeout = 0")
+    return connection.connection.driver_connection
+
+
+def import_chunks(chunks, progress=None):
+    """Inserts chunks of clean() dicts in one transaction, all or none, and returns the number of rows
+
+    Every row gets the same change sequence number, so the change feed
+    reports nothing written after the import began until it commits.
+    """
+    logger.info("Importing Promotions ...")
+    total = 0
+    try:
+        seq = next_change_seq()
+        for rows in chunks:
+            _insert_chunk(rows, seq)
+            total += len(rows)
+            if progress:
+                progress(total)
+        db.session.commit()
+    except DataValidationError:
+        db.session.rollback()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        logger.error("Error importing Promotions after %d rows", total)
+        raise DataValidationError(e) from e
+    stats_cache.invalidate_all()
+    active_index.invalidate()
+    name_index.invalidate()
+    return total
+
+
+def _insert_chunk(rows, seq):
+    """Inserts clean() dicts changed at seq without committing, by COPY on PostgreSQL"""
+    if not rows:
+        return
+    driver = copy_connection()
+    if driver is None:
+        db.session.execute(db.insert(Promotion), [{**row, "change_seq": seq} for row in rows])
+        return
+    columns = list(rows[0])
+    names = ", ".join(columns + ["change_seq"])
+    with driver.cursor() as cursor, cursor.copy(f"COPY {Promotion.__tablename__} ({names}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row([*(row[name] for name in columns), seq])
+
+
+def export_chunks(chunk_size):
+    """Yields the FIELDS values of every Promotion in id order, chunk_size rows at a time, by COPY on PostgreSQL"""
+    logger.info("Exporting Promotions ...")
+    driver = copy_connection()
+    if driver is None:
+        yield from Promotion.stream(chunk_size)
+        return
+    stmt = db.select(*(getattr(Promotion, name) for name in FIELDS)).order_by(Promotion.id)
+    sql = stmt.compile(dialect=db.session.get_bind().dialect)
+    with driver.cursor() as cursor, cursor.copy(f"COPY ({sql}) TO STDOUT") as copy:
+        copy.set_types(COPY_TYPES)
+        chunk = []
+        for row in copy.rows():
+            chunk.append(row)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class Progress:  # pylint: disable=too-few-public-methods
+    """Reports a running row count and rate at most once per interval"""
+
+    def __init__(self, echo, interval=1.0):
+        """
+        Args:
+            echo (callable): prints one line of progress
+            interval (float): seconds between lines
+        """
+        self.echo = echo
+        self.interval = interval
+        self.started = self.reported = time.monotonic()
+
+    def rate(self, rows):
+        """Returns rows per second since the start"""
+        elapsed = time.monotonic() - self.started
+        return rows / elapsed if elapsed else 0.0
+
+    def __call__(self, rows):
+        now = time.monotonic()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.echo(f"{rows:,} rows ({self.rate(rows):,.0f} rows/s)")
@@ -16,8 +16,14 @@
 """
 Flask CLI Command Extensions
 """
+import json
+import click
 from flask import current_app as app  # Import Flask application
-from service.models import db
+from service.common.bulk_io import FORMATS, Progress, export_promotions, guess_format, import_promotions
+from service.common.load_test import DEFAULT_MIX, LoadTest, format_report, parse_mix
+from service.common.schema import add_missing_columns, create_indexes
+from service.common.status_scheduler import status_scheduler
+from service.models import db, DataValidationError, Promotion
 
 
 ######################################################################
@@ -34,3 +40,146 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to create the schema without touching existing data
+# Usage:
+#   flask db-init
+######################################################################
+@app.cli.command("db-init")
+def db_init():
+    """
+    Creates any missing tables, columns and indexes. Safe to run against a
+    populated production database, e.g. before a deployment rolls out.
+    """
+    db.create_all()
+    db.session.commit()
+    # indexes may cover columns an older table lacks, so add those first
+    for table in db.metadata.sorted_tables:
+        for name in add_missing_columns(table):
+            click.echo(f"Added column {table.name}.{name}")
+    created = [name for table in db.metadata.sorted_tables for name in create_indexes(table)]
+    if not Promotion.schema_ready():
+        raise click.ClickException(
+            "The promotion table is missing columns db-init cannot add: add them with ALTER TABLE"
+        )
+    click.echo(f"Schema is ready ({len(created)} index(es) created)")
+
+
+######################################################################
+# Command to build missing indexes on an existing table
+# Usage:
+#   flask db-indexes
+######################################################################
+@app.cli.command("db-indexes")
+def db_indexes():
+    """
+    Creates any missing indexes. Safe to run against populated
+    production tables.
+    """
+    created = [name for table in db.metadata.sorted_tables for name in create_indexes(table)]
+    for name in created:
+        click.echo(f"Created index {name}")
+    click.echo(f"{len(created)} index(es) created")
+
+
+######################################################################
+# Commands to move Promotions in and out in bulk
+# Usage:
+#   flask promotions-import legacy.csv
+#   flask promotions-export promotions.ndjson
+######################################################################
+@app.cli.command("promotions-import")
+@click.argument("path", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--format", "file_format", type=click.Choice(FORMATS), help="Defaults to csv for .csv files, else ndjson")
+@click.option("--chunk-size", default=10000, show_default=True, type=click.IntRange(1), help="Rows validated and sent at once")
+def promotions_import(path, file_format, chunk_size):
+    """
+    Creates a Promotion for every record in a CSV or NDJSON file, - for
+    stdin. Every record is validated like a POST; if one fails nothing
+    is imported.
+    """
+    progress = Progress(lambda line: click.echo(line, err=True))
+    with click.open_file(path, encoding="utf-8") as file:
+        try:
+            total = import_promotions(file, file_format or guess_format(path), chunk_size, progress)
+        except DataValidationError as error:
+            raise click.ClickException(f"Nothing imported: {error}") from error
+    click.echo(f"Imported {total:,} promotions ({progress.rate(total):,.0f} rows/s)", err=True)
+
+
+@app.cli.command("promotions-export")
+@click.argument("path", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--format", "file_format", type=click.Choice(FORMATS), help="Defaults to csv for .csv files, else ndjson")
+@click.option("--chunk-size", default=10000, show_default=True, type=click.IntRange(1), help="Rows fetched at once")
+def promotions_export(path, file_format, chunk_size):
+    """
+    Writes every Promotion to a CSV or NDJSON file, - for stdout.
+    """
+    progress = Progress(lambda line: click.echo(line, err=True))
+    with click.open_file(path, "wb") as file:
+        total = export_promotions(file, file_format or guess_format(path), chunk_size, progress)
+    click.echo(f"Exported {total:,} promotions ({progress.rate(total):,.0f} rows/s)", err=True)
+
+
+######################################################################
+# Command to bring promotion statuses in line with their dates
+# Usage:
+#   flask promotions-sweep
+######################################################################
+@app.cli.command("promotions-sweep")
+def promotions_sweep():
+    """
+    Deactivates expired promotions, activates those whose start date has
+    arrived and prunes old change feed tombstones, as the scheduler in
+    each gunicorn worker does.
+    """
+    result = status_scheduler.run_once()
+    if result is None:
+        click.echo("Another instance is sweeping, nothing done")
+        return
+    click.echo(
+        f"{result['deactivated']} promotion(s) deactivated, {result['activated']} activated, "
+        f"{result['pruned']} tombstone(s) pruned"
+    )
+
+
+######################################################################
+# Command to load test a running instance
+# Usage:
+#   flask load-test --url http://localhost:8080 --workers 32 --duration 60
+######################################################################
+@app.cli.command("load-test")
+@click.option("--url", default="http://localhost:8080", show_default=True, help="Where the service is running")
+@click.option("--workers", default=16, show_default=True, type=click.IntRange(1), help="Concurrent connections")
+@click.option("--duration", default=30.0, show_default=True, type=click.FloatRange(0), help="Seconds to run for")
+@click.option("--mix", default=DEFAULT_MIX, show_default=True, help="Weight of each call")
+@click.option("--pool", default=100, show_default=True, type=click.IntRange(1),
+              help="Promotions created up front to update, activate and deactivate")
+@click.option("--output", default="load-test.json", show_default=True, type=click.Path(dir_okay=False),
+              help="File to save the results to as JSON")
+def load_test(url, workers, duration, mix, pool, output):  # pylint: disable=too-many-arguments
+    """
+    Drives a running instance with a mix of list, get, create, update,
+    activate and deactivate calls, then reports throughput and latency
+    percentiles per call. Everything it creates is deleted at the end.
+    """
+    try:
+        weights = parse_mix(mix)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="--mix") from error
+    test = LoadTest(url, weights, workers=workers, duration=duration, pool=pool)
+    try:
+        test.prepare()
+        report = test.run()
+    except (OSError, RuntimeError) as error:
+        raise click.ClickException(f"Cannot load test {url}: {error}") from error
+    finally:
+        remaining = test.cleanup()
+        if remaining:
+            click.echo(f"Could not delete {len(remaining)} promotion(s) created by the load test: {remaining}", err=True)
+    click.echo(format_report(report))
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    click.echo(f"Results saved to {output}")
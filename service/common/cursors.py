@@ -0,0 +1,63 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Page Cursors
+
+Opaque keyset pagination cursors for the promotions collection, shared by
+the Flask routes and the async read API so either can continue a page
+the other started.
+"""
+import base64
+import binascii
+import json
+from datetime import date
+
+
+def encode_cursor(position, sort="id"):
+    """Encodes the sort position after the last row of a page as an opaque page cursor
+
+    Args:
+        position (tuple): the sort column values of the last row
+        sort (str): the sort key the page was listed in
+    """
+    # id ordered cursors keep the shape they had before pages could be sorted
+    content = {"id": position[0]} if sort == "id" else {"sort": sort, "after": list(position)}
+    token = json.dumps(content, separators=(",", ":"), default=date.isoformat).encode()
+    return base64.urlsafe_b64encode(token).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort="id"):
+    """Decodes a page cursor back into the sort position of the last row returned
+
+    Returns:
+        list: the JSON sort column values, or None when there is no cursor
+
+    Raises:
+        ValueError: when the cursor was not made by encode_cursor() or was
+            made for a different sort key
+    """
+    if not cursor:
+        return None
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        cursor_sort = token.get("sort", "id")
+        after = [token["id"]] if cursor_sort == "id" else token["after"]
+    except (binascii.Error, ValueError, KeyError, TypeError, AttributeError) as error:
+        raise ValueError("cursor is invalid.") from error
+    if cursor_sort != sort:
+        raise ValueError("cursor was issued for a different sort.")
+    return after
@@ -0,0 +1,65 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Instrumented Connection Pool
+
+A QueuePool that records how long each checkout waits for a connection
+and how many connections are in use and in overflow, so the pool can be
+sized against the number of gunicorn workers and threads.
+"""
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+from service.common.metrics import (
+    DB_POOL_CHECKOUT_SECONDS,
+    DB_POOL_IN_USE,
+    DB_POOL_OVERFLOW,
+    DB_POOL_TIMEOUTS,
+)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that times checkouts and reports its usage"""
+
+    def _do_get(self):
+        """Takes a connection from the pool, timing the wait"""
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+            self.report()
+
+    def _do_return_conn(self, record):
+        """Puts a connection back in the pool"""
+        super()._do_return_conn(record)
+        self.report()
+
+    def report(self):
+        """Updates the in-use and overflow gauges"""
+        DB_POOL_IN_USE.set(self.checkedout())
+        DB_POOL_OVERFLOW.set(max(self.overflow(), 0))
+
+
+def init_app(app):
+    """Uses TimedQueuePool for databases that are configured with a sized pool"""
+    options = app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {}
+    if "pool_size" in options and "poolclass" not in options:
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {**options, "poolclass": TimedQueuePool}
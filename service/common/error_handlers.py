@@ -18,19 +18,45 @@ Module: error_handlers
 """
 from flask import jsonify
 from flask import current_app as app  # Import Flask application
-from service.models import DataValidationError
+from service.models import DataConflictError, DataValidationError
 from . import status
 
+# flask-restx answers exceptions raised inside a Resource itself, so the
+# model errors need handlers on the Api as well as on the app
+api = app.extensions["promotions_api"]
+
 
 ######################################################################
 # Error Handlers
 ######################################################################
+@api.errorhandler(DataConflictError)
+def api_conflict_error(error):
+    """Handles writes inside the REST API that lost a race on a row's version"""
+    message = str(error)
+    app.logger.warning(message)
+    return {"status": status.HTTP_409_CONFLICT, "error": "Conflict", "message": message}, status.HTTP_409_CONFLICT
+
+
+@api.errorhandler(DataValidationError)
+def api_validation_error(error):
+    """Handles bad data inside the REST API"""
+    message = str(error)
+    app.logger.warning(message)
+    return {"status": status.HTTP_400_BAD_REQUEST, "error": "Bad Request", "message": message}, status.HTTP_400_BAD_REQUEST
+
+
 @app.errorhandler(DataValidationError)
 def request_validation_error(error):
     """Handles Value Errors from bad data"""
     return bad_request(error)
 
 
+@app.errorhandler(DataConflictError)
+def request_conflict_error(error):
+    """Handles writes that lost a race on a row's version"""
+    return conflict(error)
+
+
 @app.errorhandler(status.HTTP_400_BAD_REQUEST)
 def bad_request(error):
     """Handles bad requests with 400_BAD_REQUEST"""
@@ -55,6 +81,17 @@ def not_found(error):
     )
 
 
+@app.errorhandler(status.HTTP_409_CONFLICT)
+def conflict(error):
+    """Handles conflicting writes with 409_CONFLICT"""
+    message = str(error)
+    app.logger.warning(message)
+    return (
+        jsonify(status=status.HTTP_409_CONFLICT, error="Conflict", message=message),
+        status.HTTP_409_CONFLICT,
+    )
+
+
 @app.errorhandler(status.HTTP_405_METHOD_NOT_ALLOWED)
 def method_not_supported(error):
     """Handles unsupported HTTP methods with 405_METHOD_NOT_SUPPORTED"""
@@ -0,0 +1,129 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Collection Query Parameters
+
+Parses the filter and sort parameters of GET /api/promotions into
+Promotion.page_statement() arguments, and those of GET
+/api/promotions/stats into Promotion.stats() arguments. Shared by the
+Flask routes and the async read API, which both hand over their query
+string as a MultiDict:
+
+    type=BOGO                       the promotion type
+    product_id=1&product_id=2       any of these products, also product_id=1,2
+    status=true                     active (true) or inactive (false) only
+    active_on=2025-06-01            running on this date
+    starts_after=2025-01-01         starting on or after this date
+    ends_before=2025-12-31          ending on or before this date
+    amount_min=5&amount_max=20      amount within these bounds
+    name=Summer Sale                this exact name
+    sort=-amount                    one of SORT_KEYS, "-" for descending
+"""
+import math
+from datetime import date
+from service.models import INT4_MAX, INT4_MIN, SORT_KEYS, STATS_BUCKETS, STATS_DIMENSIONS
+
+
+def parse_status(value):
+    """Parses true or false, in any case"""
+    if value.lower() not in ("true", "false"):
+        raise ValueError(value)
+    return value.lower() == "true"
+
+
+def parse_amount(value):
+    """Parses a finite number"""
+    amount = float(value)
+    if not math.isfinite(amount):
+        raise ValueError(value)
+    return amount
+
+
+def parse_product_id(value):
+    """Parses an integer that fits the product_id column"""
+    product_id = int(value)
+    if not INT4_MIN <= product_id <= INT4_MAX:
+        raise ValueError(value)
+    return product_id
+
+
+# query parameter: (filter_clauses() argument, parser, message when it fails)
+PARAMS = {
+    "type": ("promo_type", str, None),
+    "name": ("name", str, None),
+    "status": ("status", parse_status, "status must be true or false."),
+    "active_on": ("active_on", date.fromisoformat, "active_on must be a date (YYYY-MM-DD)."),
+    "starts_after": ("starts_after", date.fromisoformat, "starts_after must be a date (YYYY-MM-DD)."),
+    "ends_before": ("ends_before", date.fromisoformat, "ends_before must be a date (YYYY-MM-DD)."),
+    "amount_min": ("amount_min", parse_amount, "amount_min must be a number."),
+    "amount_max": ("amount_max", parse_amount, "amount_max must be a number."),
+}
+
+
+def parse_list_query(args):
+    """Returns the filters and sort key a collection query asks for
+
+    Args:
+        args: the query parameters, a MultiDict with get() and getlist()
+
+    Returns:
+        tuple: the Promotion.filter_clauses() arguments and the sort key
+
+    Raises:
+        ValueError: naming the first malformed parameter
+    """
+    filters = {}
+    for param, (name, parse, message) in PARAMS.items():
+        if args.get(param):
+            try:
+                filters[name] = parse(args.get(param))
+            except ValueError as error:
+                raise ValueError(message) from error
+
+    product_ids = [value for values in args.getlist("product_id") for value in values.split(",") if value]
+    if product_ids:
+        try:
+            filters["product_ids"] = [parse_product_id(value) for value in product_ids]
+        except ValueError as error:
+            raise ValueError(f"product_id must be a list of integers from {INT4_MIN} to {INT4_MAX}.") from error
+
+    sort = args.get("sort") or "id"
+    if sort.removeprefix("-") not in SORT_KEYS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}, prefixed with '-' to reverse.")
+    return filters, sort
+
+
+def parse_stats_query(args):
+    """Returns the dimensions, date bucket and filters a stats query asks for
+
+    Args:
+        args: the query parameters, a MultiDict with get() and getlist()
+
+    Returns:
+        tuple: the Promotion.stats() dimensions, bucket and filters
+
+    Raises:
+        ValueError: naming the first malformed parameter
+    """
+    by = [name for name in (args.get("by") or "promo_type,status").split(",") if name]
+    if any(name not in STATS_DIMENSIONS for name in by) or len(set(by)) != len(by):
+        raise ValueError(f"by must be a comma separated list of {', '.join(STATS_DIMENSIONS)}.")
+    bucket = args.get("bucket") or "month"
+    if bucket not in STATS_BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(STATS_BUCKETS)}.")
+    filters, _ = parse_list_query(args)
+    return by, bucket, filters
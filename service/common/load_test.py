@@ -0,0 +1,280 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Load Test Traffic Generator
+
+Drives a running instance of the service with a weighted mix of list,
+get, create, update, activate and deactivate calls from many concurrent
+workers, each a thread holding one keep-alive HTTP connection, and
+reports throughput and latency percentiles per endpoint. Used by the
+`flask load-test` command.
+
+Updates, activations and deactivations only touch a pool of promotions
+the load test creates before it starts. Those promotions and every one
+created during the run are deleted again at the end.
+"""
+import http.client
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+# the calls a load test can make, in report order
+ENDPOINTS = ("list", "get", "create", "update", "activate", "deactivate")
+DEFAULT_MIX = "list=40,get=30,create=10,update=10,activate=5,deactivate=5"
+NAME_PREFIX = "load-test"
+
+
+def parse_mix(text):
+    """Parses "list=40,get=30,..." into endpoint weights
+
+    Raises:
+        ValueError: when an endpoint is unknown, a weight is not a
+            non-negative integer or every weight is zero
+    """
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"unknown endpoint '{name}', expected one of {', '.join(ENDPOINTS)}")
+        if not weight.strip().isdigit():
+            raise ValueError(f"the weight of '{name}' must be a non-negative integer")
+        mix[name] = int(weight)
+    if not any(mix.values()):
+        raise ValueError("at least one endpoint needs a weight above zero")
+    return mix
+
+
+def percentile(samples, fraction):
+    """Returns a nearest-rank percentile of sorted samples in milliseconds"""
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000, 3)
+
+
+def summarize(latencies, errors, elapsed):
+    """Returns the request count, errors, throughput and latency percentiles of one endpoint"""
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+
+
+def promotion_body(rnd, status=True):
+    """Returns a random promotion for the load test to create or update"""
+    start = rnd.randint(0, 300)
+    return {
+        "name": f"{NAME_PREFIX}-{rnd.randint(0, 999999)}",
+        "promo_type": rnd.choice(["PERCENT_OFF", "BOGO", "AMOUNT_OFF"]),
+        "product_id": rnd.randint(1, 1000),
+        "amount": float(rnd.randint(1, 50)),
+        "start_date": f"2025-{1 + start // 28 % 12:02d}-{1 + start % 28:02d}",
+        "end_date": "2026-12-31",
+        "status": status,
+    }
+
+
+class Client:
+    """One keep-alive connection to the service"""
+
+    def __init__(self, base_url, timeout):
+        self.url = urlsplit(base_url)
+        self.timeout = timeout
+        self.connection = self._connect()
+
+    def _connect(self):
+        connection_class = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+        return connection_class(self.url.hostname, self.url.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None):
+        """Sends one request and returns its status code and body, reconnecting after errors"""
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            path = self.url.path.rstrip("/") + path
+            self.connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = self._connect()
+            raise
+        return response.status, data
+
+    def close(self):
+        """Closes the connection"""
+        self.connection.close()
+
+
+class LoadTest:
+    """Generates a mix of API calls against a running instance and measures them"""
+
+    def __init__(self, base_url, mix, workers=16, duration=30.0, pool=100, timeout=10.0):
+        """
+        Args:
+            base_url (str): where the service runs, e.g. http://localhost:8080
+            mix (dict): endpoint weights from parse_mix()
+            workers (int): concurrent connections making calls
+            duration (float): seconds to keep calling
+            pool (int): promotions to create up front for updates and (de)activations
+            timeout (float): seconds before a call gives up
+        """
+        self.base_url = base_url
+        self.mix = mix
+        self.workers = workers
+        self.duration = duration
+        self.pool = pool
+        self.timeout = timeout
+        self.ids = []
+        self.created = []
+
+    def prepare(self):
+        """Creates the pool of promotions the run updates, activates and deactivates"""
+        client = Client(self.base_url, self.timeout)
+        rnd = random.Random(0)
+        try:
+            for _ in range(self.pool):
+                code, body = client.request("POST", "/api/promotions", promotion_body(rnd))
+                if code != 201:
+                    raise RuntimeError(f"creating a promotion answered {code}")
+                self.ids.append(json.loads(body)["id"])
+        finally:
+            client.close()
+
+    def cleanup(self):
+        """Deletes every promotion the load test created
+
+        Returns:
+            list: the ids that could not be deleted because the service stopped answering
+        """
+        remaining = self.ids + self.created
+        client = Client(self.base_url, self.timeout)
+        try:
+            while remaining:
+                client.request("DELETE", f"/api/promotions/{remaining[-1]}")
+                remaining.pop()
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            client.close()
+        return remaining
+
+    def run(self):
+        """Calls the service from every worker until the duration is up and returns the report"""
+        started = datetime.now(timezone.utc)
+        deadline = time.monotonic() + self.duration
+        results = [[] for _ in range(self.workers)]
+        threads = [
+            threading.Thread(target=self._work, args=(n, deadline, results[n]), daemon=True) for n in range(self.workers)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return self.report(results, elapsed, started)
+
+    def _work(self, number, deadline, results):
+        """Makes calls until the deadline, appending (endpoint, seconds, status code) to results"""
+        rnd = random.Random(number)
+        names = [name for name in ENDPOINTS if self.mix.get(name)]
+        weights = [self.mix[name] for name in names]
+        client = Client(self.base_url, self.timeout)
+        try:
+            while time.monotonic() < deadline:
+                endpoint = rnd.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    code = self._call(client, rnd, endpoint)
+                except (OSError, http.client.HTTPException):
+                    code = None
+                results.append((endpoint, time.perf_counter() - start, code))
+        finally:
+            client.close()
+
+    def _call(self, client, rnd, endpoint):
+        """Makes one call and returns its status code"""
+        promotion_id = rnd.choice(self.ids) if self.ids else 0
+        if endpoint == "list":
+            code, _ = client.request("GET", "/api/promotions?limit=100")
+        elif endpoint == "get":
+            code, _ = client.request("GET", f"/api/promotions/{promotion_id}")
+        elif endpoint == "create":
+            code, body = client.request("POST", "/api/promotions", promotion_body(rnd))
+            if code == 201:
+                self.created.append(json.loads(body)["id"])
+        elif endpoint == "update":
+            code, _ = client.request("PUT", f"/api/promotions/{promotion_id}", promotion_body(rnd, rnd.random() < 0.5))
+        elif endpoint == "activate":
+            code, _ = client.request("PUT", f"/api/promotions/{promotion_id}/activate")
+        else:
+            code, _ = client.request("DELETE", f"/api/promotions/{promotion_id}/deactivate")
+        return code
+
+    def report(self, results, elapsed, started):
+        """Summarizes the calls of every worker per endpoint and overall
+
+        A call is an error when it answered 400 or above or got no answer
+        at all; "codes" counts the answers of each endpoint by status code,
+        "none" for the calls that failed to connect or timed out. Updates,
+        activations and deactivations of the same promotion from several
+        workers can legitimately answer 409 when they race on its version.
+        """
+        latencies = {name: [] for name in ENDPOINTS if self.mix.get(name)}
+        errors = dict.fromkeys(latencies, 0)
+        codes = {name: {} for name in latencies}
+        for worker in results:
+            for endpoint, seconds, code in worker:
+                latencies[endpoint].append(seconds)
+                errors[endpoint] += code is None or code >= 400
+                key = str(code).lower()
+                codes[endpoint][key] = codes[endpoint].get(key, 0) + 1
+        return {
+            "target": self.base_url,
+            "started": started.isoformat(timespec="seconds"),
+            "duration": round(elapsed, 3),
+            "workers": self.workers,
+            "mix": self.mix,
+            "endpoints": {
+                name: {**summarize(latencies[name], errors[name], elapsed), "codes": codes[name]} for name in latencies
+            },
+            "total": summarize(
+                [seconds for samples in latencies.values() for seconds in samples], sum(errors.values()), elapsed
+            ),
+        }
+
+
+def format_report(report):
+    """Returns a report as a text table"""
+    lines = [
+        f"{report['workers']} workers for {report['duration']:.1f}s against {report['target']}",
+        f"{'endpoint':<12}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}",
+    ]
+    for name, row in [*report["endpoints"].items(), ("total", report["total"])]:
+        cells = "".join(f"{row[key]:>8.1f}ms" if row[key] is not None else f"{'-':>10}"
+                        for key in ("p50_ms", "p95_ms", "p99_ms"))
+        lines.append(f"{name:<12}{row['requests']:>10}{row['errors']:>8}{row['throughput']:>10.1f}{cells}")
+    return "\n".join(lines)
@@ -0,0 +1,258 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Service Metrics
+
+Prometheus metrics for the service, exposed in text format at /metrics.
+
+Every request is timed and counted by resource class and status, along
+with the number of SQL statements it ran and the time they took. The
+statements are counted with SQLAlchemy cursor events on every Engine.
+The count is logged at DEBUG level, as a warning once it passes
+QUERY_COUNT_WARN, and sent in an X-Query-Count header in debug mode or
+with QUERY_COUNT_HEADER set. Tests pin the number of statements an
+endpoint may run with query_budget().
+
+Under gunicorn every worker is its own process with its own copy of these
+metrics. When PROMETHEUS_MULTIPROC_DIR is set before the service starts,
+prometheus_client writes each worker's values to files in that directory
+and /metrics sums them, so any worker can answer for all of them.
+gunicorn.conf.py sets the directory up.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+######################################################################
+# Database connection pool
+######################################################################
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "promotions_db_pool_checkout_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+DB_POOL_TIMEOUTS = Counter(
+    "promotions_db_pool_timeouts",
+    "Checkouts that gave up after waiting pool_timeout seconds",
+)
+DB_POOL_IN_USE = Gauge(
+    "promotions_db_pool_connections_in_use",
+    "Connections currently checked out of the pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "promotions_db_pool_overflow_connections",
+    "Connections open beyond pool_size",
+    multiprocess_mode="livesum",
+)
+
+
+######################################################################
+# HTTP requests
+######################################################################
+HTTP_REQUEST_SECONDS = Histogram(
+    "promotions_http_request_duration_seconds",
+    "Time spent handling a request",
+    ["resource", "method"],
+)
+HTTP_REQUESTS = Counter(
+    "promotions_http_requests",
+    "Requests handled",
+    ["resource", "method", "status"],
+)
+HTTP_ERRORS = Counter(
+    "promotions_http_request_errors",
+    "Requests answered with a 4xx or 5xx status",
+    ["resource", "method", "status"],
+)
+
+######################################################################
+# Database queries and serialization
+######################################################################
+DB_QUERIES_PER_REQUEST = Histogram(
+    "promotions_db_queries_per_request",
+    "SQL statements executed while handling a request",
+    ["resource"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_QUERY_SECONDS_PER_REQUEST = Histogram(
+    "promotions_db_query_seconds_per_request",
+    "Time spent in SQL statements while handling a request",
+    ["resource"],
+)
+SERIALIZATION_SECONDS = Histogram(
+    "promotions_serialization_seconds",
+    "Time spent encoding Promotions as JSON",
+    ["format"],
+    buckets=(0.00001, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+)
+
+######################################################################
+# Status scheduler
+######################################################################
+STATUS_SWEEP_RUNS = Counter(
+    "promotions_status_sweep_runs",
+    "Status sweeps by result: ran, skipped (another instance held the lock) or failed",
+    ["result"],
+)
+STATUS_SWEEP_PROMOTIONS = Counter(
+    "promotions_status_sweep_promotions",
+    "Promotions whose status a sweep changed, and tombstones of deleted ones it pruned",
+    ["action"],
+)
+STATUS_SWEEP_SECONDS = Histogram(
+    "promotions_status_sweep_duration_seconds",
+    "Time spent in a status sweep that ran",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+STATUS_SWEEP_LAST_SUCCESS = Gauge(
+    "promotions_status_sweep_last_success_timestamp_seconds",
+    "When a status sweep last finished without errors",
+    multiprocess_mode="max",
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, *args):  # pylint: disable=unused-argument
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+# the statement lists of the query_budget() blocks open on each thread
+_budgets = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a query_budget() block runs more SQL statements than it allows"""
+
+
+@contextmanager
+def query_budget(limit):
+    """Fails when the block runs more than limit SQL statements on this thread
+
+    Wrap a request in a test to declare how many queries its endpoint may
+    issue; a change that makes it query once per row then fails with the
+    statements that ran.
+
+    Yields:
+        list: the SQL of every statement run so far
+    """
+    statements = []
+    stack = _budgets.__dict__.setdefault("stack", [])
+    stack.append(statements)
+    try:
+        yield statements
+    finally:
+        stack.pop()
+    if len(statements) > limit:
+        raise QueryBudgetExceeded(
+            f"{len(statements)} SQL statements ran, over the budget of {limit}:\n" + "\n".join(statements)
+        )
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    if has_request_context():
+        g.db_queries = g.get("db_queries", 0) + 1
+        g.db_query_seconds = g.get("db_query_seconds", 0.0) + elapsed
+    for statements in getattr(_budgets, "stack", ()):
+        statements.append(statement)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    starts = context.connection.info.get("query_start") if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def resource_name():
+    """Returns the name of the Resource class (or view) handling the request"""
+    if request.endpoint is None:
+        return "unmatched"
+    view = current_app.view_functions.get(request.endpoint)
+    view_class = getattr(view, "view_class", None)
+    return view_class.__name__ if view_class is not None else request.endpoint
+
+
+def _start_timer():
+    g.db_queries = 0
+    g.db_query_seconds = 0.0
+    g.request_start = time.perf_counter()
+
+
+def _record_request(response):
+    elapsed = time.perf_counter() - g.pop("request_start", time.perf_counter())
+    resource = resource_name()
+    method = request.method
+    code = str(response.status_code)
+    HTTP_REQUEST_SECONDS.labels(resource, method).observe(elapsed)
+    HTTP_REQUESTS.labels(resource, method, code).inc()
+    if response.status_code >= 400:
+        HTTP_ERRORS.labels(resource, method, code).inc()
+    queries = g.get("db_queries", 0)
+    query_seconds = g.get("db_query_seconds", 0.0)
+    DB_QUERIES_PER_REQUEST.labels(resource).observe(queries)
+    DB_QUERY_SECONDS_PER_REQUEST.labels(resource).observe(query_seconds)
+    _report_queries(response, queries, query_seconds)
+    return response
+
+
+def _report_queries(response, queries, query_seconds):
+    """Logs the number of SQL statements a request ran and adds it to the response in debug mode"""
+    config = current_app.config
+    message = "%s %s ran %d SQL statements in %.1fms"
+    args = (request.method, request.path, queries, query_seconds * 1000)
+    if queries > config.get("QUERY_COUNT_WARN", 20):
+        current_app.logger.warning(message + ", look for a query run once per row", *args)
+    else:
+        current_app.logger.debug(message, *args)
+    if current_app.debug or config.get("QUERY_COUNT_HEADER"):
+        response.headers["X-Query-Count"] = str(queries)
+
+
+def init_app(app):
+    """Times and counts every request the app handles"""
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+
+
+def generate():
+    """Returns the metrics in Prometheus text format and their content type
+
+    In multiprocess mode the values of every worker are read from
+    PROMETHEUS_MULTIPROC_DIR and summed.
+    """
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,318 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Promotion Name Index
+
+An in-process index that answers name searches ("summ", "sumer sale")
+without scanning the Promotion table.
+
+Names are normalized to keys: case folded words separated by single
+spaces. The distinct keys are kept sorted, so a prefix query bisects to
+the first match and reads on from there. Every key is also broken into
+trigrams the way PostgreSQL's pg_trgm does ("  s", " su", "sum", "umm",
+...), and each trigram lists the keys that contain it. A query's trigrams
+are looked up and counted per key with NumPy, which finds names that
+contain the query or differ from it by a typo without comparing the query
+to every name.
+
+Results are ranked: the exact name first, then names starting with the
+query in alphabetical order, then names sharing at least MIN_SIMILARITY
+of the query's trigrams, most shared first and shorter names first.
+
+Like the active index it is loaded lazily and kept up to date by the
+Promotion model as it writes. Every worker process has its own copy and
+only sees its own writes, so the whole index is reloaded once it is older
+than NAME_INDEX_MAX_AGE seconds to pick up changes made elsewhere.
+"""
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+import numpy as np
+
+# the share of a query's trigrams a name must contain to match it
+MIN_SIMILARITY = 0.5
+
+_WORDS = re.compile(r"[^\W_]+")
+# keys are broken into trigrams this many at a time while building
+_BUILD_CHUNK = 100000
+
+
+def normalize(name):
+    """Returns the index key of a name: its case folded words separated by single spaces"""
+    return " ".join(_WORDS.findall(name.casefold()))
+
+
+def pack(trigram):
+    """Packs three characters into one integer, 21 bits per code point"""
+    return (ord(trigram[0]) << 42) | (ord(trigram[1]) << 21) | ord(trigram[2])
+
+
+def key_trigrams(key):
+    """Returns the trigrams of a key, each word padded with two spaces before and one after"""
+    trigrams = set()
+    for word in key.split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def query_trigrams(key):
+    """Returns the trigrams to look a query up by
+
+    Words of three characters or more give their unpadded trigrams, so
+    they match inside a word as well as at its start; shorter words can
+    only match the start of a word.
+    """
+    trigrams = set()
+    for word in key.split():
+        padded = word if len(word) >= 3 else f"  {word}"
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+
+def _trigram_postings(keys):
+    """Returns the sorted trigram codes, where each code's keys start, the key postings and trigrams per key"""
+    codes = [np.zeros(0, dtype=np.int64)]
+    owners = [np.zeros(0, dtype=np.int64)]
+    for first in range(0, len(keys), _BUILD_CHUNK):
+        chunk = keys[first:first + _BUILD_CHUNK]
+        # one row of code points per key: "  summer  sale " pads every word at once
+        padded = np.array(["  " + key.replace(" ", "  ") + " " for key in chunk])
+        points = padded.view(np.uint32).reshape(len(chunk), -1).astype(np.int64)
+        trigrams = (points[:, :-2] << 42) | (points[:, 1:-1] << 21) | points[:, 2:]
+        # skip the padding past the end of a key and the "r  " spans between words
+        trigrams[(points[:, 2:] == 0) | ((points[:, 1:-1] == 32) & (points[:, 2:] == 32))] = -1
+        # a trigram repeated within one key counts once
+        trigrams.sort(axis=1)
+        valid = trigrams != -1
+        valid[:, 1:] &= trigrams[:, 1:] != trigrams[:, :-1]
+        rows, _ = np.nonzero(valid)
+        codes.append(trigrams[valid])
+        owners.append(rows + first)
+    codes = np.concatenate(codes)
+    owners = np.concatenate(owners)
+    # owners are already in order, so a stable sort keeps each trigram's keys sorted
+    order = np.argsort(codes, kind="stable")
+    codes, owners = codes[order], owners[order]
+    # where each trigram's run of keys begins; codes are never negative
+    firsts = np.flatnonzero(np.diff(codes, prepend=-1))
+    return codes[firsts], np.append(firsts, len(codes)), owners.astype(np.int32), np.bincount(owners, minlength=len(keys))
+
+
+class NameIndex:  # pylint: disable=too-many-instance-attributes
+    """Indexes promotion names for prefix and fuzzy search"""
+
+    def __init__(self, loader=None, max_age=300.0):
+        """
+        Args:
+            loader (callable): returns every promotion as (id, name) rows
+            max_age (float): seconds before the index is reloaded from the loader
+        """
+        self.loader = loader
+        self.max_age = max_age
+        self.enabled = True
+        self._app = None
+        self._lock = threading.RLock()
+        self._reloader = None
+        self._reading = 0
+        self._keys = []
+        self._key_starts = np.zeros(1, dtype=np.int64)
+        self._key_ids = np.zeros(0, dtype=np.int64)
+        self._postings = _trigram_postings([])
+        # ids written since the reload (and when), and the current keys of those still present
+        self._changed = {}
+        self._extra = {}
+        self._extra_key = {}
+        self._loaded_at = None
+
+    def init_app(self, app):
+        """Reads the index settings from the Flask app config"""
+        self._app = app
+        self.enabled = app.config.get("NAME_INDEX_ENABLED", True)
+        self.max_age = app.config.get("NAME_INDEX_MAX_AGE", self.max_age)
+
+    ##################################################
+    # Loading
+    ##################################################
+
+    def invalidate(self):
+        """Drops the index so the next search reloads it"""
+        with self._lock:
+            self._loaded_at = None
+
+    def rebuild(self, rows=None):
+        """Replaces the index with rows, or with the loader's rows"""
+        started = time.monotonic()
+        ids = []
+        names = []
+        with self._lock:
+            self._reading += 1
+        try:
+            for pid, name in self.loader() if rows is None else rows:
+                ids.append(pid)
+                names.append(normalize(name))
+        finally:
+            with self._lock:
+                self._reading -= 1
+        keys = sorted(set(names))
+        position = {key: n for n, key in enumerate(keys)}
+        owners = np.array([position[name] for name in names], dtype=np.int64)
+        order = np.argsort(owners, kind="stable")
+        key_ids = np.array(ids, dtype=np.int64)[order]
+        key_starts = np.searchsorted(owners[order], np.arange(len(keys) + 1))
+        postings = _trigram_postings(keys)
+        with self._lock:
+            self._keys = keys
+            self._key_starts = key_starts
+            self._key_ids = key_ids
+            self._postings = postings
+            # writes made while the rows were read may be missing from them
+            self._changed = {pid: at for pid, at in self._changed.items() if at >= started}
+            self._extra_key = {pid: key for pid, key in self._extra_key.items() if pid in self._changed}
+            self._extra = {}
+            for pid, key in self._extra_key.items():
+                self._extra.setdefault(key, set()).add(pid)
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None:
+            self.rebuild()
+        elif time.monotonic() - loaded_at > self.max_age:
+            self._reload_in_background()
+
+    def _reload_in_background(self):
+        """Reloads the index on a thread while searches go on using the current one"""
+        if self._app is None:
+            self.rebuild()
+            return
+        with self._lock:
+            if self._reloader is not None and self._reloader.is_alive():
+                return
+            self._reloader = threading.Thread(target=self._reload, daemon=True)
+            self._reloader.start()
+
+    def _reload(self):
+        with self._app.app_context():
+            self.rebuild()
+
+    def wait(self):
+        """Waits for a background reload to finish"""
+        reloader = self._reloader
+        if reloader is not None:
+            reloader.join()
+
+    ##################################################
+    # Incremental updates
+    ##################################################
+
+    def upsert(self, pid, name):
+        """Adds or renames one promotion"""
+        with self._lock:
+            if self._loaded_at is None and not self._reading:
+                return
+            self._remove(pid)
+            key = normalize(name)
+            self._extra.setdefault(key, set()).add(pid)
+            self._extra_key[pid] = key
+
+    def remove(self, pid):
+        """Removes one promotion from the index"""
+        with self._lock:
+            if self._loaded_at is not None or self._reading:
+                self._remove(pid)
+
+    def _remove(self, pid):
+        self._changed[pid] = time.monotonic()
+        key = self._extra_key.pop(pid, None)
+        if key is not None:
+            self._extra[key].discard(pid)
+            if not self._extra[key]:
+                del self._extra[key]
+
+    ##################################################
+    # Search
+    ##################################################
+
+    def search(self, query, limit):
+        """Returns the ids of up to limit promotions whose names best match query, best first"""
+        key = normalize(query)
+        if not key:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            # keys whose ids were all written since the reload can take a place each
+            ranked = self._rank(key, limit + len(self._changed))
+            found = []
+            for _, name in sorted(ranked):
+                found.extend(self._ids_of(name))
+                if len(found) >= limit:
+                    break
+        return found[:limit]
+
+    def _rank(self, key, count):
+        """Returns (rank, key) pairs for at least count of the best matching keys"""
+        ranked = {}
+        keys = self._keys
+        first = bisect_left(keys, key)
+        for name in keys[first:first + count]:
+            if not name.startswith(key):
+                break
+            ranked[name] = (0, name != key, name)
+
+        trigrams = query_trigrams(key)
+        needed = math.ceil(MIN_SIMILARITY * len(trigrams))
+        if len(ranked) < count:
+            self._rank_similar(ranked, trigrams, needed, count)
+
+        for name in self._extra:
+            if name.startswith(key):
+                ranked[name] = (0, name != key, name)
+            elif name not in ranked:
+                shared = len(trigrams & key_trigrams(name))
+                if shared >= needed:
+                    ranked[name] = (1, -shared / len(trigrams), len(key_trigrams(name)), name)
+        return [(rank, name) for name, rank in ranked.items()]
+
+    def _rank_similar(self, ranked, trigrams, needed, count):
+        """Adds the best count keys sharing at least needed trigrams to ranked"""
+        keys = self._keys
+        codes, starts, owners, sizes = self._postings
+        wanted = np.array(sorted(pack(trigram) for trigram in trigrams), dtype=np.int64)
+        found = np.minimum(np.searchsorted(codes, wanted), len(codes) - 1)
+        found = found[codes[found] == wanted] if len(codes) else found[:0]
+        hits = np.bincount(
+            np.concatenate([owners[starts[n]:starts[n + 1]] for n in found] or [np.zeros(0, dtype=np.int32)]),
+            minlength=len(keys),
+        )
+        candidates = np.flatnonzero(hits >= needed)
+        similarity = hits[candidates] / len(trigrams)
+        best = np.lexsort((candidates, sizes[candidates], -similarity))[:count + len(ranked)]
+        for n in best.tolist():
+            name = keys[candidates[n]]
+            ranked.setdefault(name, (1, -similarity[n], sizes[candidates[n]], name))
+
+    def _ids_of(self, name):
+        """Returns the current ids of the promotions named by a key"""
+        ids = []
+        n = bisect_left(self._keys, name)
+        if n < len(self._keys) and self._keys[n] == name:
+            ids = [pid for pid in self._key_ids[self._key_starts[n]:self._key_starts[n + 1]].tolist()
+                   if pid not in self._changed]
+        return sorted(ids + list(self._extra.get(name, ())))
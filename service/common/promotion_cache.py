@@ -0,0 +1,122 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Promotion Cache
+
+A bounded, in-process read-through cache in front of Promotion.find().
+
+Each entry holds a Promotion's column values and its serialized JSON body,
+so a hot promotion can be answered without a database round trip or a
+second trip through the serializer. Entries are evicted least recently
+used first once PROMOTION_CACHE_SIZE is reached, and expire after
+PROMOTION_CACHE_TTL seconds.
+
+The Promotion model invalidates entries as it writes. Every worker process
+has its own cache and only sees its own writes, so the TTL bounds how long
+a write made by another worker can go unseen.
+
+The same class caches the results of Promotion.stats(), configured from
+the STATS_CACHE_* settings instead.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+CacheEntry = namedtuple("CacheEntry", "values body expires_at")
+
+
+class PromotionCache:
+    """LRU cache of Promotions with a time to live"""
+
+    def __init__(self, max_size=1024, ttl=30.0, prefix="PROMOTION_CACHE"):
+        """
+        Args:
+            max_size (int): the most entries held before evicting
+            ttl (float): seconds an entry is served before it expires
+            prefix (str): the prefix of the app config settings to read
+        """
+        self.prefix = prefix
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        """Reads the cache settings from the Flask app config"""
+        self.enabled = app.config.get(f"{self.prefix}_ENABLED", True)
+        self.max_size = app.config.get(f"{self.prefix}_SIZE", self.max_size)
+        self.ttl = app.config.get(f"{self.prefix}_TTL", self.ttl)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the CacheEntry for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, values, body):
+        """Caches a Promotion's column values and serialized body"""
+        entry = CacheEntry(values, body, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        """Drops the entries for keys"""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def invalidate_all(self):
+        """Drops every entry, keeping the counters"""
+        with self._lock:
+            self._entries.clear()
+
+    def clear(self):
+        """Drops every entry and resets the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Returns the cache counters"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
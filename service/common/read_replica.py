@@ -0,0 +1,98 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Read Replica Routing
+
+When DATABASE_REPLICA_URI is set the app gets a second engine under the
+"replica" bind key. Queries that only read and can tolerate replication
+lag opt in to it by passing bind_arguments=REPLICA_READ; everything else,
+including every write and the reads that precede one, runs on the primary.
+
+A replica lags behind the primary, so a client that has just written
+would not find its own change there. Once a session writes, its opted-in
+reads go to the primary for the rest of the session, and the response
+sets a cookie that sends the same client's reads to the primary for
+READ_REPLICA_STICKY_SECONDS, on any worker and on the async read API.
+"""
+import math
+import time
+from flask import request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = "replica"
+# bind_arguments for a read that may be answered by the replica
+REPLICA_READ = {REPLICA: True}
+STICKY_COOKIE = "read_primary_until"
+
+# Session.info keys
+_WROTE = "replica_wrote"
+_STICKY = "replica_sticky"
+
+
+class RoutingSession(Session):
+    """A Session that sends REPLICA_READ statements to the replica engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """Returns the replica for opted-in reads, otherwise the engine Flask-SQLAlchemy picks"""
+        replica_read = kwargs.pop(REPLICA, False)
+        if bind is None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info[_WROTE] = True
+            elif replica_read and not must_read_primary(self):
+                engine = self._db.engines.get(REPLICA)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+
+def must_read_primary(session):  # pylint: disable=protected-access
+    """Returns True when a RoutingSession has a replica but must not read from it
+
+    That is after the session has written, or while its client is sticky.
+    Callers also use it to skip caches that may hold rows read from the
+    replica.
+    """
+    info = session.info
+    return bool(info.get(_WROTE) or info.get(_STICKY)) and REPLICA in session._db.engines
+
+
+def is_sticky(cookies):
+    """Returns True when a client's cookies say it wrote within the sticky window"""
+    try:
+        return float(cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def init_app(app, db):
+    """Pins sticky clients' requests to the primary and makes clients that write sticky"""
+
+    def pin_sticky_clients():
+        db.session.info.pop(_WROTE, None)
+        db.session.info[_STICKY] = is_sticky(request.cookies)
+
+    def stick_writers(response):
+        if db.session.info.get(_WROTE) and REPLICA in db.engines:
+            window = app.config["READ_REPLICA_STICKY_SECONDS"]
+            response.set_cookie(
+                STICKY_COOKIE, f"{time.time() + window:.3f}", max_age=math.ceil(window), httponly=True, samesite="Lax"
+            )
+        return response
+
+    app.before_request(pin_sticky_clients)
+    app.after_request(stick_writers)
@@ -0,0 +1,104 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Schema Upgrades
+
+Brings the tables of an older release up to date for `flask db-init` and
+`flask db-indexes`. db.create_all() creates missing tables but never alters
+an existing one, so missing columns and indexes are added here, without
+locking a populated table against writes.
+"""
+import logging
+from contextlib import contextmanager
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from service.models import Promotion, db
+
+logger = logging.getLogger("flask.app")
+
+
+@contextmanager
+def ddl_connection(engine):
+    """Yields an AUTOCOMMIT connection with no statement timeout, restored before it goes back to the pool"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.dialect.name != "postgresql":
+            yield conn
+            return
+        # a cancelled CREATE INDEX CONCURRENTLY leaves an INVALID index behind
+        conn.exec_driver_sql("SET statement_timeout = 0")
+        try:
+            yield conn
+        finally:
+            conn.exec_driver_sql("RESET statement_timeout")
+
+
+def add_missing_columns(table=Promotion.__table__):
+    """Adds the columns with a server default that an existing table lacks and returns their names"""
+    db.session.close()
+    engine = db.engine
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    # a concurrent db-init may add the same column first
+    if_not_exists = "IF NOT EXISTS " if engine.dialect.name == "postgresql" else ""
+    added = []
+    with engine.begin() as conn:
+        for column in table.columns:
+            # only a column with a server default can be added to a populated table
+            if column.name in existing or column.server_default is None:
+                continue
+            logger.info("Adding column %s.%s ...", table.name, column.name)
+            ddl = str(CreateColumn(column).compile(dialect=engine.dialect))
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {if_not_exists}{ddl}")
+            added.append(column.name)
+    return added
+
+
+def create_indexes(table=Promotion.__table__):
+    """Creates the indexes an existing table lacks, rebuilding invalid ones, and returns their names"""
+    # a concurrent build waits for every open transaction, including this session's
+    db.session.close()
+    engine = db.engine
+    invalid = invalid_indexes(engine, table)
+    existing = {index["name"] for index in inspect(engine).get_indexes(table.name)} - invalid
+    created = []
+    for index in sorted(table.indexes, key=lambda ix: ix.name):
+        if index.name in existing:
+            continue
+        logger.info("Creating index %s ...", index.name)
+        ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect))
+        if engine.dialect.name == "postgresql":
+            # CONCURRENTLY cannot run inside a transaction block
+            ddl = ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+        with ddl_connection(engine) as conn:
+            if index.name in invalid:
+                logger.warning("Dropping invalid index %s ...", index.name)
+                conn.exec_driver_sql(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}")
+            conn.exec_driver_sql(ddl)
+        created.append(index.name)
+    return created
+
+
+def invalid_indexes(engine, table=Promotion.__table__):
+    """Returns the names of the indexes on a table that a failed concurrent build left INVALID"""
+    # other databases build indexes in a transaction and never leave one half built
+    if engine.dialect.name != "postgresql":
+        return set()
+    stmt = db.text(
+        "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE i.indrelid = CAST(:table AS regclass) AND NOT i.indisvalid"
+    )
+    with engine.connect() as conn:
+        return set(conn.scalars(stmt, {"table": table.name}))
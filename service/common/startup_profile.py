@@ -0,0 +1,56 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Startup Profile
+
+Times the phases of create_app() (imports, Api construction, route
+registration, the database check) so slow worker boots can be traced to
+the phase responsible. With STARTUP_PROFILE=true the timings are logged
+once the app is created; they are always kept on the app as
+app.extensions["startup_profile"].
+"""
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Wall-clock time spent in each named startup phase"""
+
+    def __init__(self):
+        self.phases = {}
+
+    def add(self, name, seconds):
+        """Adds seconds measured elsewhere to the named phase"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """Adds the time spent in the with block to the named phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def total(self):
+        """Returns the seconds spent in all phases"""
+        return sum(self.phases.values())
+
+    def report(self):
+        """Returns the phase timings as one line of milliseconds"""
+        timings = [f"{name} {seconds * 1000:.1f}ms" for name, seconds in self.phases.items()]
+        return f"Startup took {self.total() * 1000:.1f}ms: " + ", ".join(timings)
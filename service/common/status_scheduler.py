@@ -0,0 +1,216 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Promotion Status Scheduler
+
+Keeps Promotion.status in step with the calendar. Each sweep deactivates
+the active promotions whose end_date has passed, then activates the
+inactive ones whose start_date arrived since the previous sweep and that
+have not ended. Both are set-based UPDATEs of at most batch_size rows,
+repeated until nothing is left, so no transaction holds many row locks.
+
+Only the start_date arriving turns a promotion on: the last day a sweep
+activated through is kept in the status_sweep table, so a promotion
+deactivated by hand once it has started stays off. The first sweep only
+activates promotions starting that day.
+
+Each sweep then prunes the change feed's tombstones of promotions deleted
+more than retention_days ago, batch_size at a time. The last one pruned is
+kept in status_sweep too, so clients reading the feed from before it can
+be told to start again.
+
+Every gunicorn worker runs the scheduler on a thread, and every instance
+of the service runs its workers, but a sweep only goes ahead while it
+holds a PostgreSQL advisory lock, so one of them sweeps at a time and the
+others skip their turn.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import text
+from service.common.metrics import (
+    STATUS_SWEEP_LAST_SUCCESS,
+    STATUS_SWEEP_PROMOTIONS,
+    STATUS_SWEEP_RUNS,
+    STATUS_SWEEP_SECONDS,
+)
+from service.models import Promotion, PromotionTombstone, StatusSweep, db
+
+logger = logging.getLogger("flask.app")
+
+# the advisory lock key every instance sweeps under, "prom" in ASCII
+LOCK_KEY = 0x70726F6D
+
+
+@contextmanager
+def advisory_lock(engine, key):
+    """Holds a session-level PostgreSQL advisory lock while it can be taken
+
+    The lock lives on a connection of its own for the whole block and is
+    released with it even if the process dies. Other databases have no
+    advisory locks and always get it.
+
+    Yields:
+        bool: whether this process holds the lock
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    with engine.connect() as conn:
+        locked = conn.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": key})
+        conn.commit()
+        try:
+            yield locked
+        finally:
+            if locked:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": key})
+                conn.commit()
+
+
+class StatusScheduler:
+    """Periodically activates and deactivates Promotions by date"""
+
+    def __init__(self, interval=60.0, batch_size=1000, retention_days=30.0):
+        """
+        Args:
+            interval (float): seconds between sweeps
+            batch_size (int): the most Promotions one UPDATE changes
+            retention_days (float): days tombstones are kept for, 0 for ever
+        """
+        self.interval = interval
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.enabled = True
+        self._app = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def init_app(self, app):
+        """Reads the scheduler settings from the Flask app config"""
+        self._app = app
+        self.enabled = app.config.get("STATUS_SCHEDULER_ENABLED", True)
+        self.interval = app.config.get("STATUS_SCHEDULER_INTERVAL", self.interval)
+        self.batch_size = app.config.get("STATUS_SCHEDULER_BATCH_SIZE", self.batch_size)
+        self.retention_days = app.config.get("CHANGE_FEED_RETENTION_DAYS", self.retention_days)
+
+    ##################################################
+    # Background thread
+    ##################################################
+
+    def start(self):
+        """Starts sweeping on a thread, once per process
+
+        Returns:
+            bool: whether the thread is running
+        """
+        if not self.enabled or self._app is None:
+            return False
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._loop, name="status-scheduler", daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        """Stops the thread after the sweep in progress"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _loop(self):
+        while True:
+            with self._app.app_context():
+                try:
+                    self.run_once()
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception("Status sweep failed")
+                finally:
+                    db.session.remove()
+            if self._stopping.wait(self.interval):
+                return
+
+    ##################################################
+    # Sweeping
+    ##################################################
+
+    def run_once(self, today=None):
+        """Sweeps once, unless another process is sweeping
+
+        Args:
+            today (date): the day to sweep for, today by default
+
+        Returns:
+            dict: the number of Promotions deactivated and activated and of
+            tombstones pruned, or None when another process held the lock
+        """
+        today = today or date.today()
+        started = time.perf_counter()
+        with advisory_lock(db.engine, LOCK_KEY) as locked:
+            if not locked:
+                STATUS_SWEEP_RUNS.labels("skipped").inc()
+                logger.debug("Status sweep skipped: another process holds the lock")
+                return None
+            try:
+                result = self._sweep(today)
+            except Exception:
+                STATUS_SWEEP_RUNS.labels("failed").inc()
+                raise
+        STATUS_SWEEP_RUNS.labels("ran").inc()
+        STATUS_SWEEP_SECONDS.observe(time.perf_counter() - started)
+        STATUS_SWEEP_LAST_SUCCESS.set_to_current_time()
+        for action, count in result.items():
+            STATUS_SWEEP_PROMOTIONS.labels(action).inc(count)
+        if any(result.values()):
+            logger.info("Status sweep for %s: %d deactivated, %d activated, %d pruned", today, *result.values())
+        return result
+
+    def _sweep(self, today):
+        """Deactivates expired Promotions, activates started ones and prunes old tombstones"""
+        deactivated = self._in_batches(False, ends_before=today - timedelta(days=1))
+        activated_through = StatusSweep.load() or today - timedelta(days=1)
+        activated = 0
+        if activated_through < today:
+            activated = self._in_batches(True, starts_after=activated_through + timedelta(days=1), active_on=today)
+            StatusSweep.save(today)
+        pruned = 0
+        if self.retention_days > 0:
+            pruned = self._prune(datetime.now(timezone.utc) - timedelta(days=self.retention_days))
+        return {"deactivated": deactivated, "activated": activated, "pruned": pruned}
+
+    def _in_batches(self, new_status, **filters):
+        """Sets the status of every matching Promotion, batch_size at a time"""
+        total = 0
+        while True:
+            changed = Promotion.set_status_where(new_status, limit=self.batch_size, **filters)
+            total += len(changed)
+            if len(changed) < self.batch_size:
+                return total
+
+    def _prune(self, before):
+        """Deletes every tombstone from before a time, batch_size at a time"""
+        total = 0
+        while True:
+            pruned = PromotionTombstone.prune(before, self.batch_size)
+            total += pruned
+            if pruned < self.batch_size:
+                return total
+
+
+# Shared scheduler, configured from the app by init_app() and started in each gunicorn worker
+status_scheduler = StatusScheduler()
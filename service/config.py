@@ -13,7 +13,104 @@ DATABASE_URI = os.getenv(
 # Configure SQLAlchemy
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
-# SQLALCHEMY_POOL_SIZE = 2
+
+# Connection pool, per worker process. Every gunicorn worker holds up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) under the server's max_connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# seconds to wait for a free connection before failing the request
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# seconds before a connection is replaced, and whether it is tested on checkout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# milliseconds before PostgreSQL cancels a statement, 0 to disable; COPY and index builds lift it
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "30000"))
+
+
+def engine_options(uri):
+    """Returns the SQLAlchemy engine options for a database URI"""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if not uri.startswith("sqlite"):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    if uri.startswith("postgresql") and DB_STATEMENT_TIMEOUT:
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"}
+    return options
+
+
+SQLALCHEMY_ENGINE_OPTIONS = engine_options(DATABASE_URI)
+
+# Optional read replica for list, lookup, search and stats queries; writes always
+# go to DATABASE_URI. A client that writes reads from DATABASE_URI for the next
+# READ_REPLICA_STICKY_SECONDS so it sees its own changes despite replication lag.
+DATABASE_REPLICA_URI = os.getenv("DATABASE_REPLICA_URI", "")
+READ_REPLICA_STICKY_SECONDS = float(os.getenv("READ_REPLICA_STICKY_SECONDS", "5"))
+SQLALCHEMY_BINDS = {}
+if DATABASE_REPLICA_URI:
+    SQLALCHEMY_BINDS["replica"] = {"url": DATABASE_REPLICA_URI, **engine_options(DATABASE_REPLICA_URI)}
+
+# Requests running more SQL statements than this log a warning; QUERY_COUNT_HEADER
+# adds the count to every response as X-Query-Count (always on in debug mode)
+QUERY_COUNT_WARN = int(os.getenv("QUERY_COUNT_WARN", "20"))
+QUERY_COUNT_HEADER = os.getenv("QUERY_COUNT_HEADER", "false").lower() == "true"
+
+# Check that the schema exists when the app starts (`flask db-init` creates it)
+DB_SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "true").lower() == "true"
+
+# Log how long each phase of create_app() took
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "false").lower() == "true"
+
+# Keyset pagination for the promotions collection
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+
+# Rows fetched per server-side cursor round trip when streaming NDJSON
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "1000"))
+
+# Largest number of promotions accepted by one batch create
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "5000"))
+
+# In-process index of active promotions behind GET /api/promotions/active
+ACTIVE_INDEX_ENABLED = os.getenv("ACTIVE_INDEX_ENABLED", "true").lower() == "true"
+ACTIVE_INDEX_MAX_AGE = float(os.getenv("ACTIVE_INDEX_MAX_AGE", "60"))
+
+# In-process name index behind GET /api/promotions/search; it is reloaded in the background
+NAME_INDEX_ENABLED = os.getenv("NAME_INDEX_ENABLED", "true").lower() == "true"
+NAME_INDEX_MAX_AGE = float(os.getenv("NAME_INDEX_MAX_AGE", "300"))
+SEARCH_LIMIT_DEFAULT = int(os.getenv("SEARCH_LIMIT_DEFAULT", "10"))
+SEARCH_LIMIT_MAX = int(os.getenv("SEARCH_LIMIT_MAX", "100"))
+
+# Read-through cache in front of Promotion.find()
+PROMOTION_CACHE_ENABLED = os.getenv("PROMOTION_CACHE_ENABLED", "true").lower() == "true"
+PROMOTION_CACHE_SIZE = int(os.getenv("PROMOTION_CACHE_SIZE", "1024"))
+PROMOTION_CACHE_TTL = float(os.getenv("PROMOTION_CACHE_TTL", "30"))
+
+# Cache of GET /api/promotions/stats results, cleared by every write
+STATS_CACHE_ENABLED = os.getenv("STATS_CACHE_ENABLED", "true").lower() == "true"
+STATS_CACHE_SIZE = int(os.getenv("STATS_CACHE_SIZE", "256"))
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "30"))
+
+# Every STATUS_SCHEDULER_INTERVAL seconds one instance deactivates expired promotions
+# and activates those whose start_date has arrived, STATUS_SCHEDULER_BATCH_SIZE rows
+# per UPDATE. It runs in gunicorn workers, or once with `flask promotions-sweep`.
+STATUS_SCHEDULER_ENABLED = os.getenv("STATUS_SCHEDULER_ENABLED", "true").lower() == "true"
+STATUS_SCHEDULER_INTERVAL = float(os.getenv("STATUS_SCHEDULER_INTERVAL", "60"))
+STATUS_SCHEDULER_BATCH_SIZE = int(os.getenv("STATUS_SCHEDULER_BATCH_SIZE", "1000"))
+
+# Each sweep also prunes the change feed's tombstones of promotions deleted more than
+# CHANGE_FEED_RETENTION_DAYS ago; 0 keeps them forever
+CHANGE_FEED_RETENTION_DAYS = float(os.getenv("CHANGE_FEED_RETENTION_DAYS", "30"))
+
+# Encode responses with orjson when it is installed
+ORJSON_ENABLED = os.getenv("ORJSON_ENABLED", "true").lower() == "true"
+
+# Largest number of cart lines priced in one request
+PRICING_MAX_LINES = int(os.getenv("PRICING_MAX_LINES", "20000"))
 
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
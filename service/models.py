@@ -4,22 +4,66 @@ Models for YourResourceModel
 All of the models are stored in this module
 """
 
+import hashlib
 import logging
+import math
 from enum import Enum
 from datetime import date
+import numpy as np
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, exc, tuple_
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.exc import StaleDataError
+from service.common.active_index import ActiveIndex, Entry
+from service.common.name_index import NameIndex
+from service.common.promotion_cache import PromotionCache
+from service.common.read_replica import REPLICA_READ, RoutingSession, must_read_primary
+from service.common.serializer import FIELDS, encoder
 
 
 logger = logging.getLogger("flask.app")
 
 # Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 
 class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
+class DataConflictError(DataValidationError):
+    """Used when another request changed or removed a row since it was read"""
+
+
+def cache_usable(cache):
+    """Returns True when a read may be answered from cache, which replica reads fill too"""
+    return cache.enabled and not must_read_primary(db.session())
+
+
+def make_etag(promotion_id, version):
+    """Returns the strong ETag of one version of a Promotion"""
+    return f'"{promotion_id}-{version}"'
+
+
+def make_page_etag(versions):
+    """Returns a strong ETag for a list of Promotions from their (id, version) pairs"""
+    digest = hashlib.sha1(usedforsecurity=False)
+    for promotion_id, version in versions:
+        digest.update(f"{promotion_id}-{version},".encode("ascii"))
+    return f'"{digest.hexdigest()}"'
+
+
+# The range of the INTEGER columns id and product_id
+INT4_MIN, INT4_MAX = -(2**31), 2**31 - 1
+
+# Columns a page of Promotions can be sorted by, "-" prefixed for descending
+SORT_KEYS = ("id", "name", "product_id", "amount", "start_date", "end_date")
+
+# Columns Promotion.stats() can group by; dates are grouped into STATS_BUCKETS
+STATS_DIMENSIONS = ("promo_type", "status", "product_id", "start_date", "end_date")
+STATS_BUCKETS = ("day", "month", "year")
+
+
 class PromoType(Enum):
     """Enumeration of valid Promotion Types"""
 
@@ -28,12 +72,41 @@ class PromoType(Enum):
     AMOUNT_OFF = "AMOUNT_OFF"
 
 
-class Promotion(db.Model):  # pylint: disable=too-many-instance-attributes
+class Promotion(db.Model):  # pylint: disable=too-many-instance-attributes, too-many-public-methods
     """Class that represents a Promotion"""
 
     ##################################################
     # Table Schema
     ##################################################
+    # Indexes are shaped to the queries the service runs:
+    #   - product lookups filtered by status and date window
+    #   - find_by_type() and find_by_name()
+    #   - pages sorted by date or amount, keyed on (column, id)
+    #   - the status scheduler's search for active promotions that have ended,
+    #     which leave the partial index once they are deactivated
+    #   - the change feed, read in (change_seq, id) order
+    __table_args__ = (
+        db.Index(
+            "ix_promotion_product_status_dates",
+            "product_id",
+            "status",
+            "start_date",
+            "end_date",
+        ),
+        db.Index("ix_promotion_promo_type", "promo_type"),
+        db.Index("ix_promotion_name", "name"),
+        db.Index("ix_promotion_start_date_id", "start_date", "id"),
+        db.Index("ix_promotion_end_date_id", "end_date", "id"),
+        db.Index("ix_promotion_amount_id", "amount", "id"),
+        db.Index(
+            "ix_promotion_active_end_date",
+            "end_date",
+            postgresql_where=db.text("status IS true"),
+            sqlite_where=db.text("status IS 1"),
+        ),
+        db.Index("ix_promotion_change_seq_id", "change_seq", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(63), nullable=False)
     promo_type = db.Column(db.String(20), nullable=False)
@@ -42,6 +115,12 @@ class Promotion(db.Model):  # pylint: disable=too-many-instance-attributes
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
     status = db.Column(db.Boolean, nullable=False, default=True)
+    # bumped by every UPDATE, so (id, version) identifies one state of a row
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    # the next_change_seq() of the transaction that last wrote the row, 0 before the change feed
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
+
+    __mapper_args__ = {"version_id_col": version}
 
     # probably need to add how much off, etc field here or incorporate it into promo_type
 
@@ -59,27 +138,120 @@ class Promotion(db.Model):  # pylint: disable=too-many-instance-attributes
             db.session.rollback()
             logger.error("Error creating Promotion: %s", self)
             raise DataValidationError(e) from e
+        self._written()
+
+    def insert_row(self):
+        """Returns this Promotion's column values for a bulk INSERT, filling in defaults"""
+        row = {}
+        for column in self.__table__.columns:
+            if column.primary_key:
+                continue
+            value = getattr(self, column.key)
+            if value is None and column.default is not None and column.default.is_scalar:
+                value = column.default.arg
+                setattr(self, column.key, value)
+            row[column.key] = value
+        return row
+
+    @classmethod
+    def create_many(cls, promotions):
+        """Creates many Promotions with a multi-row INSERT in one transaction, all or none"""
+        logger.info("Creating %d Promotions", len(promotions))
+        if not promotions:
+            return promotions
+        rows = [promotion.insert_row() for promotion in promotions]
+        stmt = db.insert(cls).returning(cls.id, sort_by_parameter_order=True)
+        try:
+            seq = next_change_seq()
+            for promotion, row in zip(promotions, rows):
+                promotion.change_seq = row["change_seq"] = seq
+            ids = db.session.scalars(stmt, rows).all()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error creating %d Promotions", len(promotions))
+            raise DataValidationError(e) from e
+        for promotion, new_id in zip(promotions, ids):
+            promotion.id = new_id
+            promotion._written()
+        return promotions
+
+    @classmethod
+    def create_each(cls, promotions):
+        """Creates Promotions in one transaction, each under its own SAVEPOINT, and returns an error or None for each"""
+        logger.info("Creating %d Promotions one by one", len(promotions))
+        errors = []
+        try:
+            seq = next_change_seq()
+            for promotion in promotions:
+                row = promotion.insert_row()
+                promotion.change_seq = row["change_seq"] = seq
+                try:
+                    with db.session.begin_nested():
+                        promotion.id = db.session.scalar(db.insert(cls).values(row).returning(cls.id))
+                    errors.append(None)
+                except exc.DBAPIError as error:
+                    errors.append(str(error.orig).strip())
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error creating %d Promotions one by one", len(promotions))
+            raise DataValidationError(e) from e
+        for promotion, error in zip(promotions, errors):
+            if error is None:
+                promotion._written()
+        return errors
+
+    def _written(self):
+        """Brings the active and name indexes and the cache up to date with this Promotion"""
+        promotion_cache.invalidate(self.id)
+        stats_cache.invalidate_all()
+        name_index.upsert(self.id, self.name)
+        active_index.upsert(
+            self.id,
+            self.name,
+            self.promo_type,
+            self.product_id,
+            self.amount,
+            self.start_date,
+            self.end_date,
+            self.status,
+        )
 
     def update(self):
         """Updates a Promotion in the database"""
         logger.info("Saving %s", self.name)
         try:
             db.session.commit()
+        except StaleDataError as e:
+            db.session.rollback()
+            logger.warning("Promotion %s was changed by another request", self.id)
+            raise DataConflictError(f"Promotion {self.id} was changed by another request, read it again.") from e
         except Exception as e:
             db.session.rollback()
             logger.error("Error updating Promotion: %s", self)
             raise DataValidationError(e) from e
+        self._written()
 
     def delete(self):
         """Removes a Promotion from the data store"""
         logger.info("Deleting %s", self.name)
+        promotion_id = self.id
         try:
             db.session.delete(self)
             db.session.commit()
+        except StaleDataError as e:
+            db.session.rollback()
+            logger.warning("Promotion %s was changed by another request", promotion_id)
+            raise DataConflictError(f"Promotion {promotion_id} was changed by another request, read it again.") from e
         except Exception as e:
             db.session.rollback()
             logger.error("Error deleting Promotion: %s", self)
             raise DataValidationError(e) from e
+        promotion_cache.invalidate(promotion_id)
+        stats_cache.invalidate_all()
+        active_index.remove(promotion_id)
+        name_index.remove(promotion_id)
 
     def serialize(self):
         """Serializes a Promotion into a dictionary"""
@@ -94,6 +266,22 @@ class Promotion(db.Model):  # pylint: disable=too-many-instance-attributes
             "status": self.status,
         }
 
+    @property
+    def etag(self):
+        """Returns the strong ETag of this Promotion's current version"""
+        return make_etag(self.id, self.version)
+
+    def to_json(self):
+        """Serializes a Promotion into JSON bytes"""
+        return encoder.encode_row(tuple(getattr(self, name) for name in FIELDS))
+
+    def _cache(self):
+        """Puts this Promotion in the cache and returns its JSON body"""
+        values = {column.key: getattr(self, column.key) for column in self.__table__.columns}
+        body = self.to_json()
+        promotion_cache.put(self.id, values, body)
+        return body
+
     def deserialize(self, data):
         """
         Deserializes a Promotion from a dictionary
@@ -101,17 +289,33 @@ class Promotion(db.Model):  # pylint: disable=too-many-instance-attributes
         Args:
             data (dict): A dictionary containing the resource data
         """
+        values = self.clean(data)
+        try:
+            for key, value in values.items():
+                setattr(self, key, value)
+        except AttributeError as error:
+            raise DataValidationError("Invalid attribute: " + error.args[0]) from error
+        return self
+
+    @staticmethod
+    def clean(data):
+        """Returns the column values of a Promotion dictionary, checked the way deserialize() checks them"""
         try:
-            self.name = data["name"]
             promo_type = data["promo_type"]
             if promo_type not in PromoType.__members__:
                 raise DataValidationError(f"Invalid promo_type: {promo_type}")
-            self.promo_type = promo_type
-            self.product_id = int(data["product_id"])
-            self.amount = float(data["amount"])
-            self.start_date = date.fromisoformat(data["start_date"])
-            self.end_date = date.fromisoformat(data["end_date"])
-            self.status = bool(data.get("status", True))
+            values = {
+                "name": data["name"],
+                "promo_type": promo_type,
+                "product_id": int(data["product_id"]),
+                "amount": float(data["amount"]),
+                "start_date": date.fromisoformat(data["start_date"]),
+                "end_date": date.fromisoformat(data["end_date"]),
+                "status": bool(data.get("status", True)),
+            }
+            if not math.isfinite(values["amount"]):
+                raise DataValidationError(f"Invalid Promotion: amount must be a finite number, not {values['amount']}")
+            return values
         except AttributeError as error:
             raise DataValidationError("Invalid attribute: " + error.args[0]) from error
         except KeyError as error:
@@ -122,7 +326,6 @@ class Promotion(db.Model):  # pylint: disable=too-many-instance-attributes
             raise DataValidationError(
                 "Invalid Promotion: bad or malformed data " + str(error)
             ) from error
-        return self
 
     ##################################################
     # CLASS METHODS
@@ -132,13 +335,59 @@ class Promotion(db.Model):  # pylint: disable=too-many-instance-attributes
     def all(cls):
         """Returns all Promotions in the database"""
         logger.info("Processing all Promotions")
-        return cls.query.all()
+        return db.session.scalars(db.select(cls), bind_arguments=REPLICA_READ).all()
 
     @classmethod
-    def find(cls, by_id):
-        """Finds a Promotion by its ID"""
+    def find(cls, by_id, cached=True):
+        """Finds a Promotion by its ID, through the cache unless cached is False"""
         logger.info("Processing lookup for id %s ...", by_id)
-        return cls.query.session.get(cls, by_id)
+        if not cached:
+            return cls.query.session.get(cls, by_id, populate_existing=True)
+        entry = cls._current_entry(by_id)
+        if entry is not None:
+            promotion = cls(**entry.values)
+            make_transient_to_detached(promotion)
+            return db.session.merge(promotion, load=False)
+        promotion = db.session.get(cls, by_id, bind_arguments=REPLICA_READ)
+        if promotion is not None and promotion_cache.enabled:
+            promotion._cache()
+        return promotion
+
+    @classmethod
+    def find_json(cls, by_id):
+        """Returns the (body, ETag) of a Promotion by its ID, or None"""
+        logger.info("Processing JSON lookup for id %s ...", by_id)
+        entry = cls._current_entry(by_id)
+        if entry is not None:
+            return entry.body, make_etag(by_id, entry.values["version"])
+        promotion = db.session.get(cls, by_id, bind_arguments=REPLICA_READ)
+        if promotion is None:
+            return None
+        return promotion._cache() if promotion_cache.enabled else promotion.to_json(), promotion.etag
+
+    @classmethod
+    def find_etag(cls, by_id):
+        """Returns the ETag of a Promotion by its ID without loading the row, or None"""
+        logger.info("Processing version lookup for id %s ...", by_id)
+        version = cls._version(by_id)
+        return make_etag(by_id, version) if version is not None else None
+
+    @classmethod
+    def _version(cls, by_id):
+        """Returns the version of a Promotion, or None if it was not found"""
+        return db.session.scalar(db.select(cls.version).where(cls.id == by_id), bind_arguments=REPLICA_READ)
+
+    @classmethod
+    def _current_entry(cls, by_id):
+        """Returns the cache entry of a Promotion if it holds the row's current version"""
+        entry = promotion_cache.get(by_id) if cache_usable(promotion_cache) else None
+        if entry is None:
+            return None
+        # every write bumps the version, so this catches writes other workers made
+        if cls._version(by_id) != entry.values["version"]:
+            promotion_cache.invalidate(by_id)
+            return None
+        return entry
 
     @classmethod
     def find_by_name(cls, name):
@@ -148,9 +397,477 @@ class Promotion(db.Model):  # pylint: disable=too-many-instance-attributes
             name (string): the name of the Promotions to match
         """
         logger.info("Processing name query for %s ...", name)
-        return cls.query.filter(cls.name == name).all()
+        return db.session.scalars(db.select(cls).where(cls.name == name), bind_arguments=REPLICA_READ).all()
+
+    @classmethod
+    def search(cls, query, limit):
+        """Returns the serial_columns() of the Promotions whose names best match a query, best first"""
+        logger.info("Processing name search for %s ...", query)
+        if not name_index.enabled:
+            pattern = query.strip().lower()
+            lowered = db.func.lower(cls.name)
+            stmt = (
+                db.select(*cls.serial_columns())
+                .where(lowered.contains(pattern, autoescape=True))
+                .order_by(db.case((lowered == pattern, 0), (lowered.startswith(pattern, autoescape=True), 1), else_=2))
+                .order_by(cls.name, cls.id)
+                .limit(limit)
+            )
+            return db.session.execute(stmt, bind_arguments=REPLICA_READ).all()
+        ids = name_index.search(query, limit)
+        if not ids:
+            return []
+        stmt = db.select(*cls.serial_columns()).where(cls.id.in_(ids))
+        rows = {row.id: row for row in db.session.execute(stmt, bind_arguments=REPLICA_READ)}
+        return [rows[pid] for pid in ids if pid in rows]
+
+    @classmethod
+    def name_rows(cls):
+        """Returns the id and name of every Promotion as a streamed result"""
+        logger.info("Loading Promotion names for the name index ...")
+        return db.session.execute(db.select(cls.id, cls.name).execution_options(yield_per=10000))
 
     @classmethod
     def find_by_type(cls, promo_type):
         """Returns all promotions that match the given type"""
-        return cls.query.filter_by(promo_type=promo_type).all()
+        stmt = db.select(cls).where(cls.promo_type == promo_type)
+        return db.session.scalars(stmt, bind_arguments=REPLICA_READ).all()
+
+    @classmethod
+    def filter_clauses(cls, **filters):
+        """Returns the SQL WHERE clauses for a set of Promotion filters"""
+        clauses = []
+        if filters.get("ids"):
+            clauses.append(cls.id.in_(filters["ids"]))
+        if filters.get("product_ids"):
+            clauses.append(cls.product_id.in_(filters["product_ids"]))
+        if filters.get("active_on"):
+            clauses.append(cls.start_date <= filters["active_on"])
+            clauses.append(cls.end_date >= filters["active_on"])
+        comparisons = {
+            "promo_type": cls.promo_type.__eq__,
+            "starts_after": cls.start_date.__ge__,
+            "ends_before": cls.end_date.__le__,
+            "status": cls.status.is_,
+            "amount_min": cls.amount.__ge__,
+            "amount_max": cls.amount.__le__,
+            "name": cls.name.__eq__,
+        }
+        for name, compare in comparisons.items():
+            if filters.get(name) is not None:
+                clauses.append(compare(filters[name]))
+        return clauses
+
+    @classmethod
+    def set_status_where(cls, new_status, limit=None, **filters):
+        """Sets the status of up to limit Promotions matching the filters and returns the ids that changed"""
+        logger.info("Setting status=%s where %s", new_status, filters)
+        # status is never NULL; "IS true" lets PostgreSQL use ix_promotion_active_end_date
+        where = [*cls.filter_clauses(**filters), cls.status.is_(not new_status)]
+        if limit is not None:
+            # a CTE runs once; a subquery may be rescanned per row, locking a new batch each time
+            batch = db.select(cls.id).where(*where).limit(limit).with_for_update(skip_locked=True)
+            where = [cls.id.in_(db.select(batch.cte("batch").c.id))]
+        stmt = (
+            db.update(cls)
+            .where(*where)
+            .values(status=new_status, version=cls.version + 1)
+            .returning(*cls.index_columns())
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            rows = db.session.execute(stmt.values(change_seq=next_change_seq())).all()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error setting status where %s", filters)
+            raise DataValidationError(e) from e
+        promotion_cache.invalidate(*(row.id for row in rows))
+        if rows:
+            stats_cache.invalidate_all()
+        for row in rows:
+            active_index.upsert(*row, new_status)
+        return sorted(row.id for row in rows)
+
+    @classmethod
+    def stats(cls, by, bucket="month", **filters):
+        """Returns Promotion counts and amounts grouped by STATS_DIMENSIONS, with dates grouped by bucket"""
+        key = (tuple(by), bucket, tuple(sorted((name, str(value)) for name, value in filters.items())))
+        entry = stats_cache.get(key) if cache_usable(stats_cache) else None
+        if entry is not None:
+            return entry.values
+        logger.info("Processing stats query by %s where %s ...", by, filters)
+        stmt = cls._stats_statement(by, bucket, **filters)
+        stats = []
+        for row in db.session.execute(stmt, bind_arguments=REPLICA_READ):
+            values = list(row)
+            group = {name: cls._stats_value(name, bucket, values) for name in by}
+            count, amount_min, amount_avg, amount_max = values
+            group.update(count=count, amount_min=amount_min, amount_avg=float(amount_avg), amount_max=amount_max)
+            stats.append(group)
+        if stats_cache.enabled:
+            stats_cache.put(key, stats, None)
+        return stats
+
+    @classmethod
+    def _stats_statement(cls, by, bucket, **filters):
+        """Returns the GROUP BY query behind stats()"""
+        groups = []
+        for name in by:
+            groups.extend(cls._stats_columns(name, bucket))
+        return (
+            db.select(
+                *groups,
+                db.func.count(cls.id),
+                db.func.min(cls.amount),
+                db.func.avg(cls.amount),
+                db.func.max(cls.amount),
+            )
+            .where(*cls.filter_clauses(**filters))
+            .group_by(*groups)
+            .order_by(*groups)
+        )
+
+    @classmethod
+    def _stats_columns(cls, name, bucket):
+        """Returns the GROUP BY expressions of a stats dimension"""
+        column = getattr(cls, name)
+        if name not in ("start_date", "end_date") or bucket == "day":
+            return [column]
+        if bucket == "month":
+            return [db.extract("year", column), db.extract("month", column)]
+        return [db.extract("year", column)]
+
+    @staticmethod
+    def _stats_value(name, bucket, values):
+        """Takes the value of a stats dimension off the front of a result row"""
+        if name not in ("start_date", "end_date"):
+            return values.pop(0)
+        if bucket == "day":
+            return values.pop(0).isoformat()
+        if bucket == "month":
+            return f"{int(values.pop(0)):04d}-{int(values.pop(0)):02d}"
+        return f"{int(values.pop(0)):04d}"
+
+    @classmethod
+    def sort_columns(cls, sort):
+        """Returns the columns a sort key orders pages by and whether it is descending"""
+        descending = sort.startswith("-")
+        name = sort[1:] if descending else sort
+        if name not in SORT_KEYS:
+            raise DataValidationError(f"sort must be one of {', '.join(SORT_KEYS)}, prefixed with '-' to reverse.")
+        if name == "id":
+            return (cls.id,), descending
+        return (getattr(cls, name), cls.id), descending
+
+    @classmethod
+    def sort_position(cls, row, sort):
+        """Returns the position of a page row under a sort key, to continue the next page from"""
+        columns, _ = cls.sort_columns(sort)
+        return tuple(getattr(row, column.key) for column in columns)
+
+    @classmethod
+    def parse_position(cls, values, sort):
+        """Turns the JSON values of a sort_position() back into column values"""
+        columns, _ = cls.sort_columns(sort)
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise DataValidationError("cursor is invalid.")
+        try:
+            position = tuple(
+                date.fromisoformat(value) if column.type.python_type is date else column.type.python_type(value)
+                for column, value in zip(columns, values)
+            )
+        except (TypeError, ValueError) as error:
+            raise DataValidationError("cursor is invalid.") from error
+        # a tampered cursor must not reach the database with an id the INTEGER columns cannot hold
+        if any(isinstance(value, int) and not INT4_MIN <= value <= INT4_MAX for value in position):
+            raise DataValidationError("cursor is invalid.")
+        return position
+
+    @classmethod
+    def page_statement(cls, columns, limit, after=None, sort="id", **filters):
+        """Returns the keyset page query shared by the find_page*() methods and the async read API"""
+        keys, descending = cls.sort_columns(sort)
+        stmt = db.select(*columns).where(*cls.filter_clauses(**filters)).limit(limit)
+        stmt = stmt.order_by(*(key.desc() for key in keys) if descending else keys)
+        if after is not None:
+            position = tuple_(*keys) if len(keys) > 1 else keys[0]
+            bound = tuple_(*after) if len(keys) > 1 else after[0]
+            stmt = stmt.where(position < bound if descending else position > bound)
+        return stmt
+
+    @classmethod
+    def find_page(cls, limit, after=None, sort="id", **filters):
+        """Returns one page of Promotions using keyset pagination"""
+        logger.info("Processing page query sorted by %s after %s ...", sort, after)
+        stmt = cls.page_statement([cls], limit, after, sort, **filters)
+        return db.session.scalars(stmt, bind_arguments=REPLICA_READ).all()
+
+    @classmethod
+    def find_page_rows(cls, limit, after=None, sort="id", **filters):
+        """Returns the same page as find_page() as serial_columns() tuples"""
+        logger.info("Processing page rows query sorted by %s after %s ...", sort, after)
+        stmt = cls.page_statement(cls.serial_columns(), limit, after, sort, **filters)
+        return db.session.execute(stmt, bind_arguments=REPLICA_READ).all()
+
+    @classmethod
+    def find_page_etag(cls, limit, after=None, sort="id", **filters):
+        """Returns the ETag of the page find_page() would return from its ids and versions alone"""
+        logger.info("Processing page version query sorted by %s after %s ...", sort, after)
+        stmt = cls.page_statement([cls.id, cls.version], limit, after, sort, **filters)
+        return make_page_etag(db.session.execute(stmt, bind_arguments=REPLICA_READ))
+
+    @classmethod
+    def serial_columns(cls):
+        """Returns the serialized columns in serializer FIELDS order, then the version"""
+        return tuple(getattr(cls, name) for name in FIELDS) + (cls.version,)
+
+    @classmethod
+    def index_columns(cls):
+        """Returns the columns the active index holds, in ActiveIndex.rebuild() order"""
+        return (
+            cls.id,
+            cls.name,
+            cls.promo_type,
+            cls.product_id,
+            cls.amount,
+            cls.start_date,
+            cls.end_date,
+        )
+
+    @classmethod
+    def active_rows(cls):
+        """Returns the index_columns() of every active Promotion as a streamed result"""
+        logger.info("Loading active Promotions for the active index ...")
+        stmt = db.select(*cls.index_columns()).where(cls.status.is_(True))
+        return db.session.execute(stmt.execution_options(yield_per=10000))
+
+    @classmethod
+    def find_active_entries(cls, product_ids, on):
+        """Returns (product_id, Entry) pairs of the active Promotions for many products on a date"""
+        if active_index.enabled:
+            return active_index.lookup_many(product_ids, on)
+        stmt = (
+            db.select(cls.product_id, cls.start_date, cls.end_date, cls.id, cls.name, cls.promo_type, cls.amount)
+            .where(cls.product_id.in_(product_ids), cls.status.is_(True), *cls.filter_clauses(active_on=on))
+            .order_by(cls.product_id, cls.start_date, cls.end_date, cls.id)
+        )
+        return [(row[0], Entry(*row[1:])) for row in db.session.execute(stmt)]
+
+    @classmethod
+    def find_active_columns(cls, product_ids, on):
+        """Returns the product_id, promo_type, amount and id arrays of the active Promotions for many products"""
+        if active_index.enabled:
+            return active_index.lookup_columns(product_ids, on)
+        entries = cls.find_active_entries(product_ids.tolist(), on)
+        return (
+            np.array([pair[0] for pair in entries], dtype=np.int64),
+            np.array([pair[1].promo_type for pair in entries], dtype=object),
+            np.array([pair[1].amount for pair in entries], dtype=np.float64),
+            np.array([pair[1].id for pair in entries], dtype=np.int64),
+        )
+
+    @classmethod
+    def find_active(cls, product_id, on):
+        """Returns the serialized active Promotions for a product on a date"""
+        return [
+            {
+                "id": entry.id,
+                "name": entry.name,
+                "promo_type": entry.promo_type,
+                "product_id": product_id,
+                "amount": entry.amount,
+                "start_date": entry.start_date.isoformat(),
+                "end_date": entry.end_date.isoformat(),
+                "status": True,
+            }
+            for _, entry in cls.find_active_entries([product_id], on)
+        ]
+
+    @classmethod
+    def stream(cls, chunk_size, sort="id", **filters):
+        """Yields the serial_columns() of every matching Promotion in sort order, chunk_size rows at a time"""
+        logger.info("Processing streamed query sorted by %s where %s ...", sort, filters)
+        stmt = cls.page_statement(cls.serial_columns(), None, None, sort, **filters)
+        result = db.session.execute(stmt.execution_options(yield_per=chunk_size), bind_arguments=REPLICA_READ)
+        yield from result.partitions()
+
+    @classmethod
+    def changes(cls, limit, after=None):
+        """Returns the (change_seq, deleted, *FIELDS) rows written or deleted after a change position, oldest first"""
+        logger.info("Processing change feed query after %s ...", after)
+        after = tuple_(*(after or (0, 0)))
+        written = db.select(cls.change_seq, db.false().label("deleted"), *(getattr(cls, name) for name in FIELDS))
+        deleted = db.select(
+            PromotionTombstone.change_seq,
+            db.true().label("deleted"),
+            PromotionTombstone.id,
+            *(db.cast(db.null(), getattr(cls, name).type).label(name) for name in FIELDS[1:]),
+        )
+        sides = [
+            written.where(tuple_(cls.change_seq, cls.id) > after).order_by(cls.change_seq, cls.id),
+            deleted.where(tuple_(PromotionTombstone.change_seq, PromotionTombstone.id) > after).order_by(
+                PromotionTombstone.change_seq, PromotionTombstone.id
+            ),
+        ]
+        if db.engine.dialect.name == "postgresql":
+            # every transaction below the snapshot's xmin has ended, so none can commit behind a returned position
+            settled = _as_bigint(db.func.pg_snapshot_xmin(db.func.pg_current_snapshot()))
+            sides = [sides[0].where(cls.change_seq < settled), sides[1].where(PromotionTombstone.change_seq < settled)]
+        # SQLite only takes a LIMIT inside a UNION from a subquery
+        sides = [db.select(side.limit(limit).subquery()) for side in sides]
+        stmt = db.union_all(*sides).order_by("change_seq", "id").limit(limit)
+        return db.session.execute(stmt, bind_arguments=REPLICA_READ).all()
+
+    @classmethod
+    def schema_ready(cls):
+        """Returns True when the Promotion table has every mapped column"""
+        db.session.connection()
+        # a SELECT ... LIMIT 0 is much cheaper than the catalog scan of db.create_all()
+        try:
+            db.session.execute(db.select(*cls.__table__.columns).limit(0))
+        except exc.DBAPIError as error:
+            logger.warning("Promotion schema check failed: %s", error.orig)
+            db.session.rollback()
+            return False
+        return True
+
+
+class StatusSweep(db.Model):
+    """The day up to which the status scheduler has activated Promotions and the last tombstone it pruned"""
+
+    id = db.Column(db.Integer, primary_key=True)
+    activated_through = db.Column(db.Date, nullable=False)
+    pruned_seq = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
+    pruned_id = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    @classmethod
+    def load(cls):
+        """Returns the last day activated, or None before the first sweep"""
+        sweep = db.session.get(cls, 1)
+        return sweep.activated_through if sweep else None
+
+    @classmethod
+    def save(cls, day):
+        """Records that Promotions starting up to day have been activated"""
+        try:
+            db.session.merge(cls(id=1, activated_through=day))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error saving the status sweep")
+            raise DataValidationError(e) from e
+
+    @classmethod
+    def pruned_through(cls):
+        """Returns the (change_seq, id) of the last tombstone pruned, (0, 0) if none"""
+        row = db.session.execute(db.select(cls.pruned_seq, cls.pruned_id).where(cls.id == 1)).first()
+        return tuple(row) if row else (0, 0)
+
+
+class ChangeCounter(db.Model):  # pylint: disable=too-few-public-methods
+    """The last change sequence number handed to a transaction that wrote Promotions, except on PostgreSQL"""
+
+    id = db.Column(db.Integer, primary_key=True)
+    seq = db.Column(db.BigInteger, nullable=False)
+
+
+# db.create_all() seeds the one counter row when it creates the table
+event.listen(ChangeCounter.__table__, "after_create", db.DDL("INSERT INTO change_counter (id, seq) VALUES (1, 0)"))
+
+
+class PromotionTombstone(db.Model):  # pylint: disable=too-few-public-methods
+    """A deleted Promotion, kept for CHANGE_FEED_RETENTION_DAYS so the change feed can report the delete"""
+
+    change_seq = db.Column(db.BigInteger, primary_key=True)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    deleted_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now(), index=True)
+
+    @classmethod
+    def prune(cls, before, limit):
+        """Deletes up to limit tombstones from before a time, records the last one in StatusSweep and returns how many"""
+        logger.info("Pruning tombstones from before %s", before)
+        batch = db.select(cls.change_seq, cls.id).where(cls.deleted_at < before).order_by(cls.deleted_at).limit(limit)
+        batch = batch.cte("batch")
+        stmt = (
+            db.delete(cls)
+            .where(tuple_(cls.change_seq, cls.id).in_(db.select(batch.c.change_seq, batch.c.id)))
+            .returning(cls.change_seq, cls.id)
+            .execution_options(synchronize_session=False)
+        )
+        try:
+            pruned = [tuple(row) for row in db.session.execute(stmt)]
+            if pruned:
+                # clients behind the last tombstone pruned may have missed a delete
+                last = max(pruned)
+                db.session.execute(
+                    db.update(StatusSweep)
+                    .where(StatusSweep.id == 1, tuple_(StatusSweep.pruned_seq, StatusSweep.pruned_id) < tuple_(*last))
+                    .values(pruned_seq=last[0], pruned_id=last[1])
+                    .execution_options(synchronize_session=False)
+                )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error pruning tombstones from before %s", before)
+            raise DataValidationError(e) from e
+        return len(pruned)
+
+
+# session.info key holding the change sequence number of the session's transaction
+_CHANGE_SEQ = "change_seq"
+
+
+def _as_bigint(xid8):
+    """Returns a PostgreSQL xid8 expression as a BIGINT"""
+    return db.cast(db.cast(xid8, db.Text), db.BigInteger)
+
+
+def next_change_seq(session=None):
+    """Returns the change sequence number of the session's transaction, its id on PostgreSQL"""
+    session = session or db.session()
+    seq = session.info.get(_CHANGE_SEQ)
+    if seq is None:
+        if session.get_bind().dialect.name == "postgresql":
+            stmt = db.select(_as_bigint(db.func.pg_current_xact_id()))
+        else:
+            # the counter row stays locked until the transaction ends, so they commit in sequence order
+            counter = ChangeCounter.__table__
+            stmt = db.update(counter).where(counter.c.id == 1).values(seq=counter.c.seq + 1).returning(counter.c.seq)
+        seq = session.info[_CHANGE_SEQ] = session.execute(stmt).scalar_one()
+    return seq
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def _stamp_changes(session, _flush_context, _instances):
+    """Gives the Promotions a flush writes the transaction's change sequence number and records its deletes"""
+    written = [obj for obj in session.new if isinstance(obj, Promotion)]
+    written += [obj for obj in session.dirty if isinstance(obj, Promotion) and session.is_modified(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Promotion)]
+    if not written and not deleted:
+        return
+    seq = next_change_seq(session)
+    for promotion in written:
+        promotion.change_seq = seq
+    for promotion in deleted:
+        session.add(PromotionTombstone(change_seq=seq, id=promotion.id))
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _forget_change_seq(session, transaction):
+    """Lets the session's next transaction take a new change sequence number"""
+    if transaction.parent is None:
+        session.info.pop(_CHANGE_SEQ, None)
+
+
+# In-process index of active promotions, loaded from the Promotion table
+active_index = ActiveIndex(loader=Promotion.active_rows)
+
+# In-process index of promotion names behind Promotion.search()
+name_index = NameIndex(loader=Promotion.name_rows)
+
+# In-process read-through cache in front of Promotion.find(), sized by PROMOTION_CACHE_SIZE
+promotion_cache = PromotionCache()
+
+# Cache of Promotion.stats() results, sized by STATS_CACHE_SIZE
+stats_cache = PromotionCache(prefix="STATS_CACHE")
@@ -0,0 +1,199 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Cart Pricing
+
+Applies the active Promotions to carts of (product_id, quantity,
+unit_price) lines. Every line of every cart in a request is priced in one
+pass of NumPy array arithmetic:
+
+    PERCENT_OFF  amount percent off the line subtotal
+    AMOUNT_OFF   amount off each unit, never more than the unit price
+    BOGO         buy one get one free: every second unit is free
+
+A line may match several promotions. They do not stack: the line gets the
+single promotion that saves the most.
+"""
+import math
+import numpy as np
+from service.models import INT4_MAX, INT4_MIN, DataValidationError, PromoType, Promotion
+
+PERCENT_OFF, AMOUNT_OFF, BOGO = range(3)
+TYPE_CODES = {
+    PromoType.PERCENT_OFF.name: PERCENT_OFF,
+    PromoType.AMOUNT_OFF.name: AMOUNT_OFF,
+    PromoType.BOGO.name: BOGO,
+}
+
+
+def whole_number(value, name, low, high):
+    """Returns a cart line value as an int, rejecting fractions and values outside low..high"""
+    number = int(value)
+    if not isinstance(value, str) and number != value:
+        raise DataValidationError(f"Invalid cart line: {name} must be a whole number")
+    if not low <= number <= high:
+        raise DataValidationError(f"Invalid cart line: {name} must be between {low} and {high}")
+    return number
+
+
+def clean_line(line):
+    """Returns the product_id, quantity and unit_price of a cart line
+
+    Raises:
+        DataValidationError: when one is missing, malformed or out of range
+    """
+    product_id = whole_number(line["product_id"], "product_id", INT4_MIN, INT4_MAX)
+    quantity = whole_number(line["quantity"], "quantity", 1, INT4_MAX)
+    unit_price = float(line["unit_price"])
+    if not math.isfinite(unit_price) or unit_price < 0:
+        raise DataValidationError("Invalid cart line: unit_price must be a finite number, not negative")
+    return product_id, quantity, unit_price
+
+
+def to_arrays(carts):
+    """Flattens carts into per-line arrays
+
+    Args:
+        carts (list): carts, each a list of line dictionaries
+
+    Returns:
+        tuple: cart index, product_id, quantity and unit_price arrays
+    """
+    try:
+        rows = [(cart_index, *clean_line(line)) for cart_index, lines in enumerate(carts) for line in lines]
+    except KeyError as error:
+        raise DataValidationError("Invalid cart line: missing " + error.args[0]) from error
+    except (TypeError, ValueError, OverflowError) as error:
+        raise DataValidationError("Invalid cart line: bad or malformed data " + str(error)) from error
+
+    table = np.array(rows, dtype=np.float64).reshape(-1, 4)
+    cart_index = table[:, 0].astype(np.int64)
+    product_ids = table[:, 1].astype(np.int64)
+    quantities = table[:, 2]
+    unit_prices = table[:, 3]
+    return cart_index, product_ids, quantities, unit_prices
+
+
+def find_candidates(product_ids, on):
+    """Returns the active promotions for the given products as arrays sorted by product
+
+    Returns:
+        tuple: product_id, type code, amount and promotion id arrays
+    """
+    products, promo_types, amounts, ids = Promotion.find_active_columns(np.unique(product_ids), on)
+    type_codes = np.array([TYPE_CODES[promo_type] for promo_type in promo_types.tolist()], dtype=np.int64)
+    return products, type_codes, amounts, ids
+
+
+def best_discounts(product_ids, quantities, unit_prices, candidates):  # pylint: disable=too-many-locals
+    """Computes the best discount for every line
+
+    Args:
+        product_ids, quantities, unit_prices (ndarray): one entry per line
+        candidates (tuple): the arrays returned by find_candidates()
+
+    Returns:
+        tuple: the discount and the promotion id (-1 for none) of each line
+    """
+    cand_products, cand_types, cand_amounts, cand_ids = candidates
+    lines = len(product_ids)
+
+    # pair every line with each candidate promotion for its product
+    first = np.searchsorted(cand_products, product_ids, side="left")
+    last = np.searchsorted(cand_products, product_ids, side="right")
+    counts = last - first
+    pair_line = np.repeat(np.arange(lines), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    pair_cand = np.repeat(first, counts) + offsets
+
+    qty = quantities[pair_line]
+    price = unit_prices[pair_line]
+    amount = cand_amounts[pair_cand]
+    promo_type = cand_types[pair_cand]
+    subtotal = qty * price
+    discount = np.select(
+        [promo_type == PERCENT_OFF, promo_type == AMOUNT_OFF, promo_type == BOGO],
+        [
+            subtotal * np.clip(amount, 0, 100) / 100,
+            qty * np.clip(amount, 0, price),
+            np.floor(qty / 2) * price,
+        ],
+    )
+    discount = np.minimum(discount, subtotal)
+
+    best = np.zeros(lines)
+    np.maximum.at(best, pair_line, discount)
+    promotion_ids = np.full(lines, -1, dtype=np.int64)
+    winners = (discount > 0) & (discount == best[pair_line])
+    # keep the first winning promotion of each line
+    winning_lines, first_winner = np.unique(pair_line[winners], return_index=True)
+    promotion_ids[winning_lines] = cand_ids[pair_cand[winners][first_winner]]
+    return best, promotion_ids
+
+
+def price_carts(carts, on):  # pylint: disable=too-many-locals
+    """Prices carts against the Promotions active on a date
+
+    Args:
+        carts (list): carts, each a list of {product_id, quantity, unit_price}
+        on (date): the date the promotions must be running on
+
+    Returns:
+        list: one priced cart per input cart
+    """
+    cart_index, product_ids, quantities, unit_prices = to_arrays(carts)
+    candidates = find_candidates(product_ids, on)
+    discounts, promotion_ids = best_discounts(product_ids, quantities, unit_prices, candidates)
+
+    subtotals = np.round(quantities * unit_prices, 2)
+    discounts = np.round(discounts, 2)
+    totals = subtotals - discounts
+    cart_subtotals = np.bincount(cart_index, weights=subtotals, minlength=len(carts))
+    cart_discounts = np.bincount(cart_index, weights=discounts, minlength=len(carts))
+
+    columns = zip(
+        cart_index.tolist(),
+        product_ids.tolist(),
+        quantities.astype(np.int64).tolist(),
+        unit_prices.tolist(),
+        subtotals.tolist(),
+        discounts.tolist(),
+        np.round(totals, 2).tolist(),
+        promotion_ids.tolist(),
+    )
+    priced = [
+        {
+            "lines": [],
+            "subtotal": round(subtotal, 2),
+            "discount": round(discount, 2),
+            "total": round(subtotal - discount, 2),
+        }
+        for subtotal, discount in zip(cart_subtotals.tolist(), cart_discounts.tolist())
+    ]
+    for cart, product_id, quantity, unit_price, subtotal, discount, total, promotion_id in columns:
+        priced[cart]["lines"].append(
+            {
+                "product_id": product_id,
+                "quantity": quantity,
+                "unit_price": unit_price,
+                "subtotal": subtotal,
+                "discount": discount,
+                "total": total,
+                "promotion_id": promotion_id if promotion_id >= 0 else None,
+            }
+        )
+    return priced
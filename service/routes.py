@@ -20,11 +20,18 @@ This service implements a REST API that allows you to Create, Read, Update
 and Delete Promotions using Flask-RESTX
 """
 
-from flask import request
+from datetime import date
+from flask import Response, request, stream_with_context
 from flask import current_app as app  # Import Flask application
 from flask_restx import Resource, fields, Namespace
-from service.models import Promotion
-from service.common import status  # HTTP Status Codes
+from werkzeug.http import unquote_etag
+from service.models import (
+    INT4_MAX, INT4_MIN, DataValidationError, PromoType, Promotion, StatusSweep, make_page_etag, promotion_cache,
+)
+from service.pricing import price_carts
+from service.common.serializer import encoder
+from service.common import cursors, metrics, status  # HTTP Status Codes
+from service.common.list_query import parse_list_query, parse_stats_query
 
 # Get the API instance from app extensions
 api = app.extensions.get("promotions_api")
@@ -82,6 +89,47 @@ create_model = ns.model(
 )
 
 
+filter_model = ns.model(
+    "PromotionFilter",
+    {
+        "ids": fields.List(fields.Integer, description="Match any of these promotion ids"),
+        "product_ids": fields.List(fields.Integer, description="Match any of these product ids"),
+        "promo_type": fields.String(description="Match this promotion type"),
+        "active_on": fields.String(description="Running on this date (YYYY-MM-DD)"),
+        "starts_after": fields.String(description="Starting on or after this date (YYYY-MM-DD)"),
+        "ends_before": fields.String(description="Ending on or before this date (YYYY-MM-DD)"),
+    },
+)
+
+cart_line_model = ns.model(
+    "CartLine",
+    {
+        "product_id": fields.Integer(required=True, description="The product identifier"),
+        "quantity": fields.Integer(required=True, description="The number of units"),
+        "unit_price": fields.Float(required=True, description="The price of one unit"),
+    },
+)
+
+cart_model = ns.model(
+    "Cart",
+    {"lines": fields.List(fields.Nested(cart_line_model), required=True)},
+)
+
+pricing_model = ns.model(
+    "PricingRequest",
+    {
+        "on": fields.String(description="Price as of this date (YYYY-MM-DD), defaults to today"),
+        "lines": fields.List(fields.Nested(cart_line_model), description="The lines of a single cart"),
+        "carts": fields.List(fields.Nested(cart_model), description="Several carts priced together"),
+    },
+)
+
+NDJSON = "application/x-ndjson"
+
+# The position change feed tokens hold, encoded as a page cursor
+CHANGES_SORT = "change_seq"
+
+
 ######################################################################
 # HELPER FUNCTION
 ######################################################################
@@ -96,6 +144,179 @@ def check_content_type(expected_type):
         )
 
 
+def parse_date(value, name):
+    """Parses an ISO date, aborting with 400 if it is malformed"""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return ns.abort(status.HTTP_400_BAD_REQUEST, f"{name} must be a date (YYYY-MM-DD).")
+
+
+def parse_id_list(values, name):
+    """Parses a list of integer ids, aborting with 400 if it is malformed or out of the columns' range"""
+    message = f"{name} must be a list of integers from {INT4_MIN} to {INT4_MAX}."
+    if not isinstance(values, list):
+        ns.abort(status.HTTP_400_BAD_REQUEST, message)
+    try:
+        ids = [int(value) for value in values]
+    except (TypeError, ValueError, OverflowError):
+        return ns.abort(status.HTTP_400_BAD_REQUEST, message)
+    if not all(INT4_MIN <= value <= INT4_MAX for value in ids):
+        ns.abort(status.HTTP_400_BAD_REQUEST, message)
+    return ids
+
+
+def parse_filter_body(data):
+    """Turns a PromotionFilter request body into Promotion.filter_clauses() arguments"""
+    if not isinstance(data, dict):
+        ns.abort(status.HTTP_400_BAD_REQUEST, "Request body must be a JSON object.")
+    filters = {}
+    for name in ("ids", "product_ids"):
+        if data.get(name) is not None:
+            filters[name] = parse_id_list(data[name], name)
+    promo_type = data.get("promo_type")
+    if promo_type is not None:
+        if promo_type not in PromoType.__members__:
+            ns.abort(status.HTTP_400_BAD_REQUEST, f"Invalid promo_type: {promo_type}")
+        filters["promo_type"] = promo_type
+    for name in ("active_on", "starts_after", "ends_before"):
+        if data.get(name) is not None:
+            filters[name] = parse_date(data[name], name)
+    if not any(filters.values()):
+        ns.abort(status.HTTP_400_BAD_REQUEST, "At least one filter is required.")
+    return filters
+
+
+def set_status_by_filter(new_status):
+    """Sets the status of every Promotion matched by the request's filter"""
+    check_content_type("application/json")
+    filters = parse_filter_body(request.get_json())
+    ids = Promotion.set_status_where(new_status, **filters)
+    app.logger.info("Set status=%s on %d promotions", new_status, len(ids))
+    return {"status": new_status, "count": len(ids), "ids": ids}, status.HTTP_200_OK
+
+
+def save_batch(promotions, positions, errors, mode):
+    """Saves the valid items of a batch and returns the Promotions that were saved
+
+    In partial mode a multi-row INSERT the database rejects is retried a
+    row at a time, each under a SAVEPOINT, and the rows it still rejects
+    are added to errors by their position in the request.
+    """
+    try:
+        return Promotion.create_many(promotions)
+    except DataValidationError:
+        if mode == "atomic":
+            raise
+    app.logger.warning("Batch INSERT failed, saving its %d promotions one by one", len(promotions))
+    for position, error in zip(positions, Promotion.create_each(promotions)):
+        if error is not None:
+            errors.append({"index": position, "message": error})
+    errors.sort(key=lambda error: error["index"])
+    return [promotion for promotion in promotions if promotion.id is not None]
+
+
+def wants_ndjson():
+    """Returns True when the client prefers newline-delimited JSON"""
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON])
+    return best == NDJSON
+
+
+def stream_promotions(sort, filters):
+    """Streams Promotions as NDJSON, one line per Promotion"""
+    chunk_size = app.config["STREAM_CHUNK_SIZE"]
+
+    def generate():
+        for chunk in Promotion.stream(chunk_size, sort, **filters):
+            yield encoder.encode_lines(chunk)
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+
+def json_response(body, code=status.HTTP_200_OK, headers=None):
+    """Returns already-encoded JSON bytes as a response"""
+    return Response(body, code, mimetype="application/json", headers=headers)
+
+
+def not_modified(etag):
+    """Returns a 304 response when the client's If-None-Match matches etag, else None"""
+    if etag is not None and request.if_none_match.contains_weak(unquote_etag(etag)[0]):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return None
+
+
+def get_limit(default, maximum):
+    """Returns the requested limit, capped at maximum"""
+    limit = request.args.get("limit", default)
+    try:
+        limit = int(limit)
+    except ValueError:
+        ns.abort(status.HTTP_400_BAD_REQUEST, "limit must be an integer.")
+    if limit < 1:
+        ns.abort(status.HTTP_400_BAD_REQUEST, "limit must be at least 1.")
+    return min(limit, maximum)
+
+
+def get_page_size():
+    """Returns the requested page size, capped at PAGE_SIZE_MAX"""
+    return get_limit(app.config["PAGE_SIZE_DEFAULT"], app.config["PAGE_SIZE_MAX"])
+
+
+def get_list_query():
+    """Returns the filters and sort key of the request, aborting with 400 if they are malformed"""
+    try:
+        return parse_list_query(request.args)
+    except ValueError as error:
+        return ns.abort(status.HTTP_400_BAD_REQUEST, str(error))
+
+
+def decode_cursor(cursor, sort):
+    """Decodes a page cursor back into the sort position of the last row that was returned"""
+    try:
+        after = cursors.decode_cursor(cursor, sort)
+        return None if after is None else Promotion.parse_position(after, sort)
+    except (ValueError, DataValidationError) as error:
+        return ns.abort(status.HTTP_400_BAD_REQUEST, str(error))
+
+
+def decode_change_token(token):
+    """Decodes a change feed token back into the (change_seq, id) of the last change that was returned"""
+    try:
+        after = cursors.decode_cursor(token, CHANGES_SORT)
+    except ValueError:
+        after = []
+    if after is None:
+        return None
+    if len(after) != 2 or not all(isinstance(value, int) for value in after):
+        ns.abort(status.HTTP_400_BAD_REQUEST, "since is invalid.")
+    change_seq, promotion_id = after
+    if not 0 <= change_seq < 2**63 or not INT4_MIN <= promotion_id <= INT4_MAX:
+        ns.abort(status.HTTP_400_BAD_REQUEST, "since is invalid.")
+    # deletes before the last tombstone pruned are gone, so the client has to read everything again
+    if (change_seq, promotion_id) < StatusSweep.pruned_through():
+        ns.abort(status.HTTP_410_GONE, "since is older than the change feed keeps deletes; start again without it.")
+    return change_seq, promotion_id
+
+
+def encode_changes(rows, token, more):
+    """Returns a page of the change feed as JSON bytes"""
+    changes = b",".join(
+        b'{"id":%d,"deleted":true}' % row.id if row.deleted
+        else b'{"id":%d,"deleted":false,"promotion":%s}' % (row.id, encoder.encode_row(row[2:]))
+        for row in rows
+    )
+    return b'{"changes":[%s],"next":"%s","more":%s}' % (changes, token.encode(), b"true" if more else b"false")
+
+
+def next_page_headers(last_row, sort, limit):
+    """Builds the Link headers that point a client at the next page"""
+    args = request.args.to_dict(flat=False)
+    args["cursor"] = cursors.encode_cursor(Promotion.sort_position(last_row, sort), sort)
+    args["limit"] = limit
+    next_url = api.url_for(PromotionCollection, _external=True, **args)
+    return {"Link": f'<{next_url}>; rel="next"', "X-Next-Cursor": args["cursor"]}
+
+
 ######################################################################
 # ROOT ENDPOINT (Serve index.html)
 ######################################################################
@@ -112,6 +333,16 @@ def index():
     }, status.HTTP_200_OK
 
 
+######################################################################
+# PROMETHEUS METRICS
+######################################################################
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Returns the service metrics in Prometheus text format"""
+    body, content_type = metrics.generate()
+    return Response(body, status.HTTP_200_OK, content_type=content_type)
+
+
 ######################################################################
 # PROMOTION COLLECTION RESOURCE
 ######################################################################
@@ -120,38 +351,76 @@ class PromotionCollection(Resource):
     """Handles all interactions with collections of Promotions"""
 
     @ns.doc("list_promotions")
-    @ns.marshal_list_with(promotion_model)
+    @ns.param("type", "Only list promotions of this type")
+    @ns.param("product_id", "Only list promotions for these products (repeat or comma separate)")
+    @ns.param("status", "Only list active (true) or inactive (false) promotions")
+    @ns.param("active_on", "Only list promotions running on this date (YYYY-MM-DD)")
+    @ns.param("starts_after", "Only list promotions starting on or after this date (YYYY-MM-DD)")
+    @ns.param("ends_before", "Only list promotions ending on or before this date (YYYY-MM-DD)")
+    @ns.param("amount_min", "Only list promotions with at least this amount")
+    @ns.param("amount_max", "Only list promotions with at most this amount")
+    @ns.param("name", "Only list promotions with this name")
+    @ns.param("sort", "id (default), name, product_id, amount, start_date or end_date; prefix - to reverse")
+    @ns.param("limit", "The maximum number of promotions to return")
+    @ns.param("cursor", "The cursor from the previous page's Link header")
+    @ns.produces(["application/json", NDJSON])
+    @ns.response(200, "Success", [promotion_model])
+    @ns.response(304, "Not Modified")
     def get(self):
-        """Fetch all Promotions"""
+        """Fetch a page of Promotions
+
+        Pages are keyed on the sort column and id, so every page costs the
+        same no matter how deep the client goes. When there are more rows a
+        Link rel="next" header carries the cursor for the following page.
+        Filters and sort order run in the database as one indexed query.
+
+        Clients that send Accept: application/x-ndjson get every matching
+        Promotion streamed instead, one JSON document per line.
+        """
         app.logger.info("Request to list promotions")
 
         promotion_id = request.args.get("id")
         if promotion_id:
             app.logger.info("Filtering promotions by id=%s", promotion_id)
             try:
-                promotion = Promotion.find(int(promotion_id))
+                found = Promotion.find_json(int(promotion_id))
             except ValueError:
                 ns.abort(status.HTTP_400_BAD_REQUEST, "ID must be an integer.")
-            if not promotion:
+            if not found:
                 ns.abort(
                     status.HTTP_404_NOT_FOUND,
                     f"Promotion with id '{promotion_id}' was not found.",
                 )
-            return [promotion.serialize()], status.HTTP_200_OK
-
-        promo_type = request.args.get("type")
-        if promo_type:
-            app.logger.info("Filtering promotions by type=%s", promo_type)
-            promotions = Promotion.find_by_type(promo_type)
-        else:
-            promotions = Promotion.all()
-
-        results = [p.serialize() for p in promotions]
-        return results, status.HTTP_200_OK
+            body, etag = found
+            return json_response(b"[" + body + b"]", headers={"ETag": etag})
+
+        filters, sort = get_list_query()
+        if filters:
+            app.logger.info("Filtering promotions by %s", filters)
+        if wants_ndjson():
+            app.logger.info("Streaming promotions as NDJSON")
+            return stream_promotions(sort, filters)
+
+        limit = get_page_size()
+        after = decode_cursor(request.args.get("cursor"), sort)
+
+        # a client polling an unchanged page is answered from ids and versions alone
+        if request.if_none_match:
+            response = not_modified(Promotion.find_page_etag(limit + 1, after, sort, **filters))
+            if response:
+                return response
+
+        # fetch one extra row to learn whether there is a next page
+        rows = Promotion.find_page_rows(limit + 1, after, sort, **filters)
+        headers = {"ETag": make_page_etag((row.id, row.version) for row in rows)}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            headers.update(next_page_headers(rows[-1], sort, limit))
+        return json_response(encoder.encode_rows(rows), headers=headers)
 
     @ns.doc("create_promotion")
     @ns.expect(create_model)
-    @ns.marshal_with(promotion_model, code=201)
+    @ns.response(201, "Created", promotion_model)
     def post(self):
         """Create a new Promotion"""
         app.logger.info("Request to create a Promotion...")
@@ -165,17 +434,82 @@ class PromotionCollection(Resource):
         promotion.create()
         app.logger.info("promotion with new id [%s] saved!", promotion.id)
 
-        return (
-            promotion.serialize(),
+        return json_response(
+            promotion.to_json(),
             status.HTTP_201_CREATED,
             {
                 "Location": api.url_for(
                     PromotionResource, promotion_id=promotion.id, _external=True
-                )
+                ),
+                "ETag": promotion.etag,
             },
         )
 
 
+######################################################################
+# PROMOTION BATCH RESOURCE
+######################################################################
+@ns.route(":batch")
+class PromotionBatchResource(Resource):
+    """Creates many Promotions in a single request"""
+
+    @ns.doc("create_promotions_batch")
+    @ns.param("mode", "atomic (default) saves all or nothing; partial saves the valid items")
+    @ns.expect([create_model])
+    @ns.response(201, "All promotions created")
+    @ns.response(207, "Some promotions created (partial mode)")
+    @ns.response(400, "Validation failed (atomic mode)")
+    def post(self):
+        """Create a batch of Promotions
+
+        Every item is validated with Promotion.deserialize and the valid
+        ones are saved with a multi-row INSERT in a single transaction.
+        Errors are reported per item by its index in the request array.
+        """
+        app.logger.info("Request to create a batch of Promotions...")
+        check_content_type("application/json")
+
+        mode = request.args.get("mode", "atomic")
+        if mode not in ("atomic", "partial"):
+            ns.abort(status.HTTP_400_BAD_REQUEST, "mode must be 'atomic' or 'partial'.")
+        data = request.get_json()
+        if not isinstance(data, list):
+            ns.abort(status.HTTP_400_BAD_REQUEST, "Request body must be a JSON array.")
+        if len(data) > app.config["BATCH_MAX_SIZE"]:
+            ns.abort(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"A batch may hold at most {app.config['BATCH_MAX_SIZE']} promotions.",
+            )
+
+        promotions = []
+        positions = []
+        errors = []
+        for position, item in enumerate(data):
+            try:
+                promotions.append(Promotion().deserialize(item))
+                positions.append(position)
+            except DataValidationError as error:
+                errors.append({"index": position, "message": str(error)})
+
+        if errors and mode == "atomic":
+            app.logger.warning("Batch rejected: %d of %d items invalid", len(errors), len(data))
+            return {
+                "status": status.HTTP_400_BAD_REQUEST,
+                "error": "Bad Request",
+                "message": f"{len(errors)} of {len(data)} promotions failed validation",
+                "created": [],
+                "errors": errors,
+            }, status.HTTP_400_BAD_REQUEST
+
+        promotions = save_batch(promotions, positions, errors, mode)
+        app.logger.info("Batch saved %d promotions", len(promotions))
+        code = status.HTTP_207_MULTI_STATUS if errors else status.HTTP_201_CREATED
+        return {
+            "created": [p.serialize() for p in promotions],
+            "errors": errors,
+        }, code
+
+
 ######################################################################
 # PROMOTION RESOURCE
 ######################################################################
@@ -185,27 +519,37 @@ class PromotionResource(Resource):
     """Handles all interactions with a single Promotion"""
 
     @ns.doc("get_promotion")
-    @ns.marshal_with(promotion_model)
+    @ns.response(200, "Success", promotion_model)
+    @ns.response(304, "Not Modified")
     def get(self, promotion_id):
-        """Fetch a Promotion"""
+        """Fetch a Promotion
+
+        Clients that send If-None-Match with the current ETag get a 304
+        answered from the row's version alone.
+        """
         app.logger.info("Request for Promotion with id: %s", promotion_id)
-        promotion = Promotion.find(promotion_id)
-        if not promotion:
+        if request.if_none_match:
+            response = not_modified(Promotion.find_etag(promotion_id))
+            if response:
+                return response
+        found = Promotion.find_json(promotion_id)
+        if found is None:
             ns.abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Promotion with id '{promotion_id}' was not found.",
             )
-        return promotion.serialize(), status.HTTP_200_OK
+        body, etag = found
+        return json_response(body, headers={"ETag": etag})
 
     @ns.doc("update_promotion")
     @ns.expect(promotion_model)
-    @ns.marshal_with(promotion_model)
+    @ns.response(200, "Success", promotion_model)
     def put(self, promotion_id):
         """Update a Promotion"""
         app.logger.info("Request to update Promotion with id: %s", promotion_id)
         check_content_type("application/json")
 
-        promotion = Promotion.find(promotion_id)
+        promotion = Promotion.find(promotion_id, cached=False)
         if not promotion:
             ns.abort(
                 status.HTTP_404_NOT_FOUND,
@@ -224,13 +568,13 @@ class PromotionResource(Resource):
         promotion.id = promotion_id  # preserve correct id
         promotion.update()
 
-        return promotion.serialize(), status.HTTP_200_OK
+        return json_response(promotion.to_json(), headers={"ETag": promotion.etag})
 
     @ns.doc("delete_promotion")
     def delete(self, promotion_id):
         """Delete a Promotion"""
         app.logger.info("Request to delete Promotion with id: %s", promotion_id)
-        promotion = Promotion.find(promotion_id)
+        promotion = Promotion.find(promotion_id, cached=False)
 
         # RFC-conformant: DELETE is idempotent—return 204 even if nothing to delete
         if promotion:
@@ -251,7 +595,7 @@ class ActivatePromotionResource(Resource):
     def put(self, promotion_id):
         """Activate a Promotion by setting status=True"""
         app.logger.info("Request to activate Promotion with id: %s", promotion_id)
-        promotion = Promotion.find(promotion_id)
+        promotion = Promotion.find(promotion_id, cached=False)
 
         if not promotion:
             ns.abort(
@@ -273,10 +617,11 @@ class DeactivatePromotionResource(Resource):
     """Deactivate a Promotion"""
 
     @ns.doc("deactivate_promotion")
+    @ns.response(200, "Success", promotion_model)
     def delete(self, promotion_id):
         """Deactivate a Promotion by setting status=False"""
         app.logger.info("Request to deactivate Promotion with id: %s", promotion_id)
-        promotion = Promotion.find(promotion_id)
+        promotion = Promotion.find(promotion_id, cached=False)
         if not promotion:
             ns.abort(
                 status.HTTP_404_NOT_FOUND,
@@ -285,7 +630,188 @@ class DeactivatePromotionResource(Resource):
 
         promotion.status = False
         promotion.update()
-        return promotion.serialize(), status.HTTP_200_OK
+        return json_response(promotion.to_json(), headers={"ETag": promotion.etag})
+
+
+@ns.route(":activate")
+class BulkActivateResource(Resource):
+    """Activate every Promotion that matches a filter"""
+
+    @ns.doc("activate_promotions")
+    @ns.expect(filter_model)
+    def post(self):
+        """Activate matching Promotions with a single UPDATE
+
+        Returns the ids of the Promotions that were switched on and their count.
+        """
+        app.logger.info("Request to bulk activate Promotions")
+        return set_status_by_filter(True)
+
+
+@ns.route(":deactivate")
+class BulkDeactivateResource(Resource):
+    """Deactivate every Promotion that matches a filter"""
+
+    @ns.doc("deactivate_promotions")
+    @ns.expect(filter_model)
+    def post(self):
+        """Deactivate matching Promotions with a single UPDATE
+
+        Returns the ids of the Promotions that were switched off and their count.
+        """
+        app.logger.info("Request to bulk deactivate Promotions")
+        return set_status_by_filter(False)
+
+
+@ns.route(":price")
+class PricingResource(Resource):
+    """Prices carts against the active Promotions"""
+
+    @ns.doc("price_carts")
+    @ns.expect(pricing_model)
+    def post(self):
+        """Price one cart, or a batch of carts
+
+        Send either "lines" for a single cart or "carts" for several. Each
+        line gets the single best active promotion for its product, and the
+        response carries line-level and cart-level discounts.
+        """
+        app.logger.info("Request to price carts")
+        check_content_type("application/json")
+        data = request.get_json()
+        if not isinstance(data, dict):
+            ns.abort(status.HTTP_400_BAD_REQUEST, "Request body must be a JSON object.")
+        on = parse_date(data["on"], "on") if data.get("on") else date.today()
+
+        batched = "carts" in data
+        carts = data["carts"] if batched else [data]
+        if not isinstance(carts, list) or not all(
+            isinstance(cart, dict) and isinstance(cart.get("lines"), list) for cart in carts
+        ):
+            ns.abort(status.HTTP_400_BAD_REQUEST, "Every cart must have a list of lines.")
+        carts = [cart["lines"] for cart in carts]
+        if sum(len(lines) for lines in carts) > app.config["PRICING_MAX_LINES"]:
+            ns.abort(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"At most {app.config['PRICING_MAX_LINES']} lines may be priced at once.",
+            )
+
+        priced = price_carts(carts, on)
+        return ({"carts": priced} if batched else priced[0]), status.HTTP_200_OK
+
+
+@ns.route("/active")
+class ActivePromotionsResource(Resource):
+    """Promotions that apply to a product on a given day"""
+
+    @ns.doc("list_active_promotions")
+    @ns.param("product_id", "The product identifier", required=True)
+    @ns.param("on", "The date to check (YYYY-MM-DD), defaults to today")
+    @ns.response(200, "Success", [promotion_model])
+    def get(self):
+        """List the active Promotions for a product on a date
+
+        Answered from an in-process index rather than the database.
+        """
+        product_id = request.args.get("product_id")
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            ns.abort(status.HTTP_400_BAD_REQUEST, "product_id must be an integer.")
+        on = request.args.get("on")
+        on = parse_date(on, "on") if on else date.today()
+        app.logger.info("Request for active promotions for product %s on %s", product_id, on)
+        return Promotion.find_active(product_id, on), status.HTTP_200_OK
+
+
+@ns.route("/stats")
+class PromotionStatsResource(Resource):
+    """Promotion counts for dashboards"""
+
+    @ns.doc("promotion_stats")
+    @ns.param("by", "Comma separated promo_type, status, product_id, start_date, end_date (default promo_type,status)")
+    @ns.param("bucket", "How start_date and end_date are grouped: day, month (default) or year")
+    @ns.param("type", "Only count promotions of this type; every filter of GET /api/promotions is accepted")
+    @ns.param("status", "Only count active (true) or inactive (false) promotions")
+    @ns.param("product_id", "Only count promotions for these products (repeat or comma separate)")
+    def get(self):
+        """Count Promotions grouped by type, status, product or date
+
+        The groups are computed by the database with one GROUP BY and
+        cached until the next write, so dashboards can poll this instead
+        of pulling the full list.
+        """
+        try:
+            by, bucket, filters = parse_stats_query(request.args)
+        except ValueError as error:
+            ns.abort(status.HTTP_400_BAD_REQUEST, str(error))
+        app.logger.info("Request for promotion stats by %s", by)
+        groups = Promotion.stats(by, bucket, **filters)
+        return {
+            "by": by,
+            "bucket": bucket,
+            "total": sum(group["count"] for group in groups),
+            "groups": groups,
+        }, status.HTTP_200_OK
+
+
+@ns.route("/search")
+class PromotionSearchResource(Resource):
+    """Promotions found by name"""
+
+    @ns.doc("search_promotions")
+    @ns.param("q", "The name, or the start or part of a name, to search for", required=True)
+    @ns.param("limit", "The maximum number of promotions to return")
+    @ns.response(200, "Success", [promotion_model])
+    def get(self):
+        """Search Promotions by name, best matches first
+
+        An exact name comes first, then names starting with q, then names
+        containing q or a close misspelling of it. Answered from an
+        in-process name index rather than a table scan.
+        """
+        query = request.args.get("q", "").strip()
+        if not query:
+            ns.abort(status.HTTP_400_BAD_REQUEST, "q is required.")
+        limit = get_limit(app.config["SEARCH_LIMIT_DEFAULT"], app.config["SEARCH_LIMIT_MAX"])
+        app.logger.info("Request to search promotions for %s", query)
+        return json_response(encoder.encode_rows(Promotion.search(query, limit)))
+
+
+@ns.route("/changes")
+class PromotionChangesResource(Resource):
+    """Promotions changed since a point in the change feed"""
+
+    @ns.doc("list_promotion_changes")
+    @ns.response(410, "The since token is older than the change feed keeps deletes")
+    @ns.param("since", "The next token of the previous response; leave it out to start from the beginning")
+    @ns.param("limit", "The maximum number of changes to return")
+    def get(self):
+        """List the Promotions written or deleted since a token, oldest change first
+
+        Each change is a Promotion as it is now, or a delete. Pass the
+        returned next token as since to continue; while more is false the
+        client is caught up and can poll with the same token. A token older
+        than CHANGE_FEED_RETENTION_DAYS answers 410: start again without it.
+        """
+        limit = get_page_size()
+        after = decode_change_token(request.args.get("since"))
+        app.logger.info("Request for promotion changes after %s", after)
+        rows = Promotion.changes(limit + 1, after)
+        more = len(rows) > limit
+        rows = rows[:limit]
+        position = (rows[-1].change_seq, rows[-1].id) if rows else after or (0, 0)
+        return json_response(encode_changes(rows, cursors.encode_cursor(position, CHANGES_SORT), more))
+
+
+@ns.route("/cache")
+class CacheStatsResource(Resource):
+    """Promotion cache counters"""
+
+    @ns.doc("cache_stats")
+    def get(self):
+        """Returns the hit, miss and eviction counters of this worker's promotion cache"""
+        return promotion_cache.stats(), status.HTTP_200_OK
 
 
 @ns.route("/health")
@@ -0,0 +1,156 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Active Promotion Index
+"""
+import threading
+from datetime import date
+from unittest import TestCase
+import numpy as np
+from flask import Flask
+from service.common.active_index import ActiveIndex
+
+
+def row(pid, product_id, start, end):
+    """Returns a loader row for a promotion"""
+    return (pid, f"Promo {pid}", "PERCENT_OFF", product_id, 10.0, start, end)
+
+
+class TestActiveIndex(TestCase):
+    """Active Index Tests"""
+
+    def setUp(self):
+        self.rows = [
+            row(1, 100, date(2025, 1, 1), date(2025, 1, 31)),
+            row(2, 100, date(2025, 1, 15), date(2025, 2, 15)),
+            row(3, 100, date(2025, 3, 1), date(2025, 3, 31)),
+            row(4, 200, date(2025, 1, 1), date(2025, 12, 31)),
+        ]
+        self.loads = 0
+
+        def loader():
+            self.loads += 1
+            return self.rows
+
+        self.index = ActiveIndex(loader=loader)
+
+    def ids(self, product_id, on):
+        """Returns the ids found for product_id on a date"""
+        return [entry.id for entry in self.index.lookup(product_id, on)]
+
+    def test_lookup(self):
+        """It should find the promotions running on a date"""
+        self.assertEqual(self.ids(100, date(2025, 1, 20)), [1, 2])
+        self.assertEqual(self.ids(100, date(2025, 1, 31)), [1, 2])
+        self.assertEqual(self.ids(100, date(2025, 2, 1)), [2])
+        self.assertEqual(self.ids(100, date(2025, 3, 1)), [3])
+        self.assertEqual(self.ids(100, date(2024, 12, 31)), [])
+        self.assertEqual(self.ids(300, date(2025, 1, 1)), [])
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.loads, 1)
+
+    def test_upsert_and_remove(self):
+        """It should apply incremental changes to a loaded index"""
+        self.index.rebuild()
+        self.index.upsert(5, "New", "BOGO", 100, 1.0, date(2025, 1, 1), date(2025, 1, 1), True)
+        self.assertEqual(self.ids(100, date(2025, 1, 1)), [5, 1])
+        # moving a promotion to another product
+        self.index.upsert(1, "Moved", "BOGO", 200, 1.0, date(2025, 1, 1), date(2025, 1, 31), True)
+        self.assertEqual(self.ids(100, date(2025, 1, 1)), [5])
+        self.assertEqual(self.ids(200, date(2025, 1, 1)), [1, 4])
+        # deactivating drops it
+        self.index.upsert(4, "Off", "BOGO", 200, 1.0, date(2025, 1, 1), date(2025, 12, 31), False)
+        self.assertEqual(self.ids(200, date(2025, 1, 1)), [1])
+        self.index.remove(1)
+        self.index.remove(1)
+        self.assertEqual(self.ids(200, date(2025, 1, 1)), [])
+        self.assertEqual(self.loads, 1)
+
+    def test_upsert_before_load(self):
+        """It should ignore changes until the index is loaded"""
+        self.index.upsert(5, "New", "BOGO", 300, 1.0, date(2025, 1, 1), date(2025, 1, 1), True)
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(self.ids(300, date(2025, 1, 1)), [])
+
+    def test_reload_when_stale(self):
+        """It should reload after invalidate() or once max_age has passed"""
+        self.ids(100, date(2025, 1, 1))
+        self.index.invalidate()
+        self.ids(100, date(2025, 1, 1))
+        self.assertEqual(self.loads, 2)
+        self.index.max_age = -1
+        self.ids(100, date(2025, 1, 1))
+        self.assertEqual(self.loads, 3)
+
+    def test_reload_keeps_writes_made_while_loading(self):
+        """It should apply the writes made while the rows are read to the new index"""
+        self.index.rebuild()
+        rows = self.rows
+
+        def loader():
+            # written while the rows are being read, so missing from them
+            self.index.upsert(5, "New", "BOGO", 100, 1.0, date(2025, 1, 1), date(2025, 1, 1), True)
+            self.index.remove(2)
+            return rows
+
+        self.index.loader = loader
+        self.index.rebuild()
+        self.assertEqual(self.ids(100, date(2025, 1, 1)), [5, 1])
+        self.assertEqual(self.ids(100, date(2025, 2, 1)), [])
+        self.assertEqual(self.index.lookup_columns(np.array([100]), date(2025, 1, 20))[3].tolist(), [1])
+        # a failed load keeps the current index
+        self.index.loader = None
+        with self.assertRaises(TypeError):
+            self.index.rebuild()
+        self.assertEqual(self.ids(100, date(2025, 1, 1)), [5, 1])
+
+    def test_reload_in_background(self):
+        """It should reload on a thread once it has a Flask app, serving the old index meanwhile"""
+        self.index.init_app(Flask(__name__))
+        self.assertEqual(self.index.max_age, 60.0)
+        self.assertEqual(self.ids(200, date(2025, 6, 1)), [4])
+        loading = threading.Event()
+        release = threading.Event()
+        rows = [row(6, 200, date(2025, 1, 1), date(2025, 12, 31))]
+
+        def loader():
+            loading.set()
+            release.wait()
+            return rows
+
+        self.index.loader = loader
+        self.index.max_age = -1
+        # answered at once from the current index while the reload waits
+        self.assertEqual(self.ids(200, date(2025, 6, 1)), [4])
+        loading.wait()
+        self.index.upsert(7, "New", "BOGO", 200, 1.0, date(2025, 6, 1), date(2025, 6, 1), True)
+        self.assertEqual(self.ids(200, date(2025, 6, 1)), [4, 7])
+        release.set()
+        self.index.wait()
+        self.index.max_age = 60
+        self.assertEqual(self.ids(200, date(2025, 6, 1)), [6, 7])
+
+    def test_lookup_columns(self):
+        """It should find many products at once, including ones changed since the load"""
+        self.index.rebuild()
+        self.index.upsert(5, "New", "BOGO", 300, 1.0, date(2025, 1, 1), date(2025, 1, 31), True)
+        self.index.remove(2)
+        products, promo_types, amounts, ids = self.index.lookup_columns(np.array([100, 200, 300, 400]), date(2025, 1, 20))
+        self.assertEqual(products.tolist(), [100, 200, 300])
+        self.assertEqual(ids.tolist(), [1, 4, 5])
+        self.assertEqual(promo_types.tolist(), ["PERCENT_OFF", "PERCENT_OFF", "BOGO"])
+        self.assertEqual(amounts.tolist(), [10.0, 10.0, 1.0])
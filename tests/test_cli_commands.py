@@ -26,7 +26,8 @@ from click.testing import CliRunner
 
 # pylint: disable=unused-import
 from wsgi import app  # noqa: F401
-from service.common.cli_commands import db_create  # noqa: E402
+from service.common.cli_commands import db_create, db_indexes, db_init  # noqa: E402
+from service.models import db
 
 
 class TestFlaskCLI(TestCase):
@@ -42,3 +43,47 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    @patch("service.common.cli_commands.create_indexes")
+    def test_db_indexes(self, create_indexes_mock):
+        """It should call the db-indexes command"""
+        create_indexes_mock.side_effect = lambda table: ["ix_promotion_name"] if table.name == "promotion" else []
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(db_indexes)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Created index ix_promotion_name", result.output)
+            self.assertIn("1 index(es) created", result.output)
+
+    @patch("service.common.cli_commands.db")
+    @patch("service.common.cli_commands.Promotion")
+    def test_db_init(self, promotion_mock, db_mock):
+        """It should create missing tables, columns and indexes without dropping anything"""
+        promotion_mock.schema_ready.return_value = True
+        db_mock.metadata.sorted_tables = db.metadata.sorted_tables
+        schema = MagicMock()
+        schema.add_missing_columns.side_effect = lambda table: ["change_seq"] if table.name == "promotion" else []
+        schema.create_indexes.side_effect = lambda table: ["ix_promotion_change_seq_id"] if table.name == "promotion" else []
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True), patch(
+            "service.common.cli_commands.add_missing_columns", schema.add_missing_columns
+        ), patch("service.common.cli_commands.create_indexes", schema.create_indexes):
+            result = self.runner.invoke(db_init)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Added column promotion.change_seq", result.output)
+            self.assertIn("Schema is ready (1 index(es) created)", result.output)
+        db_mock.create_all.assert_called_once()
+        db_mock.drop_all.assert_not_called()
+        # the new indexes need the new columns
+        calls = [name for name, _, _ in schema.mock_calls]
+        self.assertLess(calls.index("add_missing_columns"), calls.index("create_indexes"))
+
+    @patch("service.common.cli_commands.db")
+    @patch("service.common.cli_commands.Promotion")
+    @patch("service.common.cli_commands.create_indexes", return_value=[])
+    @patch("service.common.cli_commands.add_missing_columns", return_value=[])
+    def test_db_init_out_of_date(self, *mocks):
+        """It should fail when the existing table is missing columns it cannot add"""
+        mocks[-2].schema_ready.return_value = False
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(db_init)
+            self.assertEqual(result.exit_code, 1)
+            self.assertIn("ALTER TABLE", result.output)
@@ -0,0 +1,74 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Instrumented Connection Pool
+"""
+import sqlite3
+from unittest import TestCase
+from flask import Flask
+from prometheus_client import REGISTRY
+from sqlalchemy import exc
+from service.common import db_pool
+
+
+def sample(name):
+    """Returns the current value of a metric sample"""
+    return REGISTRY.get_sample_value(name) or 0.0
+
+
+class TestTimedQueuePool(TestCase):
+    """Timed Queue Pool Tests"""
+
+    def setUp(self):
+        self.pool = db_pool.TimedQueuePool(
+            lambda: sqlite3.connect(":memory:"), pool_size=1, max_overflow=1, timeout=0.01
+        )
+
+    def tearDown(self):
+        self.pool.dispose()
+
+    def test_checkout_is_timed(self):
+        """It should time checkouts and track connections in use and in overflow"""
+        checkouts = sample("promotions_db_pool_checkout_seconds_count")
+        first = self.pool.connect()
+        second = self.pool.connect()
+        self.assertEqual(sample("promotions_db_pool_checkout_seconds_count"), checkouts + 2)
+        self.assertEqual(sample("promotions_db_pool_connections_in_use"), 2)
+        self.assertEqual(sample("promotions_db_pool_overflow_connections"), 1)
+        second.close()
+        first.close()
+        self.assertEqual(sample("promotions_db_pool_connections_in_use"), 0)
+
+    def test_checkout_timeout(self):
+        """It should count checkouts that time out"""
+        timeouts = sample("promotions_db_pool_timeouts_total")
+        held = [self.pool.connect(), self.pool.connect()]
+        with self.assertRaises(exc.TimeoutError):
+            self.pool.connect()
+        self.assertEqual(sample("promotions_db_pool_timeouts_total"), timeouts + 1)
+        for connection in held:
+            connection.close()
+
+    def test_init_app(self):
+        """It should only swap in the timed pool for sized pools"""
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_size": 5}
+        db_pool.init_app(app)
+        self.assertIs(app.config["SQLALCHEMY_ENGINE_OPTIONS"]["poolclass"], db_pool.TimedQueuePool)
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {"pool_pre_ping": True}
+        db_pool.init_app(app)
+        self.assertNotIn("poolclass", app.config["SQLALCHEMY_ENGINE_OPTIONS"])
@@ -0,0 +1,136 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Gunicorn Configuration Test Suite
+"""
+
+# pylint: disable=duplicate-code
+import importlib.util
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, mock_open, patch
+from wsgi import app
+from service.common.status_scheduler import status_scheduler
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+SETTINGS = ("GUNICORN_WORKER_CLASS", "GUNICORN_WORKERS", "GUNICORN_THREADS", "GUNICORN_PRELOAD")
+
+
+def load_conf(**env):
+    """Imports gunicorn.conf.py afresh with only the given GUNICORN_* settings in the environment"""
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", CONF_PATH)
+    conf = importlib.util.module_from_spec(spec)
+    with patch.dict(os.environ, env):
+        for name in SETTINGS:
+            if name not in env:
+                os.environ.pop(name, None)
+        spec.loader.exec_module(conf)
+    return conf
+
+
+######################################################################
+#  G U N I C O R N   C O N F I G   T E S T   C A S E S
+######################################################################
+class TestGunicornConf(TestCase):
+    """Gunicorn Configuration Tests"""
+
+    def setUp(self):
+        self.conf = load_conf()
+
+    def cpu_count(self, cpu_max=None, cpus=8):
+        """Returns cpu_count() on a machine with cpus CPUs and the given cpu.max, or none"""
+        if cpu_max is None:
+            cgroup = mock_open()
+            cgroup.side_effect = FileNotFoundError("/sys/fs/cgroup/cpu.max")
+        else:
+            cgroup = mock_open(read_data=cpu_max)
+        with patch.object(os, "sched_getaffinity", return_value=set(range(cpus)), create=True), patch.object(
+            self.conf, "open", cgroup, create=True
+        ):
+            return self.conf.cpu_count()
+
+    def test_cpu_count(self):
+        """It should count the CPUs of the affinity mask, capped by the cgroup quota"""
+        self.assertEqual(self.cpu_count(), 8)
+        self.assertEqual(self.cpu_count("max 100000\n"), 8)
+        self.assertEqual(self.cpu_count("200000 100000\n"), 2)
+        self.assertEqual(self.cpu_count("150000 100000\n"), 2)
+        self.assertEqual(self.cpu_count("50000 100000\n"), 1)
+        self.assertEqual(self.cpu_count("1600000 100000\n"), 8)
+        self.assertEqual(self.cpu_count("200000 100000\n", cpus=1), 1)
+
+    def test_cpu_count_unreadable_quota(self):
+        """It should ignore a cpu.max it cannot parse"""
+        self.assertEqual(self.cpu_count(""), 8)
+        self.assertEqual(self.cpu_count("lots 100000\n"), 8)
+
+    def test_env_flag(self):
+        """It should read true/false settings case-insensitively, anything else as false"""
+        with patch.dict(os.environ, {"FLAG": "TRUE"}):
+            self.assertTrue(self.conf.env_flag("FLAG", "false"))
+        with patch.dict(os.environ, {"FLAG": "yes"}):
+            self.assertFalse(self.conf.env_flag("FLAG", "true"))
+        os.environ.pop("FLAG", None)
+        self.assertTrue(self.conf.env_flag("FLAG", "true"))
+        self.assertFalse(self.conf.env_flag("FLAG", "false"))
+
+    def test_workers(self):
+        """It should default to sync workers sized from the CPUs and honor overrides"""
+        cpus = self.conf.cpu_count()
+        self.assertEqual(self.conf.worker_class, "sync")
+        self.assertEqual((self.conf.workers, self.conf.threads), (2 * cpus + 1, 1))
+        self.assertTrue(self.conf.preload_app)
+        conf = load_conf(GUNICORN_WORKER_CLASS="gthread", GUNICORN_PRELOAD="false")
+        self.assertEqual((conf.workers, conf.threads, conf.worker_connections), (2 * cpus + 1, 4, 1000))
+        self.assertFalse(conf.preload_app)
+        conf = load_conf(GUNICORN_WORKER_CLASS="gthread", GUNICORN_WORKERS="3", GUNICORN_THREADS="8")
+        self.assertEqual((conf.workers, conf.threads), (3, 8))
+
+    def test_on_starting(self):
+        """It should empty the metrics directory before the workers start"""
+        with tempfile.TemporaryDirectory() as root:
+            self.conf.prometheus_dir = os.path.join(root, "metrics")
+            os.makedirs(self.conf.prometheus_dir)
+            with open(os.path.join(self.conf.prometheus_dir, "counter_1.db"), "wb"):
+                pass
+            self.conf.on_starting(MagicMock())
+            self.assertEqual(os.listdir(self.conf.prometheus_dir), [])
+
+    def test_post_fork(self):
+        """It should drop the database connections a preloaded app inherited"""
+        server = MagicMock()
+        server.app.wsgi.return_value = app
+        with patch("sqlalchemy.engine.Engine.dispose") as dispose:
+            server.cfg.preload_app = False
+            self.conf.post_fork(server, MagicMock())
+            dispose.assert_not_called()
+            server.cfg.preload_app = True
+            self.conf.post_fork(server, MagicMock())
+            dispose.assert_called_once_with(close=False)
+
+    def test_post_worker_init(self):
+        """It should start the status scheduler in every worker"""
+        with patch.object(status_scheduler, "start") as start:
+            self.conf.post_worker_init(MagicMock())
+        start.assert_called_once_with()
+
+    def test_child_exit(self):
+        """It should drop the live gauges of an exited worker"""
+        with patch("prometheus_client.multiprocess.mark_process_dead") as mark_process_dead:
+            self.conf.child_exit(MagicMock(), MagicMock(pid=1234))
+        mark_process_dead.assert_called_once_with(1234)
@@ -0,0 +1,140 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Load Test Traffic Generator Test Suite
+
+The load test is pointed at the app served by werkzeug on a thread.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from click.testing import CliRunner
+from werkzeug.serving import make_server
+from wsgi import app
+from service.common.cli_commands import load_test
+from service.common.load_test import ENDPOINTS, LoadTest, format_report, parse_mix, summarize
+from service.models import db, Promotion
+
+
+class TestLoadTest(TestCase):
+    """Load Test Traffic Generator Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Serves the app on a free port"""
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+        with app.app_context():
+            db.create_all()
+        cls.server = make_server("127.0.0.1", 0, app, threaded=True)
+        cls.url = f"http://127.0.0.1:{cls.server.port}"
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.thread.join()
+
+    def count_promotions(self):
+        """Returns the number of promotions in the database"""
+        with app.app_context():
+            count = db.session.scalar(db.select(db.func.count(Promotion.id)))
+            db.session.remove()
+        return count
+
+    def test_parse_mix(self):
+        """It should parse endpoint weights and reject bad ones"""
+        self.assertEqual(parse_mix("list=3, get=1"), {"list": 3, "get": 1})
+        for bad, message in (
+            ("list=3,fetch=1", "unknown endpoint 'fetch'"),
+            ("list=-1", "must be a non-negative integer"),
+            ("list", "must be a non-negative integer"),
+            ("list=0,get=0", "at least one endpoint"),
+        ):
+            with self.assertRaises(ValueError) as context:
+                parse_mix(bad)
+            self.assertIn(message, str(context.exception))
+
+    def test_summarize(self):
+        """It should report throughput and nearest-rank latency percentiles"""
+        row = summarize([0.001 * n for n in range(100, 0, -1)], 2, 2.0)
+        self.assertEqual((row["requests"], row["errors"], row["throughput"]), (100, 2, 50.0))
+        self.assertEqual((row["p50_ms"], row["p95_ms"], row["p99_ms"], row["max_ms"]), (51.0, 96.0, 100.0, 100.0))
+        self.assertIsNone(summarize([], 0, 0)["p50_ms"])
+
+    def test_run(self):
+        """It should call every endpoint in the mix, report on each and delete what it created"""
+        before = self.count_promotions()
+        test = LoadTest(self.url, parse_mix("list=1,get=1,create=1,update=1,activate=1,deactivate=1"),
+                        workers=3, duration=1.0, pool=5)
+        test.prepare()
+        self.assertEqual(self.count_promotions(), before + 5)
+        report = test.run()
+        self.assertEqual(test.cleanup(), [])
+        self.assertEqual(self.count_promotions(), before)
+
+        self.assertEqual(list(report["endpoints"]), list(ENDPOINTS))
+        self.assertEqual(report["workers"], 3)
+        self.assertGreater(report["total"]["requests"], 6)
+        # writes to the same pooled promotion may race on its version, reads and creates never fail
+        for name in ("list", "get", "create"):
+            self.assertEqual(report["endpoints"][name]["errors"], 0)
+            self.assertEqual(set(report["endpoints"][name]["codes"]), {"201" if name == "create" else "200"})
+        self.assertLessEqual(set(report["endpoints"]["update"]["codes"]), {"200", "409"})
+        self.assertEqual(report["total"]["requests"], sum(row["requests"] for row in report["endpoints"].values()))
+        table = format_report(report)
+        self.assertIn("3 workers", table)
+        self.assertIn("deactivate", table)
+
+    def test_unreachable(self):
+        """It should count calls that cannot connect as errors"""
+        test = LoadTest("http://127.0.0.1:1", {"get": 1}, workers=1, duration=0.2, pool=1)
+        with self.assertRaises(OSError):
+            test.prepare()
+        test.ids = [1]
+        report = test.run()
+        self.assertEqual(report["total"]["errors"], report["total"]["requests"])
+        self.assertEqual(report["endpoints"]["get"]["codes"], {"none": report["total"]["requests"]})
+        self.assertEqual(test.cleanup(), [1])
+        self.assertIn(" - ", format_report({**report, "endpoints": {"list": summarize([], 0, 1.0)}}))
+
+    def test_load_test_command(self):
+        """It should print the report and save it as JSON"""
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as tempdir:
+            output = os.path.join(tempdir, "results.json")
+            result = runner.invoke(load_test, [
+                "--url", self.url, "--workers", "2", "--duration", "0.5", "--mix", "list=1,get=1", "--pool", "2",
+                "--output", output,
+            ])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertIn("2 workers", result.output)
+            with open(output, encoding="utf-8") as file:
+                self.assertEqual(list(json.load(file)["endpoints"]), ["list", "get"])
+
+        result = runner.invoke(load_test, ["--url", self.url, "--mix", "list=1,fetch=1"])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("unknown endpoint 'fetch'", result.output)
+
+        result = runner.invoke(load_test, ["--url", "http://127.0.0.1:1", "--duration", "0"])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("Cannot load test http://127.0.0.1:1", result.output)
@@ -0,0 +1,125 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Promotion Name Index
+"""
+import time
+from unittest import TestCase
+from flask import Flask
+from service.common.name_index import NameIndex, normalize
+
+
+class TestNameIndex(TestCase):
+    """Name Index Tests"""
+
+    def setUp(self):
+        self.rows = [
+            (1, "Summer Sale"),
+            (2, "summer-sale"),
+            (3, "Summertime Deals"),
+            (4, "Winter Sale"),
+            (5, "Spring Fling"),
+            (6, "Back to School"),
+            (7, "!!!"),
+        ]
+        self.loads = 0
+
+        def loader():
+            self.loads += 1
+            return self.rows
+
+        self.index = NameIndex(loader=loader)
+
+    def test_normalize(self):
+        """It should fold case and punctuation out of names"""
+        self.assertEqual(normalize("  Summer-SALE!! 2025 "), "summer sale 2025")
+        self.assertEqual(normalize("Straße_Deal"), "strasse deal")
+        self.assertEqual(normalize("!!!"), "")
+
+    def test_prefix(self):
+        """It should rank the exact name first, then names that start with the query"""
+        # then close matches
+        self.assertEqual(self.index.search("summer sale", 10), [1, 2, 3])
+        self.assertEqual(self.index.search("SUMM", 10), [1, 2, 3])
+        self.assertEqual(self.index.search("summer", 1), [1])
+        self.assertEqual(self.index.search("b", 10), [6])
+        self.assertEqual(self.loads, 1)
+
+    def test_fuzzy(self):
+        """It should find names containing the query or a misspelling of it"""
+        self.assertEqual(self.index.search("sale", 10), [1, 2, 4])
+        self.assertEqual(self.index.search("chool", 10), [6])
+        self.assertEqual(self.index.search("sumer sale", 10), [1, 2])
+        self.assertEqual(self.index.search("sale winter", 10), [4])
+        self.assertEqual(self.index.search("xyzzy", 10), [])
+        self.assertEqual(self.index.search(" !! ", 10), [])
+
+    def test_empty(self):
+        """It should search an empty index"""
+        self.rows = []
+        self.assertEqual(self.index.search("sale", 10), [])
+
+    def test_upsert_and_remove(self):
+        """It should apply incremental changes to a loaded index"""
+        self.index.upsert(8, "Ignored before the first load")
+        self.index.rebuild()
+        self.index.upsert(4, "Summer Blowout")
+        self.index.upsert(8, "Sumer Madness")
+        self.index.upsert(9, "Summer Sale")
+        self.index.remove(1)
+        self.index.remove(10)
+        self.assertEqual(self.index.search("summer", 10), [4, 2, 9, 3, 8])
+        self.assertEqual(self.index.search("winter", 10), [])
+        self.index.upsert(8, "Autumn")
+        self.assertEqual(self.index.search("madness", 10), [])
+        self.assertEqual(self.index.search("autumn", 10), [8])
+        self.assertEqual(self.loads, 1)
+
+    def test_reload(self):
+        """It should reload when it is too old, keeping writes made during the reload"""
+        self.index.search("sale", 1)
+        self.index.max_age = 0
+        self.rows = self.rows + [(8, "Sale Days")]
+        self.assertEqual(self.index.search("sale d", 10), [8, 1, 2, 4])
+        self.index.max_age = 300
+
+        def loader():
+            # written while the rows are being read, so missing from them
+            self.index.upsert(9, "Sale Weekend")
+            return self.rows
+
+        self.index.loader = loader
+        self.index.rebuild()
+        self.assertEqual(self.index.search("sale w", 1), [9])
+        self.index.invalidate()
+        self.assertEqual(self.index.search("sale w", 1), [9])
+        self.assertEqual(self.loads, 2)
+
+    def test_reload_in_background(self):
+        """It should reload on a thread once it has a Flask app, serving the old index meanwhile"""
+        self.index.init_app(Flask(__name__))
+        self.assertEqual(self.index.max_age, 300.0)
+        self.index.search("sale", 1)
+        self.index.max_age = 0
+        time.sleep(0.01)
+        self.rows = [(8, "Sale Days")]
+        self.index.search("sale", 1)
+        self.index.wait()
+        self.index.wait()
+        self.index.max_age = 300
+        self.assertEqual(self.index.search("sale", 10), [8])
+        self.assertEqual(self.loads, 2)
@@ -0,0 +1,120 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for Cart Pricing
+"""
+from unittest import TestCase
+import numpy as np
+from service.models import DataValidationError
+from service.pricing import AMOUNT_OFF, BOGO, PERCENT_OFF, best_discounts, to_arrays
+
+
+def candidates(*promos):
+    """Builds candidate arrays from (product_id, type, amount, id) tuples"""
+    promos = sorted(promos)
+    return (
+        np.array([p[0] for p in promos], dtype=np.int64),
+        np.array([p[1] for p in promos], dtype=np.int64),
+        np.array([p[2] for p in promos], dtype=np.float64),
+        np.array([p[3] for p in promos], dtype=np.int64),
+    )
+
+
+class TestPricing(TestCase):
+    """Cart Pricing Tests"""
+
+    def price(self, lines, *promos):
+        """Returns (discounts, promotion_ids) as lists for (product, qty, price) lines"""
+        product_ids = np.array([line[0] for line in lines], dtype=np.int64)
+        quantities = np.array([line[1] for line in lines], dtype=np.float64)
+        unit_prices = np.array([line[2] for line in lines], dtype=np.float64)
+        discounts, ids = best_discounts(product_ids, quantities, unit_prices, candidates(*promos))
+        return np.round(discounts, 2).tolist(), ids.tolist()
+
+    def test_percent_off(self):
+        """It should take a percentage off the line subtotal"""
+        self.assertEqual(self.price([(1, 3, 10.0)], (1, PERCENT_OFF, 25.0, 7)), ([7.5], [7]))
+        # never more than the whole line
+        self.assertEqual(self.price([(1, 3, 10.0)], (1, PERCENT_OFF, 150.0, 7)), ([30.0], [7]))
+
+    def test_amount_off(self):
+        """It should take a fixed amount off every unit, up to the unit price"""
+        self.assertEqual(self.price([(1, 4, 10.0)], (1, AMOUNT_OFF, 2.5, 8)), ([10.0], [8]))
+        self.assertEqual(self.price([(1, 2, 3.0)], (1, AMOUNT_OFF, 5.0, 8)), ([6.0], [8]))
+
+    def test_bogo(self):
+        """It should make every second unit free"""
+        self.assertEqual(
+            self.price([(1, 1, 4.0), (1, 2, 4.0), (1, 5, 4.0)], (1, BOGO, 1.0, 9)),
+            ([0.0, 4.0, 8.0], [-1, 9, 9]),
+        )
+
+    def test_best_promotion_wins(self):
+        """It should apply the single best promotion to each line"""
+        promos = ((1, PERCENT_OFF, 10.0, 1), (1, BOGO, 1.0, 2), (2, AMOUNT_OFF, 1.0, 3))
+        lines = [(1, 1, 10.0), (1, 4, 10.0), (2, 1, 10.0), (3, 1, 10.0)]
+        self.assertEqual(self.price(lines, *promos), ([1.0, 20.0, 1.0, 0.0], [1, 2, 3, -1]))
+
+    def test_no_lines_or_promotions(self):
+        """It should handle empty carts and products without promotions"""
+        self.assertEqual(self.price([]), ([], []))
+        self.assertEqual(self.price([(1, 1, 1.0)]), ([0.0], [-1]))
+
+    def test_to_arrays(self):
+        """It should flatten carts into line arrays"""
+        carts = [
+            [{"product_id": 1, "quantity": 2, "unit_price": 1.5}],
+            [],
+            [{"product_id": "3", "quantity": 1, "unit_price": 2}],
+        ]
+        cart_index, product_ids, quantities, unit_prices = to_arrays(carts)
+        self.assertEqual(cart_index.tolist(), [0, 2])
+        self.assertEqual(product_ids.tolist(), [1, 3])
+        self.assertEqual(quantities.tolist(), [2.0, 1.0])
+        self.assertEqual(unit_prices.tolist(), [1.5, 2.0])
+
+    def test_to_arrays_bad_lines(self):
+        """It should reject malformed cart lines"""
+        for line in (
+            {"quantity": 1, "unit_price": 1.0},
+            {"product_id": 1, "quantity": "x", "unit_price": 1.0},
+            {"product_id": 1, "quantity": -1, "unit_price": 1.0},
+            "not a line",
+        ):
+            with self.assertRaises(DataValidationError):
+                to_arrays([[line]])
+
+    def test_to_arrays_out_of_range(self):
+        """It should reject cart lines whose values have no exact array form"""
+        good = {"product_id": 1, "quantity": 2, "unit_price": 1.5}
+        for key, value in (
+            ("unit_price", "nan"),
+            ("unit_price", float("inf")),
+            ("unit_price", "-inf"),
+            ("unit_price", -0.5),
+            ("product_id", 2**70),
+            ("product_id", 2**31),
+            ("product_id", 1.5),
+            ("product_id", float("inf")),
+            ("quantity", 2.7),
+            ("quantity", 0),
+            ("quantity", 2**31),
+        ):
+            with self.assertRaises(DataValidationError, msg=f"{key}={value!r}"):
+                to_arrays([[{**good, key: value}]])
+        _, product_ids, quantities, _ = to_arrays([[{**good, "product_id": 2**31 - 1, "quantity": 3.0}]])
+        self.assertEqual((product_ids.tolist(), quantities.tolist()), ([2**31 - 1], [3.0]))
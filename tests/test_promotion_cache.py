@@ -0,0 +1,100 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Promotion Cache
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+from wsgi import app as service_app
+from service import config
+from service.common.promotion_cache import PromotionCache
+from service.models import promotion_cache, stats_cache
+
+
+class TestPromotionCache(TestCase):
+    """Promotion Cache Tests"""
+
+    def setUp(self):
+        self.cache = PromotionCache(max_size=2, ttl=10)
+
+    def test_miss_then_hit(self):
+        """It should count a miss and then a hit"""
+        self.assertIsNone(self.cache.get(1))
+        self.cache.put(1, {"id": 1}, b'{"id": 1}')
+        entry = self.cache.get(1)
+        self.assertEqual(entry.values, {"id": 1})
+        self.assertEqual(entry.body, b'{"id": 1}')
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (1, 1, 0))
+
+    def test_lru_eviction(self):
+        """It should evict the least recently used entry"""
+        self.cache.put(1, {}, b"1")
+        self.cache.put(2, {}, b"2")
+        self.cache.get(1)
+        self.cache.put(3, {}, b"3")
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(self.cache.get(2))
+        self.assertIsNotNone(self.cache.get(1))
+        self.assertIsNotNone(self.cache.get(3))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        """It should expire entries after the TTL"""
+        with patch("service.common.promotion_cache.time.monotonic", return_value=100.0):
+            self.cache.put(1, {}, b"1")
+        with patch("service.common.promotion_cache.time.monotonic", return_value=109.0):
+            self.assertIsNotNone(self.cache.get(1))
+        with patch("service.common.promotion_cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(self.cache.get(1))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_invalidate_and_clear(self):
+        """It should drop invalidated entries and reset on clear"""
+        self.cache.put(1, {}, b"1")
+        self.cache.put(2, {}, b"2")
+        self.cache.invalidate(1, 5)
+        self.assertIsNone(self.cache.get(1))
+        self.assertIsNotNone(self.cache.get(2))
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats()["hits"], 0)
+
+    def test_invalidate_all(self):
+        """It should drop every entry but keep the counters"""
+        self.cache.put(1, {}, b"1")
+        self.cache.get(1)
+        self.cache.invalidate_all()
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_service_caches_read_config(self):
+        """It should size the service's caches from config.py"""
+        self.assertEqual(service_app.config["STATS_CACHE_SIZE"], config.STATS_CACHE_SIZE)
+        self.assertEqual((stats_cache.max_size, stats_cache.ttl), (config.STATS_CACHE_SIZE, config.STATS_CACHE_TTL))
+        self.assertEqual(
+            (promotion_cache.max_size, promotion_cache.ttl), (config.PROMOTION_CACHE_SIZE, config.PROMOTION_CACHE_TTL)
+        )
+
+    def test_init_app_prefix(self):
+        """It should read the settings named by its prefix"""
+        app = Flask(__name__)
+        app.config.update(STATS_CACHE_ENABLED=False, STATS_CACHE_SIZE=7, STATS_CACHE_TTL=3.0, PROMOTION_CACHE_SIZE=9)
+        cache = PromotionCache(prefix="STATS_CACHE")
+        cache.init_app(app)
+        self.assertEqual((cache.enabled, cache.max_size, cache.ttl), (False, 7, 3.0))
@@ -18,13 +18,21 @@
 TestPromotion API Service Test Suite
 """
 
-# pylint: disable=duplicate-code
+# pylint: disable=duplicate-code, too-many-lines
 import os
+import json
 import logging
+import tempfile
+from datetime import date
 from unittest import TestCase
+from unittest.mock import patch
+from prometheus_client import REGISTRY
 from wsgi import app
-from service.common import status
-from service.models import db, Promotion
+from service.common import cursors, status
+from service.common.metrics import QueryBudgetExceeded, query_budget
+from service.models import (
+    db, Promotion, PromotionTombstone, StatusSweep, active_index, name_index, promotion_cache, stats_cache,
+)
 from service.common.log_handlers import init_logging
 
 DATABASE_URI = os.getenv(
@@ -48,6 +56,7 @@ class TestYourResourceService(TestCase):
         app.config["SQLALCHEMY_DATABASE_URI"] = DATABASE_URI
         app.logger.setLevel(logging.CRITICAL)
         app.app_context().push()
+        db.create_all()
 
     @classmethod
     def tearDownClass(cls):
@@ -58,7 +67,13 @@ class TestYourResourceService(TestCase):
         """Runs before each test"""
         self.client = app.test_client()
         db.session.query(Promotion).delete()  # clean up the last tests
+        db.session.query(PromotionTombstone).delete()
+        db.session.query(StatusSweep).delete()
         db.session.commit()
+        active_index.invalidate()
+        name_index.invalidate()
+        stats_cache.clear()
+        promotion_cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -260,6 +275,53 @@ class TestYourResourceService(TestCase):
         resp = self.client.delete(f"/api/promotions/{pid}")
         self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_write_conflict(self):
+        """It should return 409 when another request changes the promotion during a write"""
+        pid = self._create_sample_promo()
+        find = Promotion.find
+
+        def find_then_race(*args, **kwargs):
+            promotion = find(*args, **kwargs)
+            with db.engine.begin() as conn:
+                conn.execute(db.update(Promotion).values(version=Promotion.version + 1))
+            return promotion
+
+        with patch.object(Promotion, "find", side_effect=find_then_race):
+            for method, url in (
+                (self.client.delete, f"/api/promotions/{pid}/deactivate"),
+                (self.client.delete, f"/api/promotions/{pid}"),
+            ):
+                resp = method(url)
+                self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+                self.assertEqual(resp.get_json()["error"], "Conflict")
+            body = {**self.client.get(f"/api/promotions/{pid}").get_json(), "name": "Lost"}
+            resp = self.client.put(f"/api/promotions/{pid}", json=body)
+            self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertNotEqual(self.client.get(f"/api/promotions/{pid}").get_json()["name"], "Lost")
+
+    def test_model_errors_outside_testing(self):
+        """It should answer model errors with 400 and 409 when exceptions are not propagated"""
+        pid = self._create_sample_promo()
+        find = Promotion.find
+
+        def find_then_race(*args, **kwargs):
+            promotion = find(*args, **kwargs)
+            with db.engine.begin() as conn:
+                conn.execute(db.update(Promotion).values(version=Promotion.version + 1))
+            return promotion
+
+        app.config["TESTING"] = False
+        try:
+            resp = self.client.post("/api/promotions", json={"name": "No type"})
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(resp.get_json()["error"], "Bad Request")
+            with patch.object(Promotion, "find", side_effect=find_then_race):
+                resp = self.client.delete(f"/api/promotions/{pid}/deactivate")
+            self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(resp.get_json()["error"], "Conflict")
+        finally:
+            app.config["TESTING"] = True
+
     def test_update_nonexistent_promotion(self):
         """It should return 404 when updating a non-existent promotion."""
         update_data = {
@@ -590,3 +652,779 @@ class TestYourResourceService(TestCase):
         self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
         data = resp.get_json()
         self.assertTrue(data["status"])  # Should default to True
+
+    ######################################################################
+    #  P A G I N A T I O N
+    ######################################################################
+    def _create_promos(self, count, promo_type="PERCENT_OFF"):
+        """Creates count promotions and returns their ids"""
+        ids = []
+        for n in range(count):
+            payload = {
+                "name": f"Promo {n}",
+                "promo_type": promo_type,
+                "product_id": n,
+                "amount": 5.0,
+                "start_date": "2025-01-01",
+                "end_date": "2025-12-31",
+            }
+            ids.append(self.client.post("/api/promotions", json=payload).get_json()["id"])
+        return ids
+
+    def test_list_promotions_paginated(self):
+        """It should walk every page of promotions with the next cursor"""
+        ids = self._create_promos(5)
+        seen = []
+        url = "/api/promotions?limit=2"
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            page = resp.get_json()
+            self.assertLessEqual(len(page), 2)
+            seen.extend(p["id"] for p in page)
+            link = resp.headers.get("Link")
+            url = link[1:link.index(">")] if link else None
+            if url:
+                self.assertIn('rel="next"', link)
+                self.assertIsNotNone(resp.headers.get("X-Next-Cursor"))
+        self.assertEqual(seen, ids)
+
+    def test_list_promotions_paginated_by_type(self):
+        """It should keep the type filter across pages"""
+        bogo_ids = self._create_promos(3, "BOGO")
+        self._create_promos(2)
+        resp = self.client.get("/api/promotions?type=BOGO&limit=2")
+        self.assertEqual([p["id"] for p in resp.get_json()], bogo_ids[:2])
+        self.assertIn("type=BOGO", resp.headers["Link"])
+        cursor = resp.headers["X-Next-Cursor"]
+        resp = self.client.get(f"/api/promotions?type=BOGO&limit=2&cursor={cursor}")
+        self.assertEqual([p["id"] for p in resp.get_json()], bogo_ids[2:])
+        self.assertNotIn("Link", resp.headers)
+
+    def test_list_promotions_page_size_capped(self):
+        """It should cap the page size at PAGE_SIZE_MAX"""
+        self._create_promos(3)
+        original = app.config["PAGE_SIZE_MAX"]
+        app.config["PAGE_SIZE_MAX"] = 2
+        try:
+            resp = self.client.get("/api/promotions?limit=500")
+        finally:
+            app.config["PAGE_SIZE_MAX"] = original
+        self.assertEqual(len(resp.get_json()), 2)
+        self.assertIn("limit=2", resp.headers["Link"])
+
+    def test_list_promotions_bad_limit(self):
+        """It should return 400 for a limit that is not a positive integer"""
+        resp = self.client.get("/api/promotions?limit=abc")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get("/api/promotions?limit=0")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_promotions_bad_cursor(self):
+        """It should return 400 for a cursor it did not issue"""
+        resp = self.client.get("/api/promotions?cursor=not-a-cursor")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        # well-formed, but with ids the id column cannot hold
+        for sort, position in (("id", [2**40]), ("amount", [1.0, 2**40]), ("-product_id", [-(2**31) - 1, 1])):
+            cursor = cursors.encode_cursor(position, sort)
+            resp = self.client.get(f"/api/promotions?sort={sort}&cursor={cursor}")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, sort)
+            self.assertIn("cursor is invalid", resp.get_json()["message"])
+
+    def test_list_promotions_filtered(self):
+        """It should apply every filter in the query string"""
+        ids = self._create_promos(4)
+        self.client.delete(f"/api/promotions/{ids[3]}/deactivate")
+        promo = self.client.get(f"/api/promotions/{ids[2]}").get_json()
+        promo.update(amount=30.0, start_date="2025-06-01", end_date="2025-06-30")
+        self.client.put(f"/api/promotions/{ids[2]}", json=promo)
+        for query, expected in (
+            ("product_id=1&product_id=2", ids[1:3]),
+            ("product_id=0,3", [ids[0], ids[3]]),
+            ("status=false", [ids[3]]),
+            ("status=TRUE&product_id=2,3", [ids[2]]),
+            ("active_on=2025-06-15", ids),
+            ("active_on=2025-02-01", [ids[0], ids[1], ids[3]]),
+            ("starts_after=2025-02-01", [ids[2]]),
+            ("ends_before=2025-07-01", [ids[2]]),
+            ("amount_min=10", [ids[2]]),
+            ("amount_max=10", [ids[0], ids[1], ids[3]]),
+            ("name=Promo 1", [ids[1]]),
+            ("type=BOGO", []),
+        ):
+            resp = self.client.get(f"/api/promotions?{query}")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK, query)
+            self.assertEqual([p["id"] for p in resp.get_json()], expected, query)
+
+    def test_list_promotions_sorted(self):
+        """It should page through promotions in the requested sort order"""
+        ids = self._create_promos(5)
+        for promotion_id, amount in zip(ids, (3.0, 1.0, 3.0, 2.0, 1.0)):
+            promo = self.client.get(f"/api/promotions/{promotion_id}").get_json()
+            self.client.put(f"/api/promotions/{promotion_id}", json={**promo, "amount": amount})
+        for sort, expected in (
+            ("amount", [ids[1], ids[4], ids[3], ids[0], ids[2]]),
+            ("-amount", [ids[2], ids[0], ids[3], ids[4], ids[1]]),
+            ("-name", ids[::-1]),
+            ("-start_date", ids[::-1]),
+        ):
+            seen = []
+            url = f"/api/promotions?sort={sort}&limit=2"
+            while url:
+                resp = self.client.get(url)
+                self.assertEqual(resp.status_code, status.HTTP_200_OK)
+                seen.extend(p["id"] for p in resp.get_json())
+                link = resp.headers.get("Link")
+                url = link[1:link.index(">")] if link else None
+            self.assertEqual(seen, expected, sort)
+        # a cursor only continues the sort order it was issued for
+        cursor = self.client.get("/api/promotions?sort=amount&limit=2").headers["X-Next-Cursor"]
+        resp = self.client.get(f"/api/promotions?sort=name&cursor={cursor}")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("different sort", resp.get_json()["message"])
+        resp = self.client.get("/api/promotions?sort=-amount&amount_max=2", headers={"Accept": "application/x-ndjson"})
+        rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual([row["id"] for row in rows], [ids[3], ids[4], ids[1]])
+
+    def test_list_promotions_bad_filters(self):
+        """It should return 400 for a malformed filter or an unknown sort key"""
+        for query, message in (
+            ("product_id=1,x", "product_id must be a list of integers"),
+            ("product_id=99999999999999999999", "product_id must be a list of integers"),
+            ("product_id=1&product_id=-2147483649", "product_id must be a list of integers"),
+            ("status=yes", "status must be true or false."),
+            ("active_on=tomorrow", "active_on must be a date (YYYY-MM-DD)."),
+            ("ends_before=2025-13-01", "ends_before must be a date (YYYY-MM-DD)."),
+            ("amount_min=lots", "amount_min must be a number."),
+            ("amount_max=nan", "amount_max must be a number."),
+            ("sort=version", "sort must be one of"),
+            ("sort=--id", "sort must be one of"),
+        ):
+            resp = self.client.get(f"/api/promotions?{query}")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, query)
+            self.assertIn(message, resp.get_json()["message"])
+
+    def test_promotion_stats(self):
+        """It should count promotions by type and status, or any other grouping"""
+        ids = self._create_promos(3)
+        self._create_promos(2, "BOGO")
+        self.client.delete(f"/api/promotions/{ids[0]}/deactivate")
+        resp = self.client.get("/api/promotions/stats")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual((data["by"], data["bucket"], data["total"]), (["promo_type", "status"], "month", 5))
+        self.assertEqual(
+            [(group["promo_type"], group["status"], group["count"]) for group in data["groups"]],
+            [("BOGO", True, 2), ("PERCENT_OFF", False, 1), ("PERCENT_OFF", True, 2)],
+        )
+        resp = self.client.get("/api/promotions/stats?by=product_id&type=PERCENT_OFF&status=true")
+        self.assertEqual([(group["product_id"], group["count"]) for group in resp.get_json()["groups"]], [(1, 1), (2, 1)])
+        resp = self.client.get("/api/promotions/stats?by=start_date,end_date&bucket=year")
+        self.assertEqual(resp.get_json()["groups"][0]["start_date"], "2025")
+        self.assertEqual(resp.get_json()["groups"][0]["count"], 5)
+
+    def test_promotion_stats_bad_request(self):
+        """It should return 400 for an unknown grouping, bucket or filter"""
+        for query, message in (
+            ("by=name", "by must be a comma separated list of"),
+            ("by=status,status", "by must be a comma separated list of"),
+            ("bucket=week", "bucket must be one of day, month, year."),
+            ("status=maybe", "status must be true or false."),
+        ):
+            resp = self.client.get(f"/api/promotions/stats?{query}")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn(message, resp.get_json()["message"])
+
+    def test_search_promotions(self):
+        """It should search promotions by name, best matches first"""
+        ids = self._create_promos(12)
+        resp = self.client.get("/api/promotions/search?q=promo 1")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["id"] for p in resp.get_json()], [ids[1], ids[10], ids[11]] + ids[:1] + ids[2:8])
+        self.assertEqual(resp.get_json()[0]["name"], "Promo 1")
+        resp = self.client.get("/api/promotions/search?q=PROMO&limit=2")
+        self.assertEqual([p["name"] for p in resp.get_json()], ["Promo 0", "Promo 1"])
+        resp = self.client.get("/api/promotions/search?q=nothing like it")
+        self.assertEqual(resp.get_json(), [])
+
+    def test_search_promotions_bad_request(self):
+        """It should require a query and a valid limit"""
+        for query, message in (
+            ("", "q is required."),
+            ("q=%20", "q is required."),
+            ("q=a&limit=0", "limit must be at least 1."),
+        ):
+            resp = self.client.get(f"/api/promotions/search?{query}")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(resp.get_json()["message"], message)
+
+    def test_stream_promotions_ndjson(self):
+        """It should stream every promotion as NDJSON when asked to"""
+        ids = self._create_promos(5)
+        self._create_promos(2, "BOGO")
+        original = app.config["STREAM_CHUNK_SIZE"]
+        app.config["STREAM_CHUNK_SIZE"] = 2
+        try:
+            resp = self.client.get("/api/promotions", headers={"Accept": "application/x-ndjson"})
+        finally:
+            app.config["STREAM_CHUNK_SIZE"] = original
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+        rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(rows), 7)
+        self.assertEqual([row["id"] for row in rows[:5]], ids)
+        self.assertEqual(rows[0]["name"], "Promo 0")
+
+    def test_stream_promotions_ndjson_by_type(self):
+        """It should apply the type filter to the NDJSON stream"""
+        self._create_promos(2)
+        bogo_ids = self._create_promos(3, "BOGO")
+        resp = self.client.get("/api/promotions?type=BOGO", headers={"Accept": "application/x-ndjson"})
+        rows = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual([row["id"] for row in rows], bogo_ids)
+
+    ######################################################################
+    #  B A T C H   C R E A T E
+    ######################################################################
+    def _batch_payload(self, count):
+        """Returns count valid promotion payloads"""
+        return [
+            {
+                "name": f"Batch {n}",
+                "promo_type": "AMOUNT_OFF",
+                "product_id": 500 + n,
+                "amount": 2.0,
+                "start_date": "2025-01-01",
+                "end_date": "2025-01-31",
+            }
+            for n in range(count)
+        ]
+
+    def test_batch_create(self):
+        """It should create every promotion in a batch"""
+        resp = self.client.post("/api/promotions:batch", json=self._batch_payload(3))
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        data = resp.get_json()
+        self.assertEqual(data["errors"], [])
+        self.assertEqual([p["name"] for p in data["created"]], ["Batch 0", "Batch 1", "Batch 2"])
+        self.assertTrue(all(p["status"] for p in data["created"]))
+        for promo in data["created"]:
+            self.assertEqual(Promotion.find(promo["id"]).name, promo["name"])
+
+    def test_batch_create_atomic_rejects_all(self):
+        """It should save nothing when any item is invalid in atomic mode"""
+        payload = self._batch_payload(3)
+        payload[1]["promo_type"] = "NOPE"
+        payload[2] = "not an object"
+        resp = self.client.post("/api/promotions:batch", json=payload)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        data = resp.get_json()
+        self.assertEqual([e["index"] for e in data["errors"]], [1, 2])
+        self.assertEqual(data["created"], [])
+        self.assertEqual(len(Promotion.all()), 0)
+
+    def test_batch_create_partial(self):
+        """It should save the valid items and report the rest in partial mode"""
+        payload = self._batch_payload(3)
+        del payload[0]["amount"]
+        resp = self.client.post("/api/promotions:batch?mode=partial", json=payload)
+        self.assertEqual(resp.status_code, status.HTTP_207_MULTI_STATUS)
+        data = resp.get_json()
+        self.assertEqual(len(data["errors"]), 1)
+        self.assertEqual(data["errors"][0]["index"], 0)
+        self.assertIn("missing amount", data["errors"][0]["message"])
+        self.assertEqual([p["name"] for p in data["created"]], ["Batch 1", "Batch 2"])
+        self.assertEqual(len(Promotion.all()), 2)
+
+    def test_batch_create_database_error(self):
+        """It should report only the items the database rejects in partial mode"""
+        payload = self._batch_payload(4)
+        payload[1]["name"] = None  # passes validation, fails the NOT NULL constraint
+        payload[3]["promo_type"] = "NOPE"
+        resp = self.client.post("/api/promotions:batch", json=payload)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.post("/api/promotions:batch", json=payload[:3])
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(Promotion.all()), 0)
+
+        resp = self.client.post("/api/promotions:batch?mode=partial", json=payload)
+        self.assertEqual(resp.status_code, status.HTTP_207_MULTI_STATUS)
+        data = resp.get_json()
+        self.assertEqual([error["index"] for error in data["errors"]], [1, 3])
+        self.assertIn("name", data["errors"][0]["message"])
+        self.assertEqual([p["name"] for p in data["created"]], ["Batch 0", "Batch 2"])
+        self.assertEqual(sorted(p.name for p in Promotion.all()), ["Batch 0", "Batch 2"])
+        self.assertEqual(Promotion.find(data["created"][1]["id"]).name, "Batch 2")
+
+    def test_batch_create_bad_requests(self):
+        """It should reject bad modes, non-array bodies and oversized batches"""
+        resp = self.client.post("/api/promotions:batch?mode=maybe", json=[])
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.post("/api/promotions:batch", json={"name": "x"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.post("/api/promotions:batch", data="[]", headers={"Content-Type": "text/plain"})
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        original = app.config["BATCH_MAX_SIZE"]
+        app.config["BATCH_MAX_SIZE"] = 2
+        try:
+            resp = self.client.post("/api/promotions:batch", json=self._batch_payload(3))
+        finally:
+            app.config["BATCH_MAX_SIZE"] = original
+        self.assertEqual(resp.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    ######################################################################
+    #  B U L K   A C T I V A T E / D E A C T I V A T E
+    ######################################################################
+    def test_bulk_deactivate_by_type(self):
+        """It should deactivate every promotion of a type in one call"""
+        bogo_ids = self._create_promos(3, "BOGO")
+        other_ids = self._create_promos(2)
+        resp = self.client.post("/api/promotions:deactivate", json={"promo_type": "BOGO"})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["count"], 3)
+        self.assertEqual(data["ids"], bogo_ids)
+        self.assertFalse(data["status"])
+        self.assertFalse(any(Promotion.find(pid).status for pid in bogo_ids))
+        self.assertTrue(all(Promotion.find(pid).status for pid in other_ids))
+
+    def test_bulk_activate_by_ids_and_products(self):
+        """It should only activate promotions matching every filter"""
+        ids = self._create_promos(4)
+        self.client.post("/api/promotions:deactivate", json={"ids": ids})
+        resp = self.client.post(
+            "/api/promotions:activate",
+            json={"ids": ids[:3], "product_ids": [1, 2, 3], "active_on": "2025-06-01"},
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual(data["ids"], ids[1:3])
+        self.assertTrue(data["status"])
+        # already active rows are not touched again
+        resp = self.client.post("/api/promotions:activate", json={"ids": ids[:3]})
+        self.assertEqual(resp.get_json()["ids"], ids[:1])
+
+    def test_bulk_status_by_date_window(self):
+        """It should filter bulk updates by start and end dates"""
+        ids = self._create_promos(2)
+        resp = self.client.post(
+            "/api/promotions:deactivate",
+            json={"starts_after": "2025-01-01", "ends_before": "2025-12-31"},
+        )
+        self.assertEqual(resp.get_json()["ids"], ids)
+        resp = self.client.post("/api/promotions:activate", json={"starts_after": "2025-02-01"})
+        self.assertEqual(resp.get_json()["count"], 0)
+
+    def test_bulk_status_bad_filters(self):
+        """It should reject missing or malformed bulk filters"""
+        for body in (
+            {},
+            [],
+            {"ids": "1"},
+            {"product_ids": ["x"]},
+            {"ids": [1099511627776]},
+            {"product_ids": [1, -(2**31) - 1]},
+            {"ids": [float("inf")]},
+            {"promo_type": "NOPE"},
+            {"active_on": "June"},
+        ):
+            resp = self.client.post("/api/promotions:activate", json=body)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, body)
+        resp = self.client.post("/api/promotions:deactivate", data="{}", headers={"Content-Type": "text/plain"})
+        self.assertEqual(resp.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    ######################################################################
+    #  A C T I V E   P R O M O T I O N S
+    ######################################################################
+    def test_active_promotions_for_product(self):
+        """It should list the active promotions for a product on a date"""
+        ids = self._create_promos(3)  # products 0, 1, 2 running all of 2025
+        resp = self.client.get("/api/promotions/active?product_id=1&on=2025-06-01")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([p["id"] for p in data], [ids[1]])
+        self.assertEqual(data[0], self.client.get(f"/api/promotions/{ids[1]}").get_json())
+        resp = self.client.get("/api/promotions/active?product_id=1&on=2026-01-01")
+        self.assertEqual(resp.get_json(), [])
+        resp = self.client.get("/api/promotions/active?product_id=1")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_active_promotions_follow_writes(self):
+        """It should keep the active index in step with every kind of write"""
+        ids = self._create_promos(2)
+        url = "/api/promotions/active?product_id=1&on=2025-06-01"
+        self.assertEqual([p["id"] for p in self.client.get(url).get_json()], [ids[1]])
+
+        # create, including batches
+        new_id = self._create_promos(2)[1]
+        batch = self._batch_payload(1)
+        batch[0]["product_id"] = 1
+        batch[0]["end_date"] = "2025-12-31"
+        batch_id = self.client.post("/api/promotions:batch", json=batch).get_json()["created"][0]["id"]
+        self.assertEqual([p["id"] for p in self.client.get(url).get_json()], [ids[1], new_id, batch_id])
+
+        # single and bulk status changes
+        self.client.delete(f"/api/promotions/{ids[1]}/deactivate")
+        self.client.post("/api/promotions:deactivate", json={"ids": [batch_id]})
+        self.assertEqual([p["id"] for p in self.client.get(url).get_json()], [new_id])
+        self.client.post("/api/promotions:activate", json={"ids": [ids[1]]})
+        self.assertEqual([p["id"] for p in self.client.get(url).get_json()], [ids[1], new_id])
+
+        # update and delete
+        update = self.client.get(f"/api/promotions/{new_id}").get_json()
+        update["product_id"] = 7
+        self.client.put(f"/api/promotions/{new_id}", json=update)
+        self.client.delete(f"/api/promotions/{ids[1]}")
+        self.assertEqual(self.client.get(url).get_json(), [])
+        moved = self.client.get("/api/promotions/active?product_id=7&on=2025-06-01").get_json()
+        self.assertEqual([p["id"] for p in moved], [new_id])
+
+    def test_active_promotions_without_index(self):
+        """It should answer from the database when the index is disabled"""
+        ids = self._create_promos(2)
+        active_index.enabled = False
+        try:
+            resp = self.client.get("/api/promotions/active?product_id=1&on=2025-06-01")
+        finally:
+            active_index.enabled = True
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["id"] for p in resp.get_json()], [ids[1]])
+
+    def test_active_promotions_bad_arguments(self):
+        """It should return 400 for a missing product_id or bad date"""
+        resp = self.client.get("/api/promotions/active")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        resp = self.client.get("/api/promotions/active?product_id=1&on=soon")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    ######################################################################
+    #  C A R T   P R I C I N G
+    ######################################################################
+    def test_price_cart(self):
+        """It should price a cart with line and total discounts"""
+        percent_ids = self._create_promos(2)  # 5% off products 0 and 1
+        bogo_ids = self._create_promos(3, "BOGO")  # BOGO on products 0, 1 and 2
+        cart = {
+            "on": "2025-06-01",
+            "lines": [
+                {"product_id": 1, "quantity": 1, "unit_price": 10.0},
+                {"product_id": 2, "quantity": 3, "unit_price": 4.0},
+                {"product_id": 9, "quantity": 1, "unit_price": 3.5},
+            ],
+        }
+        resp = self.client.post("/api/promotions:price", json=cart)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()
+        self.assertEqual([line["discount"] for line in data["lines"]], [0.5, 4.0, 0.0])
+        self.assertEqual([line["promotion_id"] for line in data["lines"]], [percent_ids[1], bogo_ids[2], None])
+        self.assertEqual(data["lines"][1]["total"], 8.0)
+        self.assertEqual((data["subtotal"], data["discount"], data["total"]), (25.5, 4.5, 21.0))
+
+        # with two units of product 1 the BOGO saves more than 5% off
+        cart["lines"][0]["quantity"] = 2
+        data = self.client.post("/api/promotions:price", json=cart).get_json()
+        self.assertEqual(data["lines"][0]["promotion_id"], bogo_ids[1])
+        self.assertEqual(data["lines"][0]["discount"], 10.0)
+
+        # nothing is running outside the promotions' dates
+        cart["on"] = "2026-06-01"
+        data = self.client.post("/api/promotions:price", json=cart).get_json()
+        self.assertEqual(data["discount"], 0.0)
+
+    def test_price_cart_without_index(self):
+        """It should price from the database when the active index is disabled"""
+        percent_id = self._create_promos(2)[1]
+        cart = {"on": "2025-06-01", "lines": [{"product_id": 1, "quantity": 2, "unit_price": 10.0}]}
+        active_index.enabled = False
+        try:
+            data = self.client.post("/api/promotions:price", json=cart).get_json()
+        finally:
+            active_index.enabled = True
+        self.assertEqual(data["lines"][0]["promotion_id"], percent_id)
+        self.assertEqual(data["discount"], 1.0)
+
+    def test_price_batched_carts(self):
+        """It should price several carts in one request"""
+        self._create_promos(2)
+        carts = {
+            "on": "2025-06-01",
+            "carts": [
+                {"lines": [{"product_id": 1, "quantity": 1, "unit_price": 20.0}]},
+                {"lines": []},
+            ],
+        }
+        resp = self.client.post("/api/promotions:price", json=carts)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        data = resp.get_json()["carts"]
+        self.assertEqual([cart["discount"] for cart in data], [1.0, 0.0])
+        self.assertEqual(data[1]["lines"], [])
+
+    def test_price_cart_bad_requests(self):
+        """It should reject malformed pricing requests"""
+        bad_price = {"product_id": 1, "quantity": 1, "unit_price": "nan"}
+        huge_product = {"product_id": 2**70, "quantity": 1, "unit_price": 1.0}
+        for body in (
+            [], {"lines": "x"}, {"carts": [[]]}, {"lines": [{"product_id": 1}]}, {"on": "x", "lines": []},
+            {"lines": [bad_price]}, {"lines": [huge_product]},
+        ):
+            resp = self.client.post("/api/promotions:price", json=body)
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST, body)
+        original = app.config["PRICING_MAX_LINES"]
+        app.config["PRICING_MAX_LINES"] = 1
+        try:
+            line = {"product_id": 1, "quantity": 1, "unit_price": 1.0}
+            resp = self.client.post("/api/promotions:price", json={"lines": [line, line]})
+        finally:
+            app.config["PRICING_MAX_LINES"] = original
+        self.assertEqual(resp.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    ######################################################################
+    #  P R O M O T I O N   C A C H E
+    ######################################################################
+    def test_get_promotion_cached(self):
+        """It should answer repeated reads from the cache and count them"""
+        promo_id = self._create_promos(1)[0]
+        for _ in range(3):
+            resp = self.client.get(f"/api/promotions/{promo_id}")
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(resp.get_json()["id"], promo_id)
+        resp = self.client.put(f"/api/promotions/{promo_id}/activate")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.client.delete(f"/api/promotions/{promo_id}/deactivate")
+        resp = self.client.get(f"/api/promotions/{promo_id}")
+        self.assertFalse(resp.get_json()["status"])
+        stats = self.client.get("/api/promotions/cache").get_json()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["evictions"], 0)
+        self.assertTrue(stats["enabled"])
+
+    ######################################################################
+    #  C O N D I T I O N A L   G E T
+    ######################################################################
+    def test_get_promotion_not_modified(self):
+        """It should answer If-None-Match with 304 until the promotion changes"""
+        promo_id = self._create_promos(1)[0]
+        resp = self.client.get(f"/api/promotions/{promo_id}")
+        etag = resp.headers["ETag"]
+        self.assertEqual(etag, f'"{promo_id}-1"')
+        for _ in range(2):
+            resp = self.client.get(f"/api/promotions/{promo_id}", headers={"If-None-Match": etag})
+            self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(resp.data, b"")
+            promotion_cache.clear()
+        self.client.delete(f"/api/promotions/{promo_id}/deactivate")
+        resp = self.client.get(f"/api/promotions/{promo_id}", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.headers["ETag"], f'"{promo_id}-2"')
+        self.client.delete(f"/api/promotions/{promo_id}")
+        resp = self.client.get(f"/api/promotions/{promo_id}", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_list_promotions_not_modified(self):
+        """It should answer If-None-Match on a page with 304 until the page changes"""
+        ids = self._create_promos(3)
+        resp = self.client.get("/api/promotions?limit=2")
+        etag = resp.headers["ETag"]
+        resp = self.client.get("/api/promotions?limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        # a different page has a different ETag
+        resp = self.client.get("/api/promotions?limit=1", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.client.delete(f"/api/promotions/{ids[1]}/deactivate")
+        resp = self.client.get("/api/promotions?limit=2", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp.headers["ETag"], etag)
+        resp = self.client.get(f"/api/promotions?id={ids[0]}")
+        self.assertIn("ETag", resp.headers)
+
+    ######################################################################
+    #  C H A N G E   F E E D
+    ######################################################################
+    def test_change_feed(self):
+        """It should return only what changed since the token, in change order"""
+        ids = self._create_promos(4)
+        seen = []
+        url = "/api/promotions/changes?limit=3"
+        while True:
+            feed = self.client.get(url).get_json()
+            seen.extend(change["id"] for change in feed["changes"])
+            url = f"/api/promotions/changes?limit=3&since={feed['next']}"
+            if not feed["more"]:
+                break
+        self.assertEqual(seen, ids)
+
+        self.client.delete(f"/api/promotions/{ids[1]}/deactivate")
+        self.client.delete(f"/api/promotions/{ids[2]}")
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        feed = resp.get_json()
+        self.assertFalse(feed["more"])
+        self.assertEqual(len(feed["changes"]), 2)
+        updated, deleted = feed["changes"]
+        self.assertEqual((updated["id"], updated["deleted"]), (ids[1], False))
+        self.assertEqual(updated["promotion"]["name"], "Promo 1")
+        self.assertFalse(updated["promotion"]["status"])
+        self.assertEqual(deleted, {"id": ids[2], "deleted": True})
+
+        # caught up: nothing new, and the same token to poll with
+        caught_up = self.client.get(f"/api/promotions/changes?since={feed['next']}").get_json()
+        self.assertEqual(caught_up, {"changes": [], "next": feed["next"], "more": False})
+        first = self.client.get("/api/promotions/changes?limit=1").get_json()
+        self.assertEqual((len(first["changes"]), first["more"]), (1, True))
+
+    def test_change_feed_bad_token(self):
+        """It should return 400 for a since token it did not issue"""
+        self._create_promos(2)
+        cursor = self.client.get("/api/promotions?limit=1&sort=name").headers["X-Next-Cursor"]
+        out_of_range = [cursors.encode_cursor(after, "change_seq") for after in ([-1, 1], [2**63, 1], [1, 2**31])]
+        for since in ("not-a-token", cursor, "eyJzb3J0IjoiY2hhbmdlX3NlcSIsImFmdGVyIjpbIngiXX0", *out_of_range):
+            resp = self.client.get(f"/api/promotions/changes?since={since}")
+            self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn("since is invalid", resp.get_json()["message"])
+        resp = self.client.get("/api/promotions/changes?limit=0")
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_change_feed_pruned(self):
+        """It should return 410 for a since token from before the last tombstone pruned"""
+        ids = self._create_promos(3)
+        old = self.client.get("/api/promotions/changes?limit=1").get_json()["next"]
+        self.client.delete(f"/api/promotions/{ids[1]}")
+        feed = self.client.get(f"/api/promotions/changes?since={old}").get_json()
+        self.assertEqual(feed["changes"][-1], {"id": ids[1], "deleted": True})
+        tombstone = db.session.execute(db.select(PromotionTombstone.change_seq, PromotionTombstone.id)).one()
+        # the sweep pruned the tombstone
+        db.session.add(StatusSweep(id=1, activated_through=date.today(), pruned_seq=tombstone[0], pruned_id=tombstone[1]))
+        db.session.query(PromotionTombstone).delete()
+        db.session.commit()
+        resp = self.client.get(f"/api/promotions/changes?since={old}")
+        self.assertEqual(resp.status_code, status.HTTP_410_GONE)
+        self.assertIn("start again without it", resp.get_json()["message"])
+        # a client that read past the tombstone carries on, and one without a token starts again
+        resp = self.client.get(f"/api/promotions/changes?since={feed['next']}")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        start = self.client.get("/api/promotions/changes").get_json()
+        self.assertEqual([change["id"] for change in start["changes"]], [ids[0], ids[2]])
+
+    ######################################################################
+    #  M E T R I C S
+    ######################################################################
+    def test_metrics(self):
+        """It should export metrics in Prometheus text format"""
+        self.client.get("/api/promotions")
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        self.assertIn(b"promotions_db_pool_checkout_seconds_bucket", resp.data)
+        self.assertIn(b"promotions_db_pool_connections_in_use", resp.data)
+
+    def test_metrics_multiprocess(self):
+        """It should sum the metrics of every worker in multiprocess mode"""
+        with tempfile.TemporaryDirectory() as directory, patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+            resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_request_metrics(self):
+        """It should count requests, errors, queries and serialization per resource"""
+        def sample(name, **labels):
+            return REGISTRY.get_sample_value(name, labels) or 0.0
+
+        ok = {"resource": "PromotionCollection", "method": "GET", "status": "200"}
+        missing = {"resource": "PromotionResource", "method": "GET", "status": "404"}
+        requests = sample("promotions_http_requests_total", **ok)
+        errors = sample("promotions_http_request_errors_total", **missing)
+        queries = sample("promotions_db_queries_per_request_sum", resource="PromotionCollection")
+        encodes = sample("promotions_serialization_seconds_count", format="rows")
+
+        self.client.get("/api/promotions")
+        self.client.get("/api/promotions/0")
+        self.assertEqual(sample("promotions_http_requests_total", **ok), requests + 1)
+        self.assertEqual(sample("promotions_http_request_errors_total", **missing), errors + 1)
+        self.assertEqual(sample("promotions_db_queries_per_request_sum", resource="PromotionCollection"), queries + 1)
+        self.assertEqual(sample("promotions_serialization_seconds_count", format="rows"), encodes + 1)
+        self.assertGreater(
+            sample("promotions_http_request_duration_seconds_count", resource="PromotionCollection", method="GET"), 0
+        )
+
+        # a failed statement does not leave its start time behind
+        with self.assertRaises(Exception):
+            db.session.execute(db.text("SELECT * FROM no_such_table"))
+        db.session.rollback()
+        resp = self.client.get("/no-such-page")
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertGreater(sample("promotions_http_requests_total", resource="unmatched", method="GET", status="404"), 0)
+
+    ######################################################################
+    #  Q U E R Y   B U D G E T S
+    ######################################################################
+    def _request_within(self, budget, method, url, **kwargs):
+        """Makes a request, failing if it runs more than budget SQL statements"""
+        with query_budget(budget):
+            resp = getattr(self.client, method)(url, **kwargs)
+            resp.get_data()
+        self.assertLess(resp.status_code, 400, url)
+        return resp
+
+    def test_query_budgets(self):
+        """It should run a fixed number of SQL statements per request, however many promotions match"""
+        ids = self._create_promos(25)
+        payload = {
+            "name": "Budget", "promo_type": "BOGO", "product_id": 1, "amount": 1.0,
+            "start_date": "2025-01-01", "end_date": "2025-12-31",
+        }
+        # SQLite cannot return the ids of a multi-row INSERT in order, so it inserts row by row
+        batch_budget = 2 if db.engine.dialect.name == "postgresql" else 26
+        # every write also takes the next change sequence number, and a delete leaves a tombstone
+        budgets = [
+            (1, "get", "/api/promotions", {}),
+            (1, "get", "/api/promotions?limit=10&sort=-amount&status=true&product_id=1,2,3", {}),
+            (1, "get", "/api/promotions", {"headers": {"Accept": "application/x-ndjson"}}),
+            (1, "get", f"/api/promotions?id={ids[0]}", {}),
+            (1, "get", f"/api/promotions/{ids[1]}", {}),
+            (3, "post", "/api/promotions", {"json": payload}),
+            (batch_budget, "post", "/api/promotions:batch", {"json": [payload] * 25}),
+            (4, "put", f"/api/promotions/{ids[2]}", {"json": payload}),
+            (4, "delete", f"/api/promotions/{ids[3]}/deactivate", {}),
+            (4, "put", f"/api/promotions/{ids[3]}/activate", {}),
+            (4, "delete", f"/api/promotions/{ids[4]}", {}),
+            (2, "post", "/api/promotions:deactivate", {"json": {"product_ids": [5, 6, 7]}}),
+            (2, "post", "/api/promotions:activate", {"json": {"product_ids": [5, 6, 7]}}),
+            (1, "get", "/api/promotions/changes?limit=10", {}),
+            # the indexes behind these load once per worker
+            (1, "get", "/api/promotions/active?product_id=5&on=2025-06-01", {}),
+            (0, "post", "/api/promotions:price", {"json": {"on": "2025-06-01", "lines": [
+                {"product_id": n, "quantity": 2, "unit_price": 10.0} for n in range(25)
+            ]}}),
+            (2, "get", "/api/promotions/search?q=promo", {}),
+            (1, "get", "/api/promotions/stats?by=product_id", {}),
+            (0, "get", "/api/promotions/health", {}),
+        ]
+        for budget, method, url, kwargs in budgets:
+            self._request_within(budget, method, url, **kwargs)
+
+    def test_query_budget_exceeded(self):
+        """It should fail loudly, listing the statements, when a block runs over its budget"""
+        ids = self._create_promos(3)
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            with query_budget(2) as statements:
+                for promo_id in ids:
+                    db.session.get(Promotion, promo_id, populate_existing=True)
+        self.assertEqual(len(statements), 3)
+        self.assertIn("3 SQL statements ran, over the budget of 2", str(context.exception))
+        self.assertIn("FROM promotion", str(context.exception))
+        # an error inside the block is not hidden by the budget
+        with self.assertRaises(ValueError):
+            with query_budget(0):
+                db.session.get(Promotion, ids[0], populate_existing=True)
+                raise ValueError("boom")
+
+    def test_query_count_header_and_log(self):
+        """It should report each request's SQL statements in a debug header and the log"""
+        self._create_promos(1)
+        self.assertNotIn("X-Query-Count", self.client.get("/api/promotions").headers)
+        with patch.dict(app.config, QUERY_COUNT_HEADER=True, QUERY_COUNT_WARN=0):
+            with self.assertLogs(app.logger, logging.WARNING) as logs:
+                resp = self.client.get("/api/promotions")
+        self.assertEqual(resp.headers["X-Query-Count"], "1")
+        self.assertIn("GET /api/promotions ran 1 SQL statements", logs.output[0])
+        self.assertIn("look for a query run once per row", logs.output[0])
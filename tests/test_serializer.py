@@ -0,0 +1,77 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Promotion Serializer
+"""
+import json
+from datetime import date
+from unittest import TestCase
+from service.common.serializer import FIELDS, RowEncoder
+
+ROWS = [
+    (1, "Summer Sale", "PERCENT_OFF", 100, 15.0, date(2025, 6, 1), date(2025, 8, 31), True, 3),
+    (2, 'Quote " and \\ and café ☃', "BOGO", 200, 2, date(2025, 1, 1), date(2025, 1, 2), False, 1),
+]
+
+
+def expected(row):
+    """Returns what serialize() would produce for a row"""
+    values = dict(zip(FIELDS, row))
+    values["amount"] = float(values["amount"])
+    values["start_date"] = values["start_date"].isoformat()
+    values["end_date"] = values["end_date"].isoformat()
+    return values
+
+
+class TestRowEncoder(TestCase):
+    """Row Encoder Tests"""
+
+    def setUp(self):
+        self.encoders = [RowEncoder(use_orjson=False)]
+        if RowEncoder().use_orjson:
+            self.encoders.append(RowEncoder())
+
+    def test_encode_row(self):
+        """It should encode one row as the serialize() document"""
+        for encoder in self.encoders:
+            for row in ROWS:
+                self.assertEqual(json.loads(encoder.encode_row(row)), expected(row))
+
+    def test_encode_rows(self):
+        """It should encode rows as a JSON array"""
+        for encoder in self.encoders:
+            self.assertEqual(json.loads(encoder.encode_rows(ROWS)), [expected(row) for row in ROWS])
+            self.assertEqual(json.loads(encoder.encode_rows([])), [])
+
+    def test_encode_non_finite(self):
+        """It should reject amounts that have no JSON form, as json.dumps(allow_nan=False) does"""
+        for encoder in self.encoders:
+            for amount in (float("nan"), float("inf"), float("-inf")):
+                row = ROWS[0][:4] + (amount,) + ROWS[0][5:]
+                with self.assertRaises(ValueError):
+                    encoder.encode_row(row)
+                with self.assertRaises(ValueError):
+                    encoder.encode_rows([ROWS[1], row])
+                with self.assertRaises(ValueError):
+                    encoder.encode_lines([row])
+
+    def test_encode_lines(self):
+        """It should encode rows as one JSON document per line"""
+        for encoder in self.encoders:
+            lines = encoder.encode_lines(ROWS).decode("utf8").splitlines()
+            self.assertEqual([json.loads(line) for line in lines], [expected(row) for row in ROWS])
+            self.assertEqual(encoder.encode_lines([]), b"")
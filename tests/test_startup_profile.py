@@ -0,0 +1,87 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Test cases for the Startup Profile and app startup checks
+"""
+import time
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import exc
+from wsgi import app  # noqa: F401 pylint: disable=unused-import
+from service import config, create_app
+from service.common.startup_profile import StartupProfile
+from service.models import Promotion
+
+
+class TestStartupProfile(TestCase):
+    """Startup Profile Tests"""
+
+    def test_phases_are_timed(self):
+        """It should add up the time spent in each phase"""
+        profile = StartupProfile()
+        profile.add("imports", 0.25)
+        with profile.phase("api"):
+            time.sleep(0.01)
+        with profile.phase("imports"):
+            pass
+        self.assertEqual(list(profile.phases), ["imports", "api"])
+        self.assertGreater(profile.phases["imports"], 0.25)
+        self.assertGreaterEqual(profile.phases["api"], 0.01)
+        self.assertAlmostEqual(profile.total(), sum(profile.phases.values()))
+        report = profile.report()
+        self.assertTrue(report.startswith("Startup took "))
+        self.assertIn("imports 25", report)
+        self.assertIn(", api ", report)
+
+
+class TestCreateApp(TestCase):
+    """App Startup Tests"""
+
+    @patch.object(config, "STARTUP_PROFILE", True)
+    @patch("service.log_handlers.init_logging")
+    def test_startup_profile_is_logged(self, _init_logging):
+        """It should log the startup phases in profile mode"""
+        with patch.object(Promotion, "schema_ready", return_value=True) as schema_ready:
+            with self.assertLogs("service", "INFO") as logs:
+                new_app = create_app()
+        schema_ready.assert_called_once()
+        profile = new_app.extensions["startup_profile"]
+        self.assertEqual(set(profile.phases), {"imports", "api", "routes", "database"})
+        self.assertTrue(any("Startup took" in line for line in logs.output))
+
+    def test_missing_schema_is_logged(self):
+        """It should start but log an error when the schema is missing"""
+        with patch.object(Promotion, "schema_ready", return_value=False):
+            with self.assertLogs("service", "ERROR") as logs:
+                create_app()
+        self.assertIn("flask db-init", logs.output[0])
+
+    @patch.object(config, "DB_SCHEMA_CHECK", False)
+    def test_schema_check_disabled(self):
+        """It should not touch the database when the schema check is off"""
+        with patch.object(Promotion, "schema_ready") as schema_ready:
+            new_app = create_app()
+        schema_ready.assert_not_called()
+        self.assertNotIn("database", new_app.extensions["startup_profile"].phases)
+
+    def test_database_unreachable(self):
+        """It should exit with code 4 when the database cannot be reached"""
+        error = exc.OperationalError("SELECT 1", {}, Exception("connection refused"))
+        with patch.object(Promotion, "schema_ready", side_effect=error):
+            with self.assertRaises(SystemExit) as context:
+                create_app()
+        self.assertEqual(context.exception.code, 4)